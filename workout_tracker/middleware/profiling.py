@@ -0,0 +1,179 @@
+import cProfile
+import pstats
+import random
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+from django.urls import Resolver404, resolve
+
+# Query string parameter used to force the profiling of a single request
+QUERY_FLAG = '_profile'
+SIGNING_SALT = 'workout_tracker.middleware.profiling'
+
+# Only one profiler can be active at a time (cProfile relies on interpreter
+# wide hooks since Python 3.12), concurrent requests are simply not profiled.
+_profiler_lock = threading.Lock()
+
+def make_token():
+    """
+    Create a signed value for the profiling query flag, valid for
+    PROFILING_TOKEN_MAX_AGE seconds.
+    """
+    return signing.TimestampSigner(salt=SIGNING_SALT).sign('profile')
+
+def check_token(token):
+    try:
+        signing.TimestampSigner(salt=SIGNING_SALT).unsign(
+            token, max_age=getattr(settings, 'PROFILING_TOKEN_MAX_AGE', 3600)
+        )
+    except signing.BadSignature:
+        return False
+
+    return True
+
+def get_profiling_dir():
+    return Path(getattr(settings, 'PROFILING_DIR', settings.BASE_DIR / 'profiles'))
+
+class ProfilingMiddleware:
+    """
+    Profile a sampled fraction of the requests with cProfile, and write the
+    results in a per-view subdirectory of PROFILING_DIR.
+
+    A request can also be profiled on demand by adding a signed query flag
+    (?_profile=<token>, see the `profile_token` management command).
+
+    When sampling is disabled and signed flags are not allowed, the middleware
+    removes itself from the chain.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0)
+        self.allow_flag = getattr(settings, 'PROFILING_SIGNED_FLAG', False)
+        self.views = set(getattr(settings, 'PROFILING_VIEWS', []))
+        self.max_files = getattr(settings, 'PROFILING_MAX_FILES', 100)
+        self.directory = get_profiling_dir()
+
+        if self.sample_rate <= 0 and not self.allow_flag:
+            raise MiddlewareNotUsed()
+
+    def __call__(self, request):
+        if not self._should_profile(request):
+            return self.get_response(request)
+
+        # Resolve the view before profiling, so that the requests of filtered
+        # out views don't pay for cProfile
+        view_name = self._get_view_name(request)
+        if self.views and view_name not in self.views:
+            return self.get_response(request)
+
+        if not _profiler_lock.acquire(blocking=False):
+            return self.get_response(request)
+
+        try:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another tool (coverage, debugger...) already uses the hooks
+                return self.get_response(request)
+
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        finally:
+            _profiler_lock.release()
+
+        self._save(profiler, view_name)
+
+        return response
+
+    def _should_profile(self, request):
+        # Check the raw query string first to avoid parsing it for every
+        # request
+        if self.allow_flag and QUERY_FLAG in request.META.get('QUERY_STRING', ''):
+            token = request.GET.get(QUERY_FLAG)
+            if token is not None and check_token(token):
+                return True
+
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def _get_view_name(self, request):
+        try:
+            match = resolve(request.path_info, getattr(request, 'urlconf', None))
+        except Resolver404:
+            return 'unresolved'
+
+        return match.view_name
+
+    def _save(self, profiler, view_name):
+        # Colons are not allowed in file names on every platform
+        directory = self.directory / view_name.replace(':', '.')
+        directory.mkdir(parents=True, exist_ok=True)
+
+        basename = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        profiler.dump_stats(directory / f"{basename}.prof")
+
+        stats = pstats.Stats(profiler)
+        with open(directory / f"{basename}.collapsed", 'w') as f:
+            for stack, weight in sorted(collapse_stacks(stats.stats).items()):
+                f.write(f"{stack} {weight}\n")
+
+        self._rotate(directory)
+
+    def _rotate(self, directory):
+        profiles = sorted(directory.glob('*.prof'), key=lambda p: p.stat().st_mtime)
+
+        for profile in profiles[:max(len(profiles) - self.max_files, 0)]:
+            profile.unlink(missing_ok=True)
+            profile.with_suffix('.collapsed').unlink(missing_ok=True)
+
+def _label(func):
+    filename, line, name = func
+    return f"{name} ({Path(filename).name}:{line})".replace(';', ',').replace(' ', '_')
+
+def collapse_stacks(stats, max_depth=64):
+    """
+    Turn raw pstats data into collapsed stacks ("a;b;c weight", weight in
+    microseconds), as consumed by flamegraph tools.
+
+    cProfile only records caller/callee pairs, so the time of a function called
+    from several places is split between its callers proportionally to the time
+    spent under each of them.
+    """
+    children = defaultdict(list)
+    for func, (_cc, _nc, _tt, _ct, callers) in stats.items():
+        for caller, edge in callers.items():
+            children[caller].append((func, edge[3]))
+
+    stacks = Counter()
+
+    def walk(func, path, share):
+        _cc, _nc, tt, _ct, _callers = stats[func]
+        path.append(func)
+
+        weight = round(tt * share * 1_000_000)
+        if weight > 0:
+            stacks[';'.join(_label(f) for f in path)] += weight
+
+        if len(path) < max_depth:
+            for child, edge_ct in children[func]:
+                child_ct = stats[child][3]
+                # Skip recursive calls, and branches too small to show up
+                if child in path or not child_ct or share * edge_ct < 1e-6:
+                    continue
+                walk(child, path, share * edge_ct / child_ct)
+
+        path.pop()
+
+    for func, (_cc, _nc, _tt, _ct, callers) in stats.items():
+        if not callers:
+            walk(func, [], 1.0)
+
+    return stacks
@@ -0,0 +1,202 @@
+import contextlib
+import datetime
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DatabaseError, connection, transaction
+
+logger = logging.getLogger(__name__)
+
+# Literals and lists of parameters, replaced to group the queries differing
+# only by their values
+_NORMALIZATIONS = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'(?<![\w"])\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'%s'), '?'),
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(...)'),
+    (re.compile(r'\s+'), ' '),
+]
+
+_EXPLAINABLE = re.compile(r'\s*(SELECT|WITH)\b', re.IGNORECASE)
+
+# Fingerprints of the queries already explained by this process
+_explained = set()
+_explained_lock = threading.Lock()
+
+# One handler per log file, shared by the middleware instances
+_handlers = {}
+_handlers_lock = threading.Lock()
+
+def normalize(sql):
+    for pattern, replacement in _NORMALIZATIONS:
+        sql = pattern.sub(replacement, sql)
+
+    return sql.strip()
+
+def fingerprint(sql):
+    """
+    The normalized SQL of a query, and a short hash identifying it.
+    """
+    normalized = normalize(sql)
+
+    return normalized, hashlib.sha1(normalized.encode()).hexdigest()[:16]
+
+def get_log_path():
+    return Path(getattr(settings, 'SLOW_QUERY_LOG', settings.BASE_DIR / 'logs' / 'slow_queries.log'))
+
+def get_handler(path):
+    with _handlers_lock:
+        if path not in _handlers:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            handler = RotatingFileHandler(
+                path,
+                maxBytes=getattr(settings, 'SLOW_QUERY_LOG_MAX_BYTES', 1024 * 1024),
+                backupCount=getattr(settings, 'SLOW_QUERY_LOG_BACKUPS', 5),
+                encoding='utf-8',
+            )
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            _handlers[path] = handler
+
+        return _handlers[path]
+
+def read_log(path=None):
+    """
+    Aggregate the captures of the slow query log (and its rotated files) by
+    fingerprint, the slowest in total first.
+    """
+    path = get_log_path() if path is None else Path(path)
+
+    queries = {}
+    for file in sorted(path.parent.glob(f'{path.name}*'), reverse=True):
+        with open(file, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    capture = json.loads(line)
+                except ValueError:
+                    continue
+
+                query = queries.setdefault(capture['fingerprint'], {
+                    'fingerprint': capture['fingerprint'],
+                    'sql': capture['sql'],
+                    'plan': None,
+                    'views': set(),
+                    'count': 0,
+                    'total': 0,
+                    'max': 0,
+                })
+                query['count'] += 1
+                query['total'] += capture['duration']
+                query['max'] = max(query['max'], capture['duration'])
+                query['views'].add(capture['view'])
+                query['last_seen'] = capture['time']
+                if capture.get('plan'):
+                    query['plan'] = capture['plan']
+
+    for query in queries.values():
+        query['mean'] = query['total'] / query['count']
+        query['views'] = sorted(query['views'])
+
+    return sorted(queries.values(), key=lambda query: query['total'], reverse=True)
+
+class SlowQueryLogger:
+    """
+    Execute wrapper recording the queries of a request slower than a
+    threshold (in milliseconds). The first time a SELECT is caught by this
+    process, its plan is captured with EXPLAIN (EXPLAIN QUERY PLAN with
+    SQLite).
+    """
+    def __init__(self, request, threshold, handler):
+        self.request = request
+        self.threshold = threshold
+        self.handler = handler
+        self._explaining = False
+
+    def __call__(self, execute, sql, params, many, context):
+        if self._explaining:
+            return execute(sql, params, many, context)
+
+        start = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration = (time.perf_counter() - start) * 1000
+
+        if duration >= self.threshold:
+            try:
+                self.log(sql, params, many, context['connection'], duration)
+            except Exception:
+                # Never fail a request because of the instrumentation
+                logger.exception("Could not log a slow query")
+
+        return result
+
+    def log(self, sql, params, many, db, duration):
+        normalized, key = fingerprint(sql)
+
+        plan = None
+        if not many and _EXPLAINABLE.match(sql):
+            with _explained_lock:
+                first = key not in _explained
+                _explained.add(key)
+            if first:
+                plan = self.explain(db, sql, params)
+
+        self.handler.handle(logging.makeLogRecord({
+            'msg': json.dumps({
+                'time': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+                'view': self.get_view_name(),
+                'duration': round(duration, 3),
+                'fingerprint': key,
+                # Without the parameters, which may hold personal data
+                'sql': normalized,
+                'plan': plan,
+            }),
+        }))
+
+    def explain(self, db, sql, params):
+        self._explaining = True
+        try:
+            # A failing EXPLAIN must not break the transaction of the request
+            savepoint = transaction.atomic(using=db.alias) if db.in_atomic_block else contextlib.nullcontext()
+            with savepoint, db.cursor() as cursor:
+                cursor.execute(f"{db.ops.explain_query_prefix()} {sql}", params)
+                return '\n'.join(str(row[-1]) for row in cursor.fetchall())
+        except DatabaseError:
+            return None
+        finally:
+            self._explaining = False
+
+    def get_view_name(self):
+        match = getattr(self.request, 'resolver_match', None)
+        if match is None:
+            return 'unresolved'
+
+        return match.view_name
+
+class SlowQueryMiddleware:
+    """
+    Log the queries slower than SLOW_QUERY_THRESHOLD milliseconds, with the
+    view that ran them and the fingerprint of their normalized SQL, to a
+    rotating log file (SLOW_QUERY_LOG), shown in the admin area.
+
+    When the threshold is not set, the middleware removes itself from the
+    chain.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.threshold = getattr(settings, 'SLOW_QUERY_THRESHOLD', 0)
+
+        if not self.threshold:
+            raise MiddlewareNotUsed()
+
+        self.handler = get_handler(get_log_path())
+
+    def __call__(self, request):
+        with connection.execute_wrapper(SlowQueryLogger(request, self.threshold, self.handler)):
+            return self.get_response(request)
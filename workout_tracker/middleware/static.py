@@ -0,0 +1,115 @@
+import json
+import mimetypes
+import os
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import FileResponse, HttpResponseNotAllowed
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+# Preferred first
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+class StaticFilesMiddleware:
+    """
+    Serve the collected static files (see CompressedManifestStaticFilesStorage)
+    for deployments without a web server or a CDN in front of the app.
+
+    Fingerprinted files are served with immutable cache headers, the others
+    with validators for conditional requests (like django.views.static.serve),
+    and the precompressed variants are used when the client accepts them. The list of
+    files is built once, when the middleware is loaded, so it needs to be
+    restarted after running collectstatic.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+        if not getattr(settings, 'STATIC_SERVE', False):
+            raise MiddlewareNotUsed()
+
+        self.prefix = '/' + settings.STATIC_URL.lstrip('/')
+        self.max_age = getattr(settings, 'STATIC_MAX_AGE', 3600)
+        self.files = self._scan(Path(settings.STATIC_ROOT))
+
+    def __call__(self, request):
+        if not request.path_info.startswith(self.prefix):
+            return self.get_response(request)
+
+        static_file = self.files.get(request.path_info[len(self.prefix):])
+        if static_file is None:
+            return self.get_response(request)
+
+        if request.method not in ('GET', 'HEAD'):
+            return HttpResponseNotAllowed(['GET', 'HEAD'])
+
+        return self._serve(request, static_file)
+
+    def _scan(self, root):
+        immutable = set()
+        manifest = root / 'staticfiles.json'
+        if manifest.is_file():
+            with open(manifest) as f:
+                immutable = set(json.load(f).get('paths', {}).values())
+
+        files = {}
+        for directory, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = Path(directory) / filename
+                if path.suffix in ('.gz', '.br') or path == manifest:
+                    continue
+
+                name = path.relative_to(root).as_posix()
+                content_type, _ = mimetypes.guess_type(filename)
+                files[name] = {
+                    'path': path,
+                    'content_type': content_type or 'application/octet-stream',
+                    'immutable': name in immutable,
+                    'variants': [
+                        (encoding, path.with_name(filename + extension))
+                        for encoding, extension in ENCODINGS
+                        if (path.parent / (filename + extension)).is_file()
+                    ],
+                }
+
+        return files
+
+    def _serve(self, request, static_file):
+        path = static_file['path']
+        encoding = None
+
+        if static_file['variants']:
+            accepted = {
+                value.split(';')[0].strip()
+                for value in request.headers.get('Accept-Encoding', '').split(',')
+                if 'q=0' not in value.replace(' ', '').split(';')[1:]
+            }
+            for variant_encoding, variant_path in static_file['variants']:
+                if variant_encoding in accepted:
+                    path, encoding = variant_path, variant_encoding
+                    break
+
+        stat = path.stat()
+        etag = quote_etag(f"{stat.st_mtime_ns:x}-{stat.st_size:x}")
+        response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+        if response is None:
+            response = FileResponse(open(path, 'rb'), content_type=static_file['content_type'])
+            # Displayed by browsers, FileResponse would name the file
+            del response.headers['Content-Disposition']
+            if encoding is not None:
+                response.headers['Content-Encoding'] = encoding
+
+        response.headers['ETag'] = etag
+        response.headers['Last-Modified'] = http_date(stat.st_mtime)
+        if static_file['variants']:
+            response.headers['Vary'] = 'Accept-Encoding'
+
+        if static_file['immutable']:
+            response.headers['Cache-Control'] = IMMUTABLE
+        else:
+            response.headers['Cache-Control'] = f'public, max-age={self.max_age}'
+
+        return response
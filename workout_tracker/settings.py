@@ -10,22 +10,39 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import importlib.util
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Deployment profile, selected through the environment: 'development' (the
+# default) or 'production'. The latter drops the development-only apps and
+# middleware, see the end of the "Application definition" section.
+ENVIRONMENT = os.environ.get('WORKOUT_TRACKER_ENV', 'development')
+PRODUCTION = ENVIRONMENT == 'production'
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
 
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'TODO' # TODO
+SECRET_KEY = os.environ.get('WORKOUT_TRACKER_SECRET_KEY')
+if SECRET_KEY is None:
+    # Never fall back to a publicly known key in production
+    if PRODUCTION:
+        raise ImproperlyConfigured("WORKOUT_TRACKER_SECRET_KEY must be set in production")
+    SECRET_KEY = 'TODO' # TODO
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = not PRODUCTION
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = [
+    host for host in os.environ.get('WORKOUT_TRACKER_ALLOWED_HOSTS', '').split(',')
+    if host
+]
 
 # Django Debug Toolbar
 # https://django-debug-toolbar.readthedocs.io/en/latest/installation.html
@@ -49,8 +66,11 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'debug_toolbar.middleware.DebugToolbarMiddleware',
+    'workout_tracker.middleware.profiling.ProfilingMiddleware',
+    'workout_tracker.middleware.slow_queries.SlowQueryMiddleware',
 
     'django.middleware.security.SecurityMiddleware',
+    'workout_tracker.middleware.static.StaticFilesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -78,8 +98,51 @@ TEMPLATES = [
     },
 ]
 
+# Optional Jinja2 engine (pip install jinja2), only used by the worksheet
+# pages when WORKSHEET_TEMPLATE_ENGINE is 'jinja2', see worksheet.jinja.
+# Compiled templates are cached in JINJA2_BYTECODE_CACHE_DIR (the system
+# temporary directory by default), for faster worker startups.
+WORKSHEET_TEMPLATE_ENGINE = os.environ.get('WORKOUT_TRACKER_TEMPLATE_ENGINE', 'django')
+JINJA2_BYTECODE_CACHE_DIR = os.environ.get('WORKOUT_TRACKER_JINJA2_CACHE_DIR')
+
+if importlib.util.find_spec('jinja2') is not None:
+    TEMPLATES.append({
+        'NAME': 'jinja2',
+        'BACKEND': 'django.template.backends.jinja2.Jinja2',
+        'DIRS': [],
+        'APP_DIRS': True,
+        'OPTIONS': {
+            'environment': 'worksheet.jinja.environment',
+            'bytecode_cache_dir': JINJA2_BYTECODE_CACHE_DIR,
+        },
+    })
+
 WSGI_APPLICATION = 'workout_tracker.wsgi.application'
 
+# Production profile: no debug toolbar, and optionally no admin area (set
+# WORKOUT_TRACKER_ADMIN=0), in which case the contrib apps it depends on are
+# removed as well since the worksheet app doesn't use them.
+ADMIN_ENABLED = os.environ.get('WORKOUT_TRACKER_ADMIN', '1') != '0'
+
+if PRODUCTION:
+    INSTALLED_APPS.remove('debug_toolbar')
+    MIDDLEWARE.remove('debug_toolbar.middleware.DebugToolbarMiddleware')
+
+    if not ADMIN_ENABLED:
+        for app in ['admin', 'auth', 'contenttypes', 'sessions', 'messages']:
+            INSTALLED_APPS.remove(f'django.contrib.{app}')
+
+        for middleware in [
+            'django.contrib.sessions.middleware.SessionMiddleware',
+            'django.contrib.auth.middleware.AuthenticationMiddleware',
+            'django.contrib.messages.middleware.MessageMiddleware',
+        ]:
+            MIDDLEWARE.remove(middleware)
+
+        TEMPLATES[0]['OPTIONS']['context_processors'] = [
+            'django.template.context_processors.request',
+        ]
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -88,6 +151,20 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Take the write lock when transactions begin: concurrent
+            # transactions then wait for each other (up to `timeout` seconds)
+            # instead of failing with "database is locked" when upgrading
+            # their read lock. WAL lets readers run alongside the writer.
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+            'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL',
+        },
+        'TEST': {
+            # The default shared in-memory test database uses table locks,
+            # which don't wait for the timeout, unlike file databases
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     },
     'pg': {
         'ENGINE': 'django.db.backends.postgresql',
@@ -97,6 +174,61 @@ DATABASES = {
     },
 }
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Cached data is invalidated by signals, so deployments with several worker
+# processes need a shared backend (database, file system, memcached...).
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
+# How long (in seconds) idempotency keys of worksheet creation requests are
+# remembered
+IDEMPOTENCY_KEY_TIMEOUT = 24 * 60 * 60
+
+# Task queue: number of worker threads started in each web server process (0
+# when `manage.py run_tasks` workers are used instead, only enable them with a
+# single process), seconds between polls of the queue, retry backoff of failed
+# tasks (doubled on each attempt, up to the maximum delay), and seconds after
+# which running tasks are considered abandoned by a dead worker and requeued
+TASK_WORKERS = 0
+TASK_POLL_INTERVAL = 5
+TASK_RETRY_BACKOFF = 10
+TASK_RETRY_MAX_DELAY = 60 * 60
+TASK_STALE_AFTER = 60 * 60
+
+# Worksheets in progress without any activity for AUTO_CLOSE_AFTER_HOURS are
+# considered abandoned, and closed by `manage.py close_stale_worksheets`, or by
+# a periodic task every AUTO_CLOSE_INTERVAL seconds (0 to disable it)
+AUTO_CLOSE_AFTER_HOURS = 24
+AUTO_CLOSE_INTERVAL = 0
+
+# Set events (changes of results) are inserted in batches of
+# EVENT_LOG_BATCH_SIZE events, or after EVENT_LOG_FLUSH_DELAY seconds, see
+# worksheet.events
+EVENT_LOG_BATCH_SIZE = 100
+EVENT_LOG_FLUSH_DELAY = 2
+
+# Most years displayed at once by the heatmap view
+MAX_HEATMAP_YEARS = 10
+
+# Number of days of scheduled workouts in the iCalendar feed
+CALENDAR_FEED_DAYS = 28
+
+# Default destination of `manage.py backup_db`
+BACKUP_DIR = BASE_DIR / 'backups'
+
+# Results of closed worksheets older than this are packed into the archive
+# table by `manage.py archive_worksheets`, except for the most recent
+# worksheets of each workout.
+ARCHIVE_AFTER_DAYS = 180
+ARCHIVE_KEEP_PER_WORKOUT = 3
+# Also archive them after each closing of a worksheet, in the background
+ARCHIVE_ON_CLOSE = False
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -136,8 +268,93 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# The production profile uses fingerprinted file names (with a manifest) and
+# precompressed variants of the collected files, see workout_tracker.storage.
+# `manage.py collectstatic` must be run for every deployment.
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': (
+            'workout_tracker.storage.CompressedManifestStaticFilesStorage'
+            if PRODUCTION else
+            'django.contrib.staticfiles.storage.StaticFilesStorage'
+        ),
+    },
+}
+
+# Files included by the {% bundle %} template tag. Each bundle is built by
+# collectstatic and included as a single file when STATIC_BUNDLING is
+# enabled, or as separate files otherwise. Stylesheets must be in the same
+# directory as their bundle for relative URLs to keep working.
+STATIC_BUNDLES = {
+    'worksheet/css/base.bundle.css': [
+        'worksheet/css/mvp.css',
+        'worksheet/css/base.css',
+    ],
+    'worksheet/css/index.bundle.css': [
+        'worksheet/css/mvp.css',
+        'worksheet/css/base.css',
+        'worksheet/css/index.css',
+    ],
+    'worksheet/css/heatmap.bundle.css': [
+        'worksheet/css/mvp.css',
+        'worksheet/css/base.css',
+        'worksheet/css/heatmap.css',
+    ],
+    'worksheet/css/worksheet.bundle.css': [
+        'worksheet/css/mvp.css',
+        'worksheet/css/base.css',
+        'worksheet/css/worksheet.css',
+    ],
+    'worksheet/js/worksheet.bundle.js': [
+        'worksheet/js/htmx.min.js',
+        'worksheet/js/worksheet.js',
+    ],
+}
+STATIC_BUNDLING = PRODUCTION
+
+# Serve the collected files from the app itself (StaticFilesMiddleware), for
+# deployments without a CDN or a web server handling them. Fingerprinted files
+# are cached forever, the others for STATIC_MAX_AGE seconds.
+STATIC_SERVE = PRODUCTION and os.environ.get('WORKOUT_TRACKER_SERVE_STATIC', '1') != '0'
+STATIC_MAX_AGE = 3600
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Request profiling, see workout_tracker.middleware.profiling
+# The middleware is disabled as long as the sample rate is 0 and signed query
+# flags are not allowed.
+
+# Fraction of requests to profile (0.01 = 1%)
+PROFILING_SAMPLE_RATE = 0
+# Allow profiling a single request with ?_profile=<token> (see `manage.py
+# profile_token`)
+PROFILING_SIGNED_FLAG = False
+PROFILING_TOKEN_MAX_AGE = 3600
+# Only keep the profiles of these views (e.g. 'worksheet:result'), all if empty
+PROFILING_VIEWS = []
+PROFILING_DIR = BASE_DIR / 'profiles'
+# Number of profiles kept per view, older ones are deleted
+PROFILING_MAX_FILES = 100
+
+# Slow query log, see workout_tracker.middleware.slow_queries
+# Queries of a request slower than this (in milliseconds) are written to
+# SLOW_QUERY_LOG, rotated when it reaches SLOW_QUERY_LOG_MAX_BYTES. The
+# middleware is disabled when the threshold is 0.
+SLOW_QUERY_THRESHOLD = 200 if PRODUCTION else 0
+SLOW_QUERY_LOG = BASE_DIR / 'logs' / 'slow_queries.log'
+SLOW_QUERY_LOG_MAX_BYTES = 1024 * 1024
+SLOW_QUERY_LOG_BACKUPS = 5
+
+# Startup budget of a production worker, checked by `manage.py check_startup`
+# (in milliseconds). Depends on the hardware, adjust to the deployment target.
+STARTUP_IMPORT_BUDGET = 600
+STARTUP_COLDSTART_BUDGET = 1000
@@ -0,0 +1,99 @@
+import gzip
+import posixpath
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+CSS_IMPORT_RE = re.compile(r"""@import\s+(?:url\()?\s*['"]?([^'")\s]+)['"]?\s*\)?\s*;""")
+
+# Only text formats benefit from compression
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.svg', '.json', '.txt', '.html', '.map'}
+
+def find_static(path):
+    """
+    The absolute path of a static file of the app directories (or
+    STATICFILES_DIRS).
+    """
+    absolute_path = finders.find(path)
+    if absolute_path is None:
+        raise FileNotFoundError(f"Static file {path} not found")
+
+    return absolute_path
+
+def read_static(path):
+    """
+    Read a static file from the app directories (or STATICFILES_DIRS).
+    """
+    with open(find_static(path), 'rb') as f:
+        return f.read()
+
+def build_bundle(sources, read=read_static):
+    """
+    Concatenate the given static files. Relative CSS @import rules are inlined,
+    since they are only valid at the top of a stylesheet.
+    """
+    parts = []
+    for source in sources:
+        content = read(source)
+
+        if source.endswith('.css'):
+            def inline(match, source=source):
+                imported = posixpath.normpath(
+                    posixpath.join(posixpath.dirname(source), match.group(1))
+                )
+                return read(imported).decode()
+
+            content = CSS_IMPORT_RE.sub(inline, content.decode()).encode()
+
+        parts.append(content.rstrip(b'\n'))
+
+    separator = b'\n;\n' if sources and sources[0].endswith('.js') else b'\n'
+
+    return separator.join(parts) + b'\n'
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Manifest storage which also builds the bundles defined in STATIC_BUNDLES,
+    and writes gzip (and brotli, if installed) variants of every text file
+    next to it, to be served by StaticFilesMiddleware.
+    """
+    def post_process(self, paths, dry_run=False, **options):
+        if not dry_run:
+            for bundle, sources in getattr(settings, 'STATIC_BUNDLES', {}).items():
+                if self.exists(bundle):
+                    self.delete(bundle)
+                self._save(bundle, ContentFile(build_bundle(sources)))
+                paths[bundle] = (self, bundle)
+
+        yield from super().post_process(paths, dry_run, **options)
+
+        if not dry_run:
+            names = set(paths) | set(self.hashed_files.values())
+            for name in sorted(names):
+                self._compress(name)
+
+    def _compress(self, name):
+        if posixpath.splitext(name)[1] not in COMPRESSIBLE_EXTENSIONS:
+            return
+
+        with self.open(name) as f:
+            content = f.read()
+
+        variants = {'.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            variants['.br'] = brotli.compress(content)
+
+        for extension, compressed in variants.items():
+            if self.exists(name + extension):
+                self.delete(name + extension)
+            # Not worth serving if it doesn't save anything
+            if len(compressed) < len(content):
+                self._save(name + extension, ContentFile(compressed))
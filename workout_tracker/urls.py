@@ -14,12 +14,25 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.contrib import admin
+from django.apps import apps
 from django.urls import include, path
 
-from debug_toolbar.toolbar import debug_toolbar_urls
-
 urlpatterns = [
     path('', include('worksheet.urls')),
-    path('admin/', admin.site.urls),
-] + debug_toolbar_urls()
+]
+
+# Both are dropped from the production profile (see settings.py)
+if apps.is_installed('django.contrib.admin'):
+    from django.contrib import admin
+
+    from worksheet.admin import slow_queries
+
+    urlpatterns += [
+        path('admin/slow-queries/', admin.site.admin_view(slow_queries), name='slow_queries'),
+        path('admin/', admin.site.urls),
+    ]
+
+if apps.is_installed('debug_toolbar'):
+    from debug_toolbar.toolbar import debug_toolbar_urls
+
+    urlpatterns += debug_toolbar_urls()
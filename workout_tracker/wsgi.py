@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'workout_tracker.settings')
 
 application = get_wsgi_application()
+
+# Run deferred tasks in the web server process, if TASK_WORKERS is set
+from worksheet.taskqueue import start_workers
+
+start_workers()
@@ -1,16 +1,68 @@
+import datetime
+import statistics
+
 from django.contrib import admin
+from django.db import transaction
+from django.forms.models import BaseInlineFormSet
+from django.template.response import TemplateResponse
+from django.utils.html import format_html_join
+from django.utils.safestring import mark_safe
+
+from . import events, integrity
+from .managers import enqueue_closed
+from .models import (
+    Equipment, Exercise, ExerciseNote, MuscleGroup, Program, Schedule, ScheduleRule, Tag, Task, Workout, Worksheet,
+)
+from .search import filter_exercises
+from .widgets import ExerciseAutocompleteWidget
+from workout_tracker.middleware.slow_queries import read_log
+
+class ProgramFormSet(BaseInlineFormSet):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
 
-from .models import Exercise, Workout, Worksheet, Program, Schedule
+        # The exercise names of all the rows, in a single query
+        widget = self.form.base_fields['exercise'].widget
+        widget = getattr(widget, 'widget', widget)
+        if isinstance(widget, ExerciseAutocompleteWidget):
+            exercise_ids = {program.exercise_id for program in self.get_queryset()}
+            if self.is_bound:
+                exercise_ids.update(
+                    value for key, value in self.data.items()
+                    if key.startswith(f'{self.prefix}-') and key.endswith('-exercise') and value.isdigit()
+                )
+            widget.prefetch(exercise_ids)
 
 class ProgramInline(admin.TabularInline):
     model = Program
+    formset = ProgramFormSet
     verbose_name = "Exercise"
     # This does not seem to limit the number of requests, unfortunately.
     #list_select_related = ['workout', 'exercise']
 
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        # A select would list the whole exercise library, on every row
+        if db_field.name == 'exercise':
+            kwargs['widget'] = ExerciseAutocompleteWidget()
+
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
 class ExerciseAdmin(admin.ModelAdmin):
-    fields = [('name', 'weight')]
+    fields = [('name', 'weight'), 'muscle_groups', 'equipment', 'tags']
     list_display = ['__str__', 'weight']
+    list_filter = ['muscle_groups', 'equipment', 'tags']
+    filter_horizontal = ['muscle_groups', 'equipment', 'tags']
+    search_fields = ['name']
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+
+        # Use the search index rather than a LIKE on every row
+        return filter_exercises(queryset, search_term), False
+
+class FacetAdmin(admin.ModelAdmin):
+    search_fields = ['name']
 
 class WorkoutAdmin(admin.ModelAdmin):
     fields = [('name', 'repeat')]
@@ -24,6 +76,19 @@ class WorkoutAdmin(admin.ModelAdmin):
         ProgramInline,
     ]
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+
+        # Worksheets already started follow the new program. Once committed, so
+        # that each of them is updated in its own short transaction instead of
+        # holding the write lock of the admin request for all of them.
+        if change and ('repeat' in form.changed_data or any(formset.has_changed() for formset in formsets)):
+            transaction.on_commit(lambda: self._propagate_program(request, form.instance))
+
+    def _propagate_program(self, request, workout):
+        if updated := integrity.propagate(workout):
+            self.message_user(request, f"The program was applied to {updated} worksheet(s) in progress.")
+
 class ScheduleAdmin(admin.ModelAdmin):
     list_display = ['day', 'workout']
     # NOTE Using 'workout__name' in list_display makes list_select_related
@@ -31,8 +96,38 @@ class ScheduleAdmin(admin.ModelAdmin):
     #list_select_related = ['workout']
     ordering = ['day']
 
+class ScheduleRuleAdmin(admin.ModelAdmin):
+    list_display = ['__str__', 'kind', 'start_date', 'end_date', 'priority']
+    list_select_related = ['workout']
+    list_filter = ['kind']
+    fieldsets = [
+        (
+            None,
+            {
+                'fields': [('kind', 'workout'), 'weekday', 'priority'],
+            }
+        ),
+        (
+            "Cycle",
+            {
+                'fields': [('every', 'unit', 'offset')],
+            }
+        ),
+        (
+            "Dates",
+            {
+                'fields': [('start_date', 'end_date')],
+            }
+        ),
+    ]
+
+class ExerciseNoteInline(admin.TabularInline):
+    model = ExerciseNote
+    extra = 0
+    autocomplete_fields = ['exercise']
+
 class WorksheetAdmin(admin.ModelAdmin):
-    list_display = ['date', 'workout', 'started_at', 'ended_at', 'done']
+    list_display = ['date', 'workout', 'started_at', 'ended_at', 'done', 'planned']
     ordering = ['-date']
     sortable_by = ['date']
     date_hierarchy = 'date'
@@ -41,7 +136,7 @@ class WorksheetAdmin(admin.ModelAdmin):
         (
             None,
             {
-                'fields': ['workout', 'done'],
+                'fields': ['workout', 'done', 'planned'],
             }
         ),
         (
@@ -51,14 +146,83 @@ class WorksheetAdmin(admin.ModelAdmin):
                 'classes': ['collapse'],
             }
         ),
+        (
+            "Set log",
+            {
+                'fields': ['set_log'],
+                'classes': ['collapse'],
+            }
+        ),
     ]
-    readonly_fields = ['started_at', 'date']
+    readonly_fields = ['started_at', 'date', 'set_log']
+    inlines = [
+        ExerciseNoteInline,
+    ]
+    actions = ['close_worksheets']
 
     def has_add_permission(self, request):
         return False
 
+    @admin.action(description="Close the selected worksheets, at their last activity")
+    def close_worksheets(self, request, queryset):
+        closed = Worksheet.objects.close_all(queryset)
+        self.message_user(request, f"Closed {len(closed)} worksheet(s).")
+
+    @admin.display(description="Sets")
+    def set_log(self, obj):
+        """
+        Rest and exercise times, and corrections, from the set events.
+        """
+        analytics = events.analyze(events.get_events(obj), obj.started_at)
+        if not analytics['sets']:
+            return "No set logged"
+
+        def seconds(delta):
+            return datetime.timedelta(seconds=round(delta.total_seconds()))
+
+        lines = [f"{len(analytics['sets'])} set(s)"]
+        if analytics['rest_times']:
+            lines.append(f"Median rest: {seconds(statistics.median(analytics['rest_times']))}")
+        names = Exercise.objects.in_bulk(analytics['exercise_times'])
+        for exercise_id, time in analytics['exercise_times'].items():
+            lines.append(f"{names.get(exercise_id, f'Exercise #{exercise_id}')}: {seconds(time)}")
+        lines.append(f"{len(analytics['edits'])} correction(s)")
+
+        return format_html_join(mark_safe('<br>'), '{}', ((line,) for line in lines))
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+
+        # Results of reopened worksheets need to be editable again
+        if not obj.done and obj.get_archive() is not None:
+            Worksheet.objects.unarchive([obj.pk])
+
+        if obj.done and 'done' in form.changed_data:
+            enqueue_closed(obj)
+
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ['name', 'key', 'status', 'attempts', 'run_at', 'finished_at']
+    list_filter = ['status', 'name']
+    ordering = ['-run_at']
+    readonly_fields = ['created_at', 'started_at', 'finished_at', 'last_error']
+
+def slow_queries(request):
+    """
+    The queries caught by the slow query log, by fingerprint.
+    """
+    return TemplateResponse(request, 'admin/slow_queries.html', {
+        **admin.site.each_context(request),
+        'title': "Slow queries",
+        'queries': read_log(),
+    })
+
 # Register your models here.
 admin.site.register(Exercise, ExerciseAdmin)
+admin.site.register(MuscleGroup, FacetAdmin)
+admin.site.register(Equipment, FacetAdmin)
+admin.site.register(Tag, FacetAdmin)
 admin.site.register(Workout, WorkoutAdmin)
 admin.site.register(Schedule, ScheduleAdmin)
+admin.site.register(ScheduleRule, ScheduleRuleAdmin)
 admin.site.register(Worksheet, WorksheetAdmin)
+admin.site.register(Task, TaskAdmin)
@@ -0,0 +1,333 @@
+"""
+Read-only JSON API (version 1) for dashboards and other external tools.
+
+Worksheets are paginated with an opaque cursor on (date, id), and can be
+synced incrementally: a first sync gets every worksheet and an
+`updated_until` value, to pass as `updated_since` to the next sync. Responses
+are projected to the requested fields (`fields=id,date,...`), serialized from
+plain values rather than model instances, and support conditional requests.
+"""
+import base64
+import datetime
+import hashlib
+import json
+from collections import defaultdict
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Max, Q
+from django.http import JsonResponse
+from django.urls import path, reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from django.views.generic import View
+
+from .models import ArchivedResults, Program, Result, Schedule, ScheduleRule, Workout, Worksheet
+from .schedule import get_resolver
+from .signals import get_calendar_version
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+# Longest range of planned days of the schedule endpoint
+MAX_PLANNED_DAYS = 366
+# updated_until of a first sync without any worksheet
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+# API field: column, for values_list()
+WORKSHEET_FIELDS = {
+    'id': 'id',
+    'date': 'date',
+    'workout': 'workout_id',
+    'workout_name': 'workout__name',
+    'done': 'done',
+    'planned': 'planned',
+    'started_at': 'started_at',
+    'ended_at': 'ended_at',
+    'updated_at': 'updated_at',
+}
+WORKOUT_FIELDS = ['id', 'name', 'repeat', 'exercises']
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+class ApiJSONEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        # Keep the microseconds that DjangoJSONEncoder drops, updated_until
+        # values are compared with the database ones
+        if isinstance(o, datetime.datetime):
+            return o.isoformat().replace('+00:00', 'Z')
+
+        return super().default(o)
+
+def json_response(data, status=200):
+    return JsonResponse(data, status=status, encoder=ApiJSONEncoder, json_dumps_params={
+        'separators': (',', ':'),
+    })
+
+def get_fields(request, available, default=None):
+    """
+    The fields requested with the `fields` parameter, in the order of the
+    available ones.
+    """
+    value = request.GET.get('fields')
+    if not value:
+        return list(default or available)
+
+    requested = set(value.split(','))
+    if unknown := requested - set(available):
+        raise ApiError(f"Unknown field(s): {', '.join(sorted(unknown))}")
+
+    return [field for field in available if field in requested]
+
+def encode_cursor(date, pk, until):
+    data = json.dumps([date.isoformat(), pk, until.isoformat() if until else None])
+
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        date, pk, until = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return parse_date(date), int(pk), parse_datetime(until) if until else None
+    except (ValueError, TypeError):
+        raise ApiError("Invalid cursor")
+
+def _etag(*parts):
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+class ApiView(View):
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        except ApiError as e:
+            return json_response({'error': str(e)}, status=e.status)
+
+class WorksheetQuery:
+    """
+    The worksheets selected by the parameters of a request, parsed once for
+    both the ETag and the response.
+    """
+    def __init__(self, request):
+        self.fields = get_fields(request, WORKSHEET_FIELDS)
+        self.embed = request.GET.get('embed', '') == 'results'
+
+        try:
+            self.limit = min(int(request.GET.get('limit', DEFAULT_LIMIT)), MAX_LIMIT)
+        except ValueError:
+            raise ApiError("Invalid limit")
+        if self.limit < 1:
+            raise ApiError("Invalid limit")
+
+        self.updated_since = None
+        if since := request.GET.get('updated_since'):
+            self.updated_since = parse_datetime(since)
+            if self.updated_since is None:
+                raise ApiError("Invalid updated_since, expected an ISO 8601 date and time")
+            if timezone.is_naive(self.updated_since):
+                self.updated_since = timezone.make_aware(self.updated_since, datetime.timezone.utc)
+
+        self.cursor = None
+        if cursor := request.GET.get('cursor'):
+            self.cursor = decode_cursor(cursor)
+
+        worksheets = Worksheet.objects.all()
+        if self.updated_since is not None:
+            worksheets = worksheets.filter(updated_at__gt=self.updated_since)
+        self.worksheets = worksheets
+
+    def get_state(self):
+        """
+        The number of selected worksheets and their last update, which change
+        with any of them.
+        """
+        if not hasattr(self, '_state'):
+            self._state = self.worksheets.aggregate(count=Count('pk'), updated_until=Max('updated_at'))
+            # Without any worksheet, the next sync starts from the same point
+            if self._state['updated_until'] is None:
+                self._state['updated_until'] = self.updated_since or EPOCH
+
+        return self._state
+
+    def get_page(self):
+        # Later pages keep to the worksheets updated before the first one was
+        # served, so that pages stay consistent while syncing
+        if self.cursor is not None:
+            date, pk, until = self.cursor
+        else:
+            date, pk, until = None, None, self.get_state()['updated_until']
+
+        worksheets = self.worksheets
+        if until is not None:
+            worksheets = worksheets.filter(updated_at__lte=until)
+        if date is not None:
+            worksheets = worksheets.filter(Q(date__gt=date) | Q(date=date, pk__gt=pk))
+
+        # The cursor and the results need the id and date, whatever the
+        # requested fields
+        columns = list(dict.fromkeys(['id', 'date'] + [WORKSHEET_FIELDS[f] for f in self.fields]))
+        if self.embed:
+            columns.append('archive__results')
+
+        rows = list(worksheets.order_by('date', 'pk').values_list(*columns)[:self.limit + 1])
+        more = len(rows) > self.limit
+        rows = rows[:self.limit]
+
+        data = serialize_worksheets(rows, columns, self.fields, self.embed)
+        next_cursor = encode_cursor(rows[-1][1], rows[-1][0], until) if more else None
+
+        return data, next_cursor, until
+
+def serialize_worksheets(rows, columns, fields, embed):
+    """
+    Turn values_list() rows into dicts of the requested fields, with their
+    results embedded if asked to (fetched in a single query).
+    """
+    positions = [columns.index(WORKSHEET_FIELDS[field]) for field in fields]
+    data = [
+        {field: row[position] for field, position in zip(fields, positions)}
+        for row in rows
+    ]
+
+    if embed:
+        results = defaultdict(list)
+        for worksheet_id, pk, exercise_id, reps, weight in Result.objects.filter(
+            worksheet__in=[row[0] for row in rows],
+        ).order_by('worksheet', '_order').values_list('worksheet', 'id', 'exercise', 'reps', 'weight'):
+            results[worksheet_id].append({'id': pk, 'exercise': exercise_id, 'reps': reps, 'weight': weight})
+
+        archive = columns.index('archive__results')
+        for item, row in zip(data, rows):
+            if row[archive] is not None:
+                # Archived results don't have ids anymore
+                item['results'] = [
+                    {'id': None, 'exercise': exercise_id, 'reps': reps, 'weight': weight}
+                    for exercise_id, reps, weight in ArchivedResults(results=row[archive]).unpack()
+                ]
+            else:
+                item['results'] = results[row[0]]
+
+    return data
+
+def _worksheets_etag(request):
+    try:
+        query = request.worksheet_query = WorksheetQuery(request)
+    except ApiError:
+        return None
+    state = query.get_state()
+
+    return _etag(request.GET.urlencode(), state['count'], state['updated_until'])
+
+@method_decorator(condition(etag_func=_worksheets_etag), name='get')
+class WorksheetList(ApiView):
+    def get(self, request):
+        query = getattr(request, 'worksheet_query', None) or WorksheetQuery(request)
+        data, cursor, until = query.get_page()
+
+        next_url = None
+        if cursor is not None:
+            params = request.GET.copy()
+            params['cursor'] = cursor
+            next_url = request.build_absolute_uri(f"{reverse('worksheet:api:worksheets')}?{params.urlencode()}")
+
+        return json_response({
+            'data': data,
+            'next': next_url,
+            'updated_until': until,
+        })
+
+def _worksheet_etag(request, pk):
+    updated_at = Worksheet.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+
+    return _etag(request.GET.urlencode(), updated_at) if updated_at else None
+
+@method_decorator(condition(etag_func=_worksheet_etag), name='get')
+class WorksheetDetail(ApiView):
+    """
+    A single worksheet, with its results unless other fields are requested.
+    """
+    def get(self, request, pk):
+        fields = get_fields(request, WORKSHEET_FIELDS)
+        embed = request.GET.get('embed', 'results') == 'results'
+
+        columns = list(dict.fromkeys(['id', 'date'] + [WORKSHEET_FIELDS[f] for f in fields]))
+        if embed:
+            columns.append('archive__results')
+
+        rows = list(Worksheet.objects.filter(pk=pk).values_list(*columns))
+        if not rows:
+            raise ApiError("Worksheet not found", status=404)
+
+        return json_response({'data': serialize_worksheets(rows, columns, fields, embed)[0]})
+
+def _calendar_etag(request, *args, **kwargs):
+    return _etag(request.GET.urlencode(), get_calendar_version())
+
+@method_decorator(condition(etag_func=_calendar_etag), name='get')
+class WorkoutList(ApiView):
+    """
+    Every workout, with its exercises in program order.
+    """
+    def get(self, request):
+        fields = get_fields(request, WORKOUT_FIELDS)
+
+        exercises = defaultdict(list)
+        if 'exercises' in fields:
+            for workout_id, exercise_id in Program.objects.order_by('workout', '_order').values_list(
+                'workout', 'exercise',
+            ):
+                exercises[workout_id].append(exercise_id)
+
+        columns = [field for field in fields if field != 'exercises']
+        data = []
+        for row in Workout.objects.order_by('pk').values('pk', *columns):
+            item = {column: row[column] for column in columns}
+            if 'exercises' in fields:
+                item['exercises'] = exercises[row['pk']]
+            data.append(item)
+
+        return json_response({'data': data})
+
+@method_decorator(condition(etag_func=_calendar_etag), name='get')
+class ScheduleDetail(ApiView):
+    """
+    The weekly schedule and its rules, and the workouts planned between the
+    `start` and `end` dates (both included) when given.
+    """
+    def get(self, request):
+        data = {
+            'weekly': [
+                {'day': day, 'workout': workout}
+                for day, workout in Schedule.objects.order_by('day').values_list('day', 'workout')
+            ],
+            'rules': list(ScheduleRule.objects.order_by('-priority', '-pk').values(
+                'id', 'kind', 'workout', 'weekday', 'every', 'unit', 'offset',
+                'start_date', 'end_date', 'priority',
+            )),
+        }
+
+        start, end = request.GET.get('start'), request.GET.get('end')
+        if start or end:
+            try:
+                start, end = parse_date(start or ''), parse_date(end or '')
+            except ValueError:
+                start = end = None
+            if start is None or end is None or not 0 <= (end - start).days < MAX_PLANNED_DAYS:
+                raise ApiError(f"Invalid start and end dates, at most {MAX_PLANNED_DAYS} days apart")
+
+            data['planned'] = [
+                {'date': date, 'workout': planned.workout.pk, 'deload': planned.deload}
+                for date, planned in get_resolver().expand(start, end).items()
+            ]
+
+        return json_response({'data': data})
+
+app_name = 'api'
+
+urlpatterns = [
+    path('workouts', WorkoutList.as_view(), name='workouts'),
+    path('schedule', ScheduleDetail.as_view(), name='schedule'),
+    path('worksheets', WorksheetList.as_view(), name='worksheets'),
+    path('worksheets/<int:pk>', WorksheetDetail.as_view(), name='worksheet'),
+]
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class WorksheetConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'worksheet'
+
+    def ready(self):
+        # Connect the signal receivers, and register the deferred tasks
+        from . import signals, tasks
@@ -0,0 +1,222 @@
+"""
+Online backup and restore of the database, used by the backup_db and
+restore_db management commands.
+
+SQLite databases are copied with the incremental backup API, a few pages at a
+time, so that writers are only blocked for the duration of a single step (note
+that SQLite restarts the copy when another connection writes to the database
+in the meantime).
+
+PostgreSQL databases are dumped table by table with COPY, inside a single
+read-only snapshot. Only the data is saved: the schema must already exist when
+restoring (run `migrate` first).
+"""
+import hashlib
+import json
+import sqlite3
+import time
+from pathlib import Path
+
+from django.apps import apps
+from django.core.management.color import no_style
+from django.db import transaction
+
+CHECKSUM_SUFFIX = '.sha256'
+MANIFEST = 'manifest.json'
+
+class BackupError(Exception):
+    pass
+
+def file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+def write_checksum(path):
+    """
+    Write the checksum of a file next to it, in the format used by sha256sum.
+    """
+    checksum = file_checksum(path)
+    Path(f"{path}{CHECKSUM_SUFFIX}").write_text(f"{checksum}  {Path(path).name}\n")
+
+    return checksum
+
+def verify_checksum(path):
+    checksum_file = Path(f"{path}{CHECKSUM_SUFFIX}")
+    if not checksum_file.is_file():
+        raise BackupError(f"Missing checksum file {checksum_file}")
+
+    expected = checksum_file.read_text().split()[0]
+    if file_checksum(path) != expected:
+        raise BackupError(f"Checksum mismatch for {path}")
+
+class Stats:
+    """
+    Throughput of a backup or a restore.
+    """
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.ended_at = None
+        self.size = 0
+        self.steps = 0
+        self.rows = 0
+
+    def stop(self, size):
+        self.ended_at = time.perf_counter()
+        self.size = size
+
+        return self
+
+    @property
+    def duration(self):
+        return (self.ended_at or time.perf_counter()) - self.started_at
+
+    def __str__(self):
+        throughput = self.size / self.duration / 1024 / 1024 if self.duration else 0
+        details = f"{self.steps} steps" if self.steps else f"{self.rows} rows"
+
+        return (
+            f"{self.size / 1024 / 1024:.2f} MiB in {self.duration:.2f}s "
+            f"({throughput:.2f} MiB/s, {details})"
+        )
+
+def _sqlite_copy(source, target, pages, sleep, stats):
+    def progress(status, remaining, total):
+        stats.steps += 1
+
+    source.backup(target, pages=pages, progress=progress, sleep=sleep)
+
+def _sqlite_integrity_check(path):
+    db = sqlite3.connect(path)
+    try:
+        result = db.execute('PRAGMA integrity_check').fetchone()[0]
+    finally:
+        db.close()
+
+    if result != 'ok':
+        raise BackupError(f"Integrity check failed for {path}: {result}")
+
+def sqlite_backup(connection, path, pages=64, sleep=0.005):
+    """
+    Copy the database of a Django connection into a new SQLite file, pages at
+    a time, and write its checksum next to it.
+    """
+    stats = Stats()
+    connection.ensure_connection()
+
+    target = sqlite3.connect(path)
+    try:
+        _sqlite_copy(connection.connection, target, pages, sleep, stats)
+    finally:
+        target.close()
+
+    _sqlite_integrity_check(path)
+    write_checksum(path)
+
+    return stats.stop(Path(path).stat().st_size)
+
+def sqlite_restore(connection, path, pages=64, sleep=0.005):
+    """
+    Replace the database of a Django connection with the content of a backup
+    file, after checking it.
+    """
+    verify_checksum(path)
+    _sqlite_integrity_check(path)
+
+    stats = Stats()
+    connection.ensure_connection()
+
+    source = sqlite3.connect(path)
+    try:
+        _sqlite_copy(source, connection.connection, pages, sleep, stats)
+    finally:
+        source.close()
+
+    return stats.stop(Path(path).stat().st_size)
+
+def _pg_tables(connection):
+    """
+    The tables of every installed model, including many-to-many tables.
+    """
+    existing = set(connection.introspection.table_names())
+    tables = []
+    for model in apps.get_models(include_auto_created=True):
+        if model._meta.managed and not model._meta.proxy and model._meta.db_table in existing:
+            if model._meta.db_table not in tables:
+                tables.append(model._meta.db_table)
+
+    return tables
+
+def pg_backup(connection, directory):
+    """
+    Dump every table with COPY into a directory, from a single consistent
+    snapshot, along with a manifest holding checksums and row counts.
+    """
+    stats = Stats()
+    directory = Path(directory)
+    directory.mkdir(parents=True)
+    quote = connection.ops.quote_name
+
+    manifest = {'vendor': connection.vendor, 'tables': []}
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY')
+
+        for table in _pg_tables(connection):
+            path = directory / f"{table}.copy"
+            with open(path, 'wb') as f, cursor.copy(f"COPY {quote(table)} TO STDOUT (FORMAT binary)") as copy:
+                for data in copy:
+                    f.write(data)
+
+            cursor.execute(f"SELECT COUNT(*) FROM {quote(table)}")
+            rows = cursor.fetchone()[0]
+            stats.rows += rows
+            stats.size += path.stat().st_size
+
+            manifest['tables'].append({
+                'table': table,
+                'file': path.name,
+                'rows': rows,
+                'sha256': file_checksum(path),
+            })
+
+    (directory / MANIFEST).write_text(json.dumps(manifest, indent=2))
+
+    return stats.stop(stats.size)
+
+def pg_restore(connection, directory):
+    """
+    Replace the content of every table with a COPY dump, in a single
+    transaction, then reset the sequences.
+    """
+    directory = Path(directory)
+    manifest = json.loads((directory / MANIFEST).read_text())
+    for entry in manifest['tables']:
+        if file_checksum(directory / entry['file']) != entry['sha256']:
+            raise BackupError(f"Checksum mismatch for {entry['file']}")
+
+    stats = Stats()
+    quote = connection.ops.quote_name
+    tables = [entry['table'] for entry in manifest['tables']]
+
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(f"TRUNCATE {', '.join(quote(t) for t in tables)} CASCADE")
+        # Foreign keys are checked at the end of the transaction
+        cursor.execute('SET CONSTRAINTS ALL DEFERRED')
+
+        for entry in manifest['tables']:
+            path = directory / entry['file']
+            with open(path, 'rb') as f, cursor.copy(f"COPY {quote(entry['table'])} FROM STDIN (FORMAT binary)") as copy:
+                while data := f.read(1024 * 1024):
+                    copy.write(data)
+
+            stats.rows += entry['rows']
+            stats.size += path.stat().st_size
+
+        models = [m for m in apps.get_models(include_auto_created=True) if m._meta.db_table in tables]
+        for sql in connection.ops.sequence_reset_sql(no_style(), models):
+            cursor.execute(sql)
+
+    return stats.stop(stats.size)
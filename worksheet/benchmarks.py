@@ -0,0 +1,220 @@
+"""
+Microbenchmarks of the model and manager hot paths, run by the `benchmark`
+management command at several history sizes (number of past worksheets).
+
+Each sample runs in a transaction rolled back afterwards, so that benchmarks
+writing to the database (creating or closing worksheets) leave the history as
+it was, and only the benchmarked call is timed, not its setup.
+"""
+import contextlib
+import datetime
+import os
+import statistics
+import tempfile
+import time
+
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.utils import timezone
+
+from .models import Exercise, Program, Result, Workout, Worksheet
+from .views import Index
+
+# Benchmarks, by name: (setup, function) where setup returns the arguments of
+# the function, see benchmark()
+_registry = {}
+
+def benchmark(name, setup=None):
+    """
+    Register a benchmark, called with the arguments returned by `setup` (run
+    before each call, and not timed).
+    """
+    def decorator(func):
+        _registry[name] = (setup, func)
+        return func
+
+    return decorator
+
+def get_benchmarks():
+    return list(_registry)
+
+@contextlib.contextmanager
+def throwaway_database():
+    """
+    Use an empty copy of the schema as the default database, until exit. It
+    is named after the process rather than after the test database, which a
+    concurrent test run may be using.
+    """
+    test_settings = connection.settings_dict['TEST']
+    test_name = test_settings.get('NAME')
+
+    with tempfile.TemporaryDirectory() as directory:
+        if connection.vendor == 'sqlite':
+            test_settings['NAME'] = os.path.join(directory, 'throwaway.sqlite3')
+        else:
+            test_settings['NAME'] = f"{connection.settings_dict['NAME']}_throwaway_{os.getpid()}"
+
+        try:
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                yield
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+        finally:
+            test_settings['NAME'] = test_name
+
+def setup_workouts(exercises=8):
+    """
+    Create the benchmarked workouts: a repeat workout of 4 exercises (whose
+    order is hardcoded for the workout #1, see Workout.get_exercises_in_order)
+    and a regular workout.
+    """
+    repeat = Workout.objects.create(pk=1, name="Repeat", repeat=True)
+    regular = Workout.objects.create(pk=2, name="Regular")
+
+    library = Exercise.objects.bulk_create([
+        Exercise(name=f"Exercise {n + 1}", weight=n % 2 == 0) for n in range(max(exercises, 4))
+    ])
+    for exercise in library[:4]:
+        Program.objects.create(workout=repeat, exercise=exercise)
+    for exercise in library[:exercises]:
+        Program.objects.create(workout=regular, exercise=exercise)
+
+def add_history(size):
+    """
+    Add closed worksheets of the regular workout, with their results, one per
+    day before the oldest one (or yesterday), up to `size` worksheets.
+    """
+    count = Worksheet.objects.count()
+    if count >= size:
+        return
+
+    workout = Workout.objects.get(pk=2)
+    exercises = list(workout.get_exercises_in_order())
+    oldest = Worksheet.objects.order_by('date').values_list('date', flat=True).first()
+    start = oldest or timezone.localdate()
+
+    worksheets = []
+    for n in range(1, size - count + 1):
+        date = start - datetime.timedelta(days=n)
+        started_at = timezone.make_aware(datetime.datetime.combine(date, datetime.time(18)))
+        worksheets.append(Worksheet(
+            workout=workout, date=date, done=True,
+            started_at=started_at, ended_at=started_at + datetime.timedelta(hours=1),
+        ))
+    worksheets = Worksheet.objects.bulk_create(worksheets, batch_size=500)
+
+    Result.objects.bulk_create([
+        Result(worksheet=worksheet, exercise=exercise, _order=order, display_order=order,
+               reps=10, weight=20 if exercise.weight else None)
+        for worksheet in worksheets
+        for order, exercise in enumerate(exercises)
+    ], batch_size=1000)
+
+def _future_date():
+    # Never used by the history, nor by today's worksheet
+    return timezone.localdate() + datetime.timedelta(days=365)
+
+def _new_worksheet():
+    return (Worksheet.objects.create(workout_id=2, date=_future_date()),)
+
+def _open_worksheet():
+    worksheet = Worksheet.objects.create(workout_id=2, date=_future_date())
+    worksheet.result_set(manager="results").create_all(new=True)
+
+    return (worksheet.pk,)
+
+def _closed_worksheet():
+    return (Worksheet.objects.filter(done=True).first() or Worksheet(
+        started_at=timezone.now() - datetime.timedelta(hours=1), ended_at=timezone.now(), done=True,
+    ),)
+
+def _result():
+    return (Result(exercise=Exercise.objects.filter(weight=False).first(), reps=10, weight=20),)
+
+@benchmark('get_exercises_in_order[regular]', setup=lambda: (Workout.objects.get(pk=2),))
+def get_exercises_in_order(workout):
+    list(workout.get_exercises_in_order())
+
+@benchmark('get_exercises_in_order[repeat]', setup=lambda: (Workout.objects.get(pk=1),))
+def get_exercises_in_order_repeat(workout):
+    list(workout.get_exercises_in_order())
+
+@benchmark('create_all', setup=_new_worksheet)
+def create_all(worksheet):
+    worksheet.result_set(manager="results").create_all(new=True)
+
+@benchmark('get_or_create')
+def get_or_create():
+    Worksheet.objects.get_or_create(date=_future_date(), defaults={'workout_id': 2})
+
+@benchmark('get_active')
+def get_active():
+    list(Worksheet.objects.get_active())
+
+@benchmark('close', setup=_open_worksheet)
+def close(pk):
+    Worksheet.objects.close(pk=pk)
+
+@benchmark('get_duration', setup=_closed_worksheet)
+def get_duration(worksheet):
+    worksheet.get_duration()
+
+@benchmark('clean_fields', setup=_result)
+def clean_fields(result):
+    result.clean_fields(exclude=['worksheet'])
+
+@benchmark('index', setup=lambda: (RequestFactory().get('/'),))
+def index(request):
+    Index.as_view()(request).render()
+
+def measure(name, number=20, repeat=5):
+    """
+    Time a benchmark: `repeat` rounds of `number` calls. Return the median and
+    the minimum duration of a call (in microseconds) over the rounds.
+    """
+    setup, func = _registry[name]
+
+    rounds = []
+    for _ in range(repeat):
+        elapsed = 0
+        for _ in range(number):
+            with transaction.atomic():
+                args = setup() if setup is not None else ()
+                start = time.perf_counter()
+                func(*args)
+                elapsed += time.perf_counter() - start
+                transaction.set_rollback(True)
+        rounds.append(elapsed / number * 1_000_000)
+
+    return {'median': statistics.median(rounds), 'min': min(rounds)}
+
+def run(sizes, names=None, number=20, repeat=5):
+    """
+    Run the benchmarks (all of them, or the given ones) for each history size,
+    and return the results by "name@size".
+    """
+    results = {}
+    for size in sorted(sizes):
+        add_history(size)
+        for name in names or get_benchmarks():
+            results[f"{name}@{size}"] = measure(name, number, repeat)
+
+    return results
+
+def compare(results, baseline, tolerance):
+    """
+    Compare results with a baseline: return (key, baseline, current, ratio)
+    for the benchmarks slower than their baseline by more than `tolerance` (a
+    fraction, 0.2 for 20%).
+    """
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+
+        ratio = result['median'] / baseline[key]['median']
+        if ratio > 1 + tolerance:
+            regressions.append((key, baseline[key]['median'], result['median'], ratio))
+
+    return regressions
@@ -0,0 +1,251 @@
+"""
+Append-only log of the changes of results (SetEvent), to know when each set
+was entered and how it was corrected.
+
+Events are buffered in memory once their transaction is committed, and
+inserted in batches (EVENT_LOG_BATCH_SIZE events, or after
+EVENT_LOG_FLUSH_DELAY seconds), so that logging adds no query to result
+updates. Buffered events are lost if the process crashes. The events of
+closed worksheets are then compacted into a packed WorksheetLog with a
+summary of the session, from which rest times, time per exercise and edit
+history are computed.
+"""
+import atexit
+import datetime
+import logging
+import statistics
+import threading
+from collections import namedtuple
+from functools import partial
+from itertools import batched
+
+from django.apps import apps
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+Event = namedtuple('Event', ['time', 'position', 'exercise_id', 'field', 'value'])
+Edit = namedtuple('Edit', ['time', 'position', 'exercise_id', 'field', 'old', 'new'])
+
+_buffer = []
+_lock = threading.Lock()
+_timer = None
+
+def record(worksheet_id, result_id, field, value):
+    """
+    Log the change of a field ('reps' or 'weight') of a result, once the
+    current transaction is committed.
+    """
+    SetEvent = apps.get_model('worksheet', 'SetEvent')
+
+    event = SetEvent(
+        worksheet_id=worksheet_id,
+        result_id=result_id,
+        field=SetEvent.REPS if field == 'reps' else SetEvent.WEIGHT,
+        value=None if value in (None, '') else int(value),
+        created_at=timezone.now(),
+    )
+    transaction.on_commit(partial(_append, event))
+
+def _append(event):
+    global _timer
+
+    with _lock:
+        _buffer.append(event)
+        full = len(_buffer) >= getattr(settings, 'EVENT_LOG_BATCH_SIZE', 100)
+        if not full and _timer is None:
+            _timer = threading.Timer(getattr(settings, 'EVENT_LOG_FLUSH_DELAY', 2), _flush_in_timer)
+            _timer.daemon = True
+            _timer.start()
+
+    if full:
+        flush()
+
+def _flush_in_timer():
+    try:
+        flush()
+    finally:
+        # Each timer runs in a new thread, with its own connections
+        connections.close_all()
+
+def flush():
+    """
+    Insert the buffered events, and return how many were inserted.
+    """
+    global _timer
+    SetEvent = apps.get_model('worksheet', 'SetEvent')
+
+    with _lock:
+        events = _buffer[:]
+        _buffer.clear()
+        if _timer is not None:
+            _timer.cancel()
+            _timer = None
+
+    if not events:
+        return 0
+
+    try:
+        with transaction.atomic():
+            SetEvent.objects.bulk_create(events)
+    except DatabaseError:
+        logger.exception("Could not write %s set event(s)", len(events))
+        return 0
+
+    return len(events)
+
+atexit.register(flush)
+
+def compact(worksheet_ids=None, batch_size=500):
+    """
+    Pack the logged events of closed worksheets (all of them, or the given
+    ones) into their WorksheetLog, along with the events packed before, and
+    delete them. Events of deleted worksheets are dropped. Each batch is
+    compacted in its own transaction. Return the number of compacted
+    worksheets.
+    """
+    SetEvent = apps.get_model('worksheet', 'SetEvent')
+    Worksheet = apps.get_model('worksheet', 'Worksheet')
+
+    flush()
+
+    events = SetEvent.objects.all()
+    if worksheet_ids is not None:
+        events = events.filter(worksheet__in=worksheet_ids)
+
+    logged = set(events.values_list('worksheet', flat=True).distinct().order_by())
+    existing = set(Worksheet.objects.filter(pk__in=logged).values_list('pk', flat=True))
+    if orphans := logged - existing:
+        SetEvent.objects.filter(worksheet__in=orphans).delete()
+
+    closed = Worksheet.objects.filter(pk__in=existing, done=True).order_by('pk').values_list('pk', flat=True)
+    compacted = 0
+    for batch in batched(closed, batch_size):
+        with transaction.atomic():
+            _compact_batch(batch)
+        compacted += len(batch)
+
+    return compacted
+
+def _compact_batch(batch):
+    SetEvent = apps.get_model('worksheet', 'SetEvent')
+    Worksheet = apps.get_model('worksheet', 'Worksheet')
+    WorksheetLog = apps.get_model('worksheet', 'WorksheetLog')
+
+    worksheets = Worksheet.objects.in_bulk(batch)
+    logs = WorksheetLog.objects.in_bulk(batch)
+    raw = _get_raw_events(batch)
+
+    new_logs = []
+    for pk in batch:
+        started_at = worksheets[pk].started_at
+        events = get_logged_events(logs[pk], started_at) if pk in logs else []
+        events = sorted(events + raw[pk], key=_time)
+        summary = analyze(events, started_at)
+
+        new_logs.append(WorksheetLog(
+            worksheet_id=pk,
+            events=WorksheetLog.pack(
+                (_milliseconds(event.time - started_at), event.position, event.exercise_id, event.field, event.value)
+                for event in events
+            ),
+            sets=len(summary['sets']),
+            edits=len(summary['edits']),
+            rest_time=statistics.median(summary['rest_times']) if summary['rest_times'] else None,
+        ))
+
+    WorksheetLog.objects.filter(worksheet__in=batch).delete()
+    WorksheetLog.objects.bulk_create(new_logs)
+    SetEvent.objects.filter(worksheet__in=batch).delete()
+
+def _time(event):
+    return event.time
+
+def _milliseconds(delta):
+    return delta // datetime.timedelta(milliseconds=1)
+
+def _get_raw_events(worksheet_ids):
+    """
+    The logged, not yet compacted, events of worksheets, by worksheet. Events
+    of results that don't exist anymore are skipped.
+    """
+    Result = apps.get_model('worksheet', 'Result')
+    SetEvent = apps.get_model('worksheet', 'SetEvent')
+
+    results = {
+        pk: (position, exercise_id)
+        for pk, position, exercise_id in Result.objects.filter(
+            worksheet__in=worksheet_ids,
+        ).values_list('pk', '_order', 'exercise')
+    }
+
+    events = {pk: [] for pk in worksheet_ids}
+    for worksheet_id, result_id, field, value, created_at in SetEvent.objects.filter(
+        worksheet__in=worksheet_ids,
+    ).order_by('created_at', 'pk').values_list('worksheet', 'result_id', 'field', 'value', 'created_at'):
+        if result_id in results:
+            events[worksheet_id].append(Event(created_at, *results[result_id], field, value))
+
+    return events
+
+def get_logged_events(log, started_at):
+    return [
+        Event(started_at + datetime.timedelta(milliseconds=milliseconds), position, exercise_id, field, value)
+        for milliseconds, position, exercise_id, field, value in log.unpack()
+    ]
+
+def get_events(worksheet):
+    """
+    Every event of a worksheet, compacted or not, in chronological order.
+    """
+    WorksheetLog = apps.get_model('worksheet', 'WorksheetLog')
+
+    log = WorksheetLog.objects.filter(worksheet=worksheet).first()
+    events = get_logged_events(log, worksheet.started_at) if log is not None else []
+
+    return sorted(events + _get_raw_events([worksheet.pk])[worksheet.pk], key=_time)
+
+def analyze(events, started_at):
+    """
+    Session analytics from the events of a worksheet, in chronological
+    order. A set is done when its reps are first entered:
+
+    - `sets`: the (time, position, exercise_id) of each set, in the order
+      they were done.
+    - `rest_times`: the time between two consecutive sets.
+    - `exercise_times`: by exercise, the time spent on its sets (from the end
+      of the previous set, or the start of the worksheet, to its end).
+    - `edits`: the values changed after they were first entered, as Edit
+      tuples.
+    """
+    SetEvent = apps.get_model('worksheet', 'SetEvent')
+
+    sets = []
+    edits = []
+    values = {}
+    for event in events:
+        key = (event.position, event.field)
+        if key in values:
+            if values[key] != event.value:
+                edits.append(Edit(event.time, event.position, event.exercise_id, event.field,
+                                  values[key], event.value))
+        elif event.field == SetEvent.REPS:
+            sets.append((event.time, event.position, event.exercise_id))
+        values[key] = event.value
+
+    rest_times = [current[0] - previous[0] for previous, current in zip(sets, sets[1:])]
+
+    exercise_times = {}
+    end = started_at
+    for time, _, exercise_id in sets:
+        exercise_times[exercise_id] = exercise_times.get(exercise_id, datetime.timedelta()) + (time - end)
+        end = time
+
+    return {
+        'sets': sets,
+        'rest_times': rest_times,
+        'exercise_times': exercise_times,
+        'edits': edits,
+    }
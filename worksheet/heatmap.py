@@ -0,0 +1,108 @@
+"""
+Year-at-a-glance training heatmap: the status of every day of a year (done,
+in progress, missed, planned or rest day) and the training volume of the
+worksheets, as intensity levels.
+
+A year is built from a single aggregate query over its worksheets and their
+results (or archived results), and the expansion of the cached schedule
+resolver, then cached until one of its worksheets or the schedule changes.
+"""
+import bisect
+import datetime
+import statistics
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.db.models import F, Max, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import ArchivedResults, Worksheet
+from .schedule import get_resolver
+from .signals import get_calendar_version
+
+DONE = 'done'
+IN_PROGRESS = 'in_progress'
+MISSED = 'missed'
+PLANNED = 'planned'
+REST = 'rest'
+
+# Number of intensity levels of the worksheets, by volume quartile
+LEVELS = 4
+
+Day = namedtuple('Day', ['date', 'status', 'level', 'title'])
+
+def _archived_volume(data):
+    return sum(
+        reps * (weight if weight is not None else 1)
+        for _, reps, weight in ArchivedResults(results=data).unpack()
+        if reps is not None
+    )
+
+def get_volumes(start, end):
+    """
+    The (done, workout name, volume) of the worksheets between two dates (both
+    included), by date. The volume of a worksheet is the sum of its reps times
+    their weight (1 for exercises without weight).
+    """
+    rows = Worksheet.objects.filter(date__range=(start, end), planned=False).values_list(
+        'date', 'done', 'workout__name', 'archive__results',
+    ).annotate(
+        volume=Sum(F('result__reps') * Coalesce(F('result__weight'), 1)),
+    ).order_by()
+
+    return {
+        date: (done, name, _archived_volume(archive) if archive is not None else volume or 0)
+        for date, done, name, archive, volume in rows
+    }
+
+def build_year(year, today):
+    """
+    The days of a year, as a list of Day, and the number of days by status.
+    """
+    start, end = datetime.date(year, 1, 1), datetime.date(year, 12, 31)
+    worksheets = get_volumes(start, end)
+    planned = get_resolver().expand(start, end)
+
+    volumes = sorted(volume for _, _, volume in worksheets.values())
+    thresholds = statistics.quantiles(volumes, n=LEVELS) if len(volumes) > 1 else []
+
+    days = []
+    counts = dict.fromkeys([DONE, IN_PROGRESS, MISSED, PLANNED, REST], 0)
+    for ordinal in range(start.toordinal(), end.toordinal() + 1):
+        date = datetime.date.fromordinal(ordinal)
+        level = 0
+        if date in worksheets:
+            done, name, volume = worksheets[date]
+            status = DONE if done else IN_PROGRESS
+            level = 1 + bisect.bisect_left(thresholds, volume) if volume else 1
+            title = f"{name}: volume {volume}"
+        elif date in planned:
+            status = MISSED if date < today else PLANNED
+            title = str(planned[date].workout)
+        else:
+            status = REST
+            title = "Rest day"
+
+        counts[status] += 1
+        days.append(Day(date, status, level, f"{date}: {title}"))
+
+    return days, counts
+
+def get_year(year):
+    """
+    The days of a year and the number of days by status (see build_year()),
+    cached until one of its worksheets, the schedule or, for the days to come,
+    the current day changes.
+    """
+    today = timezone.localdate()
+    # Changed by result updates too, see WorksheetManager.touch()
+    updated_at = Worksheet.objects.filter(
+        date__range=(datetime.date(year, 1, 1), datetime.date(year, 12, 31)),
+    ).aggregate(updated_at=Max('updated_at'))['updated_at']
+
+    key = f"worksheet:heatmap:{year}:{get_calendar_version()}:{updated_at and updated_at.timestamp()}"
+    if year >= today.year:
+        key += f":{today:%Y%m%d}"
+
+    return cache.get_or_set(key, lambda: build_year(year, today), timeout=24 * 60 * 60)
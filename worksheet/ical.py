@@ -0,0 +1,108 @@
+"""
+iCalendar (RFC 5545) feed of the training calendar: the scheduled workouts of
+the coming days, and the completed worksheets.
+"""
+import datetime
+
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Worksheet
+from .schedule import get_resolver
+
+PRODID = '-//workout_tracker//Workout calendar//EN'
+UID_DOMAIN = 'workout-tracker'
+
+def escape(text):
+    return (
+        str(text).replace('\\', '\\\\').replace(';', '\\;')
+        .replace(',', '\\,').replace('\n', '\\n')
+    )
+
+def fold(line):
+    """
+    Fold a content line to 75 octets per line, continuation lines starting
+    with a space.
+    """
+    encoded = line.encode()
+    if len(encoded) <= 75:
+        return line + '\r\n'
+
+    lines = []
+    limit = 75
+    while encoded:
+        # Don't split multi-byte characters
+        cut = min(limit, len(encoded))
+        while cut < len(encoded) and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        lines.append(encoded[:cut].decode())
+        encoded = encoded[cut:]
+        limit = 74
+
+    return '\r\n '.join(lines) + '\r\n'
+
+def _utc(value):
+    return value.astimezone(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+def _event(uid, stamp, properties):
+    lines = ['BEGIN:VEVENT', f'UID:{uid}@{UID_DOMAIN}', f'DTSTAMP:{stamp}']
+    lines += properties
+    lines.append('END:VEVENT')
+
+    return ''.join(fold(line) for line in lines)
+
+def generate(build_absolute_uri, days=28, chunk_size=500):
+    """
+    Yield the feed piece by piece: one event per completed worksheet, then one
+    all-day event per scheduled day in the `days` coming days (today
+    included) without a worksheet yet.
+    """
+    stamp = _utc(timezone.now())
+    today = timezone.localdate()
+
+    yield ''.join(fold(line) for line in [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        f'PRODID:{PRODID}',
+        'CALSCALE:GREGORIAN',
+        'X-WR-CALNAME:Workouts',
+    ])
+
+    worksheets = Worksheet.objects.filter(done=True).select_related('workout').only(
+        'date', 'done', 'started_at', 'ended_at', 'workout__name',
+    ).order_by('date')
+
+    for worksheet in worksheets.iterator(chunk_size=chunk_size):
+        properties = [
+            f'DTSTART:{_utc(worksheet.started_at)}',
+            f'SUMMARY:{escape(worksheet.workout.name)}',
+            f'URL:{build_absolute_uri(worksheet.get_absolute_url())}',
+        ]
+        # Worksheets closed through the admin area may not have an end date
+        if worksheet.ended_at is not None:
+            properties += [
+                f'DTEND:{_utc(worksheet.ended_at)}',
+                f'DESCRIPTION:{escape(f"Completed in {worksheet.get_duration()}")}',
+            ]
+
+        yield _event(f'worksheet-{worksheet.pk}', stamp, properties)
+
+    end = today + datetime.timedelta(days=days)
+    schedule = get_resolver().expand(today, end - datetime.timedelta(days=1))
+    # Worksheets planned ahead of time don't replace their scheduled day
+    planned = set(Worksheet.objects.filter(
+        date__range=(today, end), planned=False,
+    ).values_list('date', flat=True))
+
+    for date, day in schedule.items():
+        if date not in planned:
+            summary = f'{day.workout.name} (deload)' if day.deload else day.workout.name
+            yield _event(f'schedule-{date:%Y%m%d}', stamp, [
+                f'DTSTART;VALUE=DATE:{date:%Y%m%d}',
+                f'DTEND;VALUE=DATE:{date + datetime.timedelta(days=1):%Y%m%d}',
+                f'SUMMARY:{escape(summary)}',
+                'TRANSP:TRANSPARENT',
+                f'URL:{build_absolute_uri(reverse("worksheet:index"))}',
+            ])
+
+    yield fold('END:VCALENDAR')
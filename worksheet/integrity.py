@@ -0,0 +1,172 @@
+"""
+Consistency of the results of worksheets with the programs of their workouts.
+
+Worksheets get one result per exercise of their workout, in execution order
+(Workout.get_exercises_in_order()), when they are created. Interrupted
+creations, or programs edited afterwards, leave them with missing, extra or
+misordered results, which then get paired with the wrong previous results.
+Worksheets are checked in chunks (a few queries per chunk, programs being
+computed once per workout), and can be repaired in batches. Program edits are
+applied to the in progress worksheets of their workout the same way.
+"""
+from collections import defaultdict, deque, namedtuple
+
+from django.db import transaction
+from django.utils import timezone
+
+from .managers import get_display_order
+from .models import ArchivedResults, Result, Workout, Worksheet
+
+Discrepancy = namedtuple('Discrepancy', [
+    'worksheet_id', 'date', 'done', 'archived',
+    # Exercise ids of the missing and extra results, and whether the others
+    # are out of order
+    'missing', 'extra', 'misordered',
+    # For repairs: the expected exercise ids, the results matching them as
+    # (id, exercise_id, reps, weight) or None when missing, and the extra
+    # results, and whether the workout is a repeat one (for the display order)
+    'expected', 'aligned', 'extras', 'repeat',
+])
+
+def get_programs():
+    """
+    The exercise ids of every workout, in execution order.
+    """
+    return {
+        workout.pk: [exercise.pk for exercise in workout.get_exercises_in_order()]
+        for workout in Workout.objects.all()
+    }
+
+def compare(worksheet_id, date, done, archived, expected, results, repeat=False):
+    """
+    Compare results, as (id, exercise_id, reps, weight) in their order, with
+    the exercise ids expected by the program (of a repeat workout or not).
+    Results are matched on their exercise, in order. Return a Discrepancy, or
+    None.
+    """
+    pool = defaultdict(deque)
+    for index, result in enumerate(results):
+        pool[result[1]].append(index)
+
+    indices = [pool[exercise_id].popleft() if pool[exercise_id] else None for exercise_id in expected]
+    extras = [results[index] for index in sorted(index for queue in pool.values() for index in queue)]
+    missing = [exercise_id for exercise_id, index in zip(expected, indices) if index is None]
+    matched = [index for index in indices if index is not None]
+    misordered = matched != sorted(matched)
+
+    if not (missing or extras or misordered):
+        return None
+
+    return Discrepancy(
+        worksheet_id, date, done, archived, missing, [result[1] for result in extras], misordered,
+        expected, [results[index] if index is not None else None for index in indices], extras, repeat,
+    )
+
+def check(chunk_size=1000, worksheet_ids=None):
+    """
+    Yield (number of checked worksheets, discrepancies) for each chunk of
+    worksheets, by id. Archived results are checked too.
+    """
+    programs = get_programs()
+    worksheets = Worksheet.objects.order_by('pk')
+    if worksheet_ids is not None:
+        worksheets = worksheets.filter(pk__in=worksheet_ids)
+
+    last = 0
+    while True:
+        chunk = list(worksheets.filter(pk__gt=last).values_list(
+            'pk', 'date', 'workout', 'done', 'archive__results', 'workout__repeat',
+        )[:chunk_size])
+        if not chunk:
+            return
+        last = chunk[-1][0]
+
+        results = defaultdict(list)
+        for worksheet_id, *result in Result.objects.filter(
+            worksheet__in=[row[0] for row in chunk if row[4] is None],
+        ).order_by('worksheet', '_order').values_list('worksheet', 'pk', 'exercise', 'reps', 'weight'):
+            results[worksheet_id].append(tuple(result))
+
+        discrepancies = []
+        for pk, date, workout_id, done, archive, repeat in chunk:
+            if archive is not None:
+                entries = [(None, *entry) for entry in ArchivedResults(results=archive).unpack()]
+            else:
+                entries = results[pk]
+
+            discrepancy = compare(pk, date, done, archive is not None, programs[workout_id], entries, repeat)
+            if discrepancy is not None:
+                discrepancies.append(discrepancy)
+
+        yield len(chunk), discrepancies
+
+        if len(chunk) < chunk_size:
+            return
+
+def repair(discrepancies):
+    """
+    Repair the results of (non archived) worksheets in a single transaction:
+    create the missing results, delete the extra ones without any value
+    (extra results with values are kept, after the others), and renumber
+    them in program order (display order included). Return the number of
+    repaired worksheets. Values of the existing results are kept.
+    """
+    discrepancies = [discrepancy for discrepancy in discrepancies if not discrepancy.archived]
+
+    created, deleted, ordered = [], [], []
+    for discrepancy in discrepancies:
+        kept = []
+        for result in discrepancy.extras:
+            if result[2] is None and result[3] is None:
+                deleted.append(result[0])
+            else:
+                kept.append(result)
+
+        results = [
+            *zip(discrepancy.expected, discrepancy.aligned),
+            *((result[1], result) for result in kept),
+        ]
+        display = get_display_order([exercise_id for exercise_id, _ in results], discrepancy.repeat)
+        for order, ((exercise_id, result), (display_order, round)) in enumerate(zip(results, display)):
+            if result is None:
+                created.append(Result(worksheet_id=discrepancy.worksheet_id, exercise_id=exercise_id,
+                                      _order=order, display_order=display_order, round=round))
+            else:
+                ordered.append(Result(pk=result[0], _order=order, display_order=display_order, round=round))
+
+    with transaction.atomic():
+        Result.objects.filter(pk__in=deleted).delete()
+        Result.objects.bulk_create(created)
+        Result.objects.bulk_update(ordered, ['_order', 'display_order', 'round'], batch_size=500)
+        # Cached pages depending on their results
+        Worksheet.objects.filter(
+            pk__in=[discrepancy.worksheet_id for discrepancy in discrepancies],
+        ).update(updated_at=timezone.now())
+
+    return len(discrepancies)
+
+def propagate(workout):
+    """
+    Apply the program of a workout to its in progress (non archived)
+    worksheets, e.g. after it was edited: results of new exercises are
+    inserted, those of removed exercises deleted (or moved to the end when
+    they have values) and the others reordered, keeping their values. Each
+    worksheet is updated in its own transaction, when not called inside
+    another one (e.g. on commit). Return the number of updated worksheets.
+    """
+    expected = [exercise.pk for exercise in workout.get_exercises_in_order()]
+    worksheets = Worksheet.objects.filter(
+        workout=workout, done=False, archive__isnull=True,
+    ).order_by('pk').values_list('pk', 'date')
+
+    updated = 0
+    for pk, date in worksheets:
+        with transaction.atomic():
+            results = list(Result.objects.filter(worksheet=pk).order_by('_order').values_list(
+                'pk', 'exercise', 'reps', 'weight',
+            ))
+            discrepancy = compare(pk, date, False, False, expected, results, workout.repeat)
+            if discrepancy is not None:
+                updated += repair([discrepancy])
+
+    return updated
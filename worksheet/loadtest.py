@@ -0,0 +1,86 @@
+"""
+Client side of the loadtest management command: simulated users, free of any
+Django import so that they can run in spawned processes.
+"""
+import http.cookiejar
+import math
+import random
+import re
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+RESULT_URL_RE = re.compile(r'hx-post="(/worksheet/\d+/result/\d+/(?:reps|weight))"')
+CLOSE_URL_RE = re.compile(r'action="(/worksheet/\d+/close)"')
+LOCKED = 'database is locked'
+
+def percentile(values, p):
+    """
+    Nearest-rank percentile of sorted values.
+    """
+    if not values:
+        return None
+
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+def simulate_user(base_url, worksheet_path, updates, think, reload_every, seed):
+    """
+    One user going through a workout: open the index, create (or join) the
+    worksheet of the day, fill its results with some pacing, reloading the
+    page from time to time, then close it. Return the samples as (action,
+    seconds, error) tuples, error being None, an HTTP status or an exception
+    message.
+    """
+    rng = random.Random(seed)
+    cookies = http.cookiejar.CookieJar()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(cookies))
+    samples = []
+
+    def request(action, path, data=None):
+        headers = {}
+        token = next((c.value for c in cookies if c.name == 'csrftoken'), None)
+        if token is not None:
+            headers['X-CSRFToken'] = token
+        if data is not None:
+            data = urllib.parse.urlencode(data).encode()
+
+        start = time.perf_counter()
+        body, error = '', None
+        try:
+            with opener.open(urllib.request.Request(base_url + path, data, headers), timeout=60) as response:
+                body = response.read().decode()
+        except urllib.error.HTTPError as e:
+            body = e.read().decode(errors='replace')
+            error = LOCKED if LOCKED in body else e.code
+        except OSError as e:
+            error = str(e)
+        samples.append((action, time.perf_counter() - start, error))
+
+        return body
+
+    def pause():
+        if think > 0:
+            time.sleep(rng.uniform(think / 2, think * 3 / 2))
+
+    request('index', '/')
+    page = request('create', '/worksheet/', {})
+    result_urls = RESULT_URL_RE.findall(page)
+    close_urls = CLOSE_URL_RE.findall(page)
+
+    if result_urls:
+        for n in range(updates):
+            pause()
+            url = rng.choice(result_urls)
+            field = url.rsplit('/', 1)[1]
+            value = rng.randint(1, 20) if field == 'reps' else rng.randint(0, 100)
+            request('update', url, {field: value})
+
+            if reload_every and (n + 1) % reload_every == 0:
+                request('reload', worksheet_path)
+
+    if close_urls:
+        pause()
+        request('close', close_urls[0], {})
+
+    return samples
@@ -0,0 +1,40 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils import timezone
+
+from worksheet.models import Result, Worksheet
+
+class Command(BaseCommand):
+    help = (
+        "Move the results of old, closed worksheets into the archive table "
+        "(one packed row per worksheet) to keep the result table small."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=getattr(settings, 'ARCHIVE_AFTER_DAYS', 180),
+                            help="Archive worksheets older than this number of days.")
+        parser.add_argument('--keep', type=int, default=getattr(settings, 'ARCHIVE_KEEP_PER_WORKOUT', 3),
+                            help="Number of recent worksheets of each workout never archived.")
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help="Number of worksheets archived per transaction.")
+        parser.add_argument('--vacuum', action='store_true',
+                            help="Reclaim the space freed in the result table afterwards.")
+
+    def handle(self, *args, **options):
+        before = timezone.localdate() - datetime.timedelta(days=options['days'])
+        archived = Worksheet.objects.archive(
+            before, keep=options['keep'], batch_size=options['batch_size'],
+        )
+        self.stdout.write(f"Archived {archived} worksheet(s) older than {before}")
+
+        if options['vacuum'] and archived:
+            connection = connections[DEFAULT_DB_ALIAS]
+            with connection.cursor() as cursor:
+                if connection.vendor == 'postgresql':
+                    cursor.execute(f"VACUUM ANALYZE {connection.ops.quote_name(Result._meta.db_table)}")
+                else:
+                    cursor.execute("VACUUM")
+            self.stdout.write("Vacuumed the database")
@@ -0,0 +1,50 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils import timezone
+
+from worksheet.backup import BackupError, pg_backup, sqlite_backup
+
+class Command(BaseCommand):
+    help = (
+        "Back up the database while the app is running: SQLite databases are "
+        "copied with the online backup API, PostgreSQL ones with COPY."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'output', nargs='?',
+            help="Backup file (SQLite) or directory (PostgreSQL). Defaults to "
+                 "a timestamped name in BACKUP_DIR.",
+        )
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS,
+                            help="Database alias to back up.")
+        parser.add_argument('--pages', type=int, default=64,
+                            help="SQLite pages copied per step.")
+        parser.add_argument('--sleep', type=float, default=0.005,
+                            help="Pause between two SQLite steps, in seconds.")
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        output = options['output']
+        if output is None:
+            timestamp = timezone.now().strftime('%Y%m%dT%H%M%S')
+            suffix = '.sqlite3' if connection.vendor == 'sqlite' else ''
+            backup_dir = Path(getattr(settings, 'BACKUP_DIR', settings.BASE_DIR / 'backups'))
+            backup_dir.mkdir(parents=True, exist_ok=True)
+            output = backup_dir / f"{options['database']}-{timestamp}{suffix}"
+
+        try:
+            match connection.vendor:
+                case 'sqlite':
+                    stats = sqlite_backup(connection, output, options['pages'], options['sleep'])
+                case 'postgresql':
+                    stats = pg_backup(connection, output)
+                case vendor:
+                    raise CommandError(f"Unsupported database: {vendor}")
+        except (BackupError, OSError) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(f"Backed up to {output}: {stats}"))
@@ -0,0 +1,91 @@
+import datetime
+import re
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.middleware.csrf import get_token
+from django.template import engines
+from django.template.utils import InvalidTemplateEngineError
+from django.test import RequestFactory
+from django.utils import timezone
+
+from worksheet.models import Exercise, Result, Workout, Worksheet
+
+ENGINES = ['django', 'jinja2']
+
+CSRF_RE = re.compile(r'name="csrfmiddlewaretoken" value="[^"]+"')
+
+def build_context(rows, repeat):
+    """
+    An in-progress worksheet of `rows` results (unsaved instances, so that
+    only rendering is measured), with previous results, 4 results per
+    exercise for repeat workouts.
+    """
+    workout = Workout(pk=1, name="Benchmark", repeat=repeat)
+    worksheet = Worksheet(pk=1, workout=workout, started_at=timezone.now() - datetime.timedelta(minutes=30))
+    previous = Worksheet(pk=2, workout=workout, done=True)
+
+    results = []
+    for n in range(rows):
+        position = n // 4 if repeat else n
+        exercise = Exercise(pk=position + 1, name=f"Exercise {position + 1}", weight=position % 2 == 0)
+        result = Result(pk=n + 1, worksheet=worksheet, exercise=exercise,
+                        reps=8 if n % 3 else None, weight=20 if exercise.weight else None)
+        result.previous = Result(pk=rows + n + 1, worksheet=previous, exercise=exercise, reps=6, weight=15)
+        results.append(result)
+
+    return {'worksheet': worksheet, 'results': results}
+
+class Command(BaseCommand):
+    help = (
+        "Compare the rendering times of the worksheet pages with the Django "
+        "and Jinja2 templates, for several numbers of results, and check "
+        "that both engines render the same pages."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[10, 50, 200],
+                            help="Numbers of results of the rendered worksheets.")
+        parser.add_argument('--iterations', type=int, default=50,
+                            help="Number of renders per engine and worksheet size.")
+        parser.add_argument('--repeat-workout', action='store_true',
+                            help="Render repeat workouts (results grouped by exercise).")
+
+    def handle(self, *args, **options):
+        try:
+            templates = {
+                name: engines[name].get_template(
+                    'worksheet/worksheet_repeat.html' if options['repeat_workout'] else 'worksheet/worksheet.html'
+                )
+                for name in ENGINES
+            }
+        except InvalidTemplateEngineError:
+            raise CommandError("The jinja2 template engine isn't configured (is Jinja2 installed?)")
+
+        request = RequestFactory().get('/')
+        # The same CSRF token for every render
+        get_token(request)
+
+        self.stdout.write(
+            f"{'Rows':>6}{'Django ms':>12}{'Jinja2 ms':>12}{'Speedup':>10}{'Identical':>11}"
+        )
+        for rows in options['rows']:
+            context = build_context(rows, options['repeat_workout'])
+
+            timings, outputs = {}, {}
+            for name, template in templates.items():
+                outputs[name] = CSRF_RE.sub('', template.render(context, request))
+
+                durations = []
+                for _ in range(options['iterations']):
+                    start = time.perf_counter()
+                    template.render(context, request)
+                    durations.append(time.perf_counter() - start)
+                timings[name] = statistics.median(durations) * 1000
+
+            self.stdout.write(
+                f"{rows:>6}{timings['django']:>12.2f}{timings['jinja2']:>12.2f}"
+                f"{timings['django'] / timings['jinja2']:>9.1f}x"
+                f"{'yes' if outputs['django'] == outputs['jinja2'] else 'NO':>11}"
+            )
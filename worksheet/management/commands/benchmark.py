@@ -0,0 +1,88 @@
+import json
+import platform
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from worksheet import benchmarks, events
+
+class Command(BaseCommand):
+    help = (
+        "Time the model and manager hot paths (exercise ordering, worksheet "
+        "creation and closing, calendar of the index...) on a throwaway copy "
+        "of the schema, at several history sizes. "
+        "Results can be saved as a baseline, and later runs compared with it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[0, 100, 1000],
+                            help="Numbers of past worksheets in the database.")
+        parser.add_argument('--only', nargs='+', choices=benchmarks.get_benchmarks(), metavar='NAME',
+                            help=f"Only run these benchmarks: {', '.join(benchmarks.get_benchmarks())}.")
+        parser.add_argument('--number', type=int, default=20,
+                            help="Number of calls per round.")
+        parser.add_argument('--repeat', type=int, default=5,
+                            help="Number of rounds, the median round is reported.")
+        parser.add_argument('--json', action='store_true',
+                            help="Write the results as JSON.")
+        parser.add_argument('--save-baseline', metavar='FILE',
+                            help="Save the results as a baseline.")
+        parser.add_argument('--baseline', metavar='FILE',
+                            help="Compare the results with a saved baseline, and fail on regressions.")
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help="Slowdown tolerated before reporting a regression (0.2 = 20%%).")
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            try:
+                with open(options['baseline']) as f:
+                    baseline = json.load(f)['results']
+            except (OSError, ValueError, KeyError) as e:
+                raise CommandError(f"Could not read the baseline: {e}")
+
+        with benchmarks.throwaway_database():
+            try:
+                benchmarks.setup_workouts()
+                results = benchmarks.run(
+                    options['sizes'], options['only'], number=options['number'], repeat=options['repeat'],
+                )
+            finally:
+                # Closed worksheets log nothing, but flush anyway before the
+                # database goes away
+                events.flush()
+
+        report = {
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+            },
+            'results': results,
+        }
+
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w') as f:
+                json.dump(report, f, indent=2)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self._write_table(results, baseline)
+
+        if baseline is not None:
+            regressions = benchmarks.compare(results, baseline, options['tolerance'])
+            for key, before, after, ratio in regressions:
+                self.stderr.write(f"Regression: {key} {before:.1f}us -> {after:.1f}us ({ratio:.2f}x)")
+            if regressions:
+                raise CommandError(f"{len(regressions)} benchmark(s) slower than the baseline")
+
+    def _write_table(self, results, baseline):
+        self.stdout.write(f"{'Benchmark':<40}{'Median us':>12}{'Min us':>12}{'Baseline':>12}")
+        for key, result in results.items():
+            before = baseline.get(key, {}).get('median') if baseline else None
+            self.stdout.write(
+                f"{key:<40}{result['median']:>12.1f}{result['min']:>12.1f}"
+                + (f"{result['median'] / before:>11.2f}x" if before else f"{'-':>12}")
+            )
@@ -0,0 +1,113 @@
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# What a worker does before being able to serve its first request
+STARTUP_CODE = """
+from django.core.wsgi import get_wsgi_application
+from django.urls import get_resolver
+
+get_wsgi_application()
+get_resolver().url_patterns
+"""
+
+def parse_importtime(output):
+    """
+    Parse the output of `python -X importtime` into a list of
+    (name, depth, self_us, cumulative_us) tuples.
+    """
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        # The header line
+        if not self_us.strip().isdigit():
+            continue
+
+        # Nested imports are indented by 2 spaces per level, after the
+        # separator's own space
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        imports.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+
+    return imports
+
+class Command(BaseCommand):
+    help = (
+        "Measure the import time and cold-start time of a worker, and fail if "
+        "they exceed STARTUP_IMPORT_BUDGET or STARTUP_COLDSTART_BUDGET."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=3,
+                            help="Number of fresh interpreters to start, the median is kept.")
+        parser.add_argument('--top', type=int, default=10,
+                            help="Number of slowest top-level imports to display.")
+        parser.add_argument('--profile', default='production',
+                            help="Value of WORKOUT_TRACKER_ENV for the measured worker.")
+        parser.add_argument('--import-budget', type=float,
+                            default=getattr(settings, 'STARTUP_IMPORT_BUDGET', None),
+                            help="Import time budget, in milliseconds.")
+        parser.add_argument('--coldstart-budget', type=float,
+                            default=getattr(settings, 'STARTUP_COLDSTART_BUDGET', None),
+                            help="Cold-start time budget, in milliseconds.")
+
+    def handle(self, *args, **options):
+        if options['runs'] < 1:
+            raise CommandError("At least one run is needed")
+
+        env = os.environ.copy()
+        # Only the startup is measured, the measured worker doesn't need the
+        # real key of the production profile
+        env.setdefault('WORKOUT_TRACKER_SECRET_KEY', 'check-startup')
+        env.update({
+            'WORKOUT_TRACKER_ENV': options['profile'],
+            'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'workout_tracker.settings'),
+            'PYTHONPATH': os.pathsep.join(filter(None, [str(settings.BASE_DIR), env.get('PYTHONPATH')])),
+        })
+
+        import_times = []
+        coldstart_times = []
+        for _ in range(options['runs']):
+            start = time.perf_counter()
+            process = subprocess.run(
+                [sys.executable, '-X', 'importtime', '-c', STARTUP_CODE],
+                env=env, capture_output=True, text=True,
+            )
+            coldstart_times.append((time.perf_counter() - start) * 1000)
+
+            if process.returncode != 0:
+                raise CommandError(f"Worker failed to start:\n{process.stderr}")
+
+            imports = parse_importtime(process.stderr)
+            import_times.append(sum(cumul for _, depth, _, cumul in imports if depth == 0) / 1000)
+
+        import_time = statistics.median(import_times)
+        coldstart_time = statistics.median(coldstart_times)
+
+        self.stdout.write(f"Profile: {options['profile']} ({options['runs']} runs)")
+        self.stdout.write(f"Import time: {import_time:.0f} ms")
+        self.stdout.write(f"Cold start: {coldstart_time:.0f} ms")
+
+        if options['top']:
+            self.stdout.write("Slowest top-level imports (last run):")
+            top_level = sorted((i for i in imports if i[1] == 0), key=lambda i: i[3], reverse=True)
+            for name, _, _, cumul in top_level[:options['top']]:
+                self.stdout.write(f"  {cumul / 1000:8.1f} ms  {name}")
+
+        errors = []
+        if options['import_budget'] is not None and import_time > options['import_budget']:
+            errors.append(f"import time {import_time:.0f} ms > {options['import_budget']:.0f} ms")
+        if options['coldstart_budget'] is not None and coldstart_time > options['coldstart_budget']:
+            errors.append(f"cold start {coldstart_time:.0f} ms > {options['coldstart_budget']:.0f} ms")
+
+        if errors:
+            raise CommandError(f"Startup budget exceeded: {', '.join(errors)}")
+
+        self.stdout.write(self.style.SUCCESS("Startup within budget"))
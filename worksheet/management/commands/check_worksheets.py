@@ -0,0 +1,58 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from worksheet import integrity
+
+class Command(BaseCommand):
+    help = (
+        "Compare the results of every worksheet with the program of its "
+        "workout, and report the missing, extra and misordered ones. With "
+        "--repair, in progress worksheets (and closed ones with "
+        "--include-done) are fixed, one transaction per chunk. Archived "
+        "worksheets are only reported."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help="Number of worksheets checked (and repaired) at once.")
+        parser.add_argument('--repair', action='store_true',
+                            help="Repair the worksheets with discrepancies.")
+        parser.add_argument('--include-done', action='store_true',
+                            help="Repair closed worksheets as well.")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        checked = found = repaired = 0
+
+        for count, discrepancies in integrity.check(chunk_size=options['chunk_size']):
+            checked += count
+            found += len(discrepancies)
+            for discrepancy in discrepancies:
+                self.stdout.write(self.describe(discrepancy))
+
+            if options['repair']:
+                repaired += integrity.repair([
+                    discrepancy for discrepancy in discrepancies
+                    if options['include_done'] or not discrepancy.done
+                ])
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"Checked {checked} worksheet(s) in {elapsed:.2f}s "
+            f"({checked / elapsed if elapsed else 0:.0f}/s): {found} with discrepancies"
+            + (f", {repaired} repaired" if options['repair'] else "")
+        )
+
+    def describe(self, discrepancy):
+        problems = []
+        if discrepancy.missing:
+            problems.append(f"missing exercise(s) {', '.join(map(str, discrepancy.missing))}")
+        if discrepancy.extra:
+            problems.append(f"extra exercise(s) {', '.join(map(str, discrepancy.extra))}")
+        if discrepancy.misordered:
+            problems.append("misordered results")
+
+        status = "archived" if discrepancy.archived else "done" if discrepancy.done else "in progress"
+
+        return f"Worksheet {discrepancy.worksheet_id} ({discrepancy.date}, {status}): {'; '.join(problems)}"
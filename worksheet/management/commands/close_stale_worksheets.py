@@ -0,0 +1,31 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from worksheet.models import Worksheet
+
+class Command(BaseCommand):
+    help = (
+        "Close the worksheets in progress without any activity for a while, "
+        "with a single UPDATE. They are ended at their last activity."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=getattr(settings, 'AUTO_CLOSE_AFTER_HOURS', 24),
+                            help="Close worksheets without activity for this number of hours.")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Only list the worksheets that would be closed.")
+
+    def handle(self, *args, **options):
+        before = timezone.now() - datetime.timedelta(hours=options['hours'])
+        stale = Worksheet.objects.get_stale(before)
+
+        if options['dry_run']:
+            for worksheet in stale.select_related('workout').order_by('date'):
+                self.stdout.write(f"{worksheet} (last activity {timezone.localtime(worksheet.updated_at):%Y-%m-%d %H:%M})")
+            return
+
+        closed = Worksheet.objects.close_all(stale)
+        self.stdout.write(f"Closed {len(closed)} worksheet(s) without activity since {timezone.localtime(before):%Y-%m-%d %H:%M}")
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from worksheet import events
+
+class Command(BaseCommand):
+    help = (
+        "Pack the set events of closed worksheets into their log (one row "
+        "per worksheet, with a summary of the session), and drop the events "
+        "of deleted worksheets. Closed worksheets are compacted by the task "
+        "queue, this catches up on the events logged afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help="Number of worksheets compacted per transaction.")
+
+    def handle(self, *args, **options):
+        compacted = events.compact(batch_size=options['batch_size'])
+        self.stdout.write(f"Compacted the set events of {compacted} worksheet(s)")
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from worksheet.search import rebuild_index
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the search index of the exercise library, e.g. after a bulk "
+        "import."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Number of exercises indexed per transaction.")
+
+    def handle(self, *args, **options):
+        indexed = rebuild_index(options['batch_size'])
+        self.stdout.write(f"Indexed {indexed} exercise(s)")
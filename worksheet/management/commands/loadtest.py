@@ -0,0 +1,169 @@
+import multiprocessing
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.core.signals import got_request_exception
+from django.core.wsgi import get_wsgi_application
+from django.test import override_settings
+from django.utils import timezone
+
+from worksheet import events
+from worksheet.benchmarks import throwaway_database
+from worksheet.loadtest import LOCKED, percentile, simulate_user
+from worksheet.models import Exercise, Program, Schedule, Workout, Worksheet
+
+ACTIONS = ['index', 'create', 'update', 'reload', 'close']
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+class Command(BaseCommand):
+    help = (
+        "Simulate concurrent users going through a workout (create the "
+        "worksheet, update its results, reload it, close it), and report "
+        "throughput, latency percentiles and errors. By default, a local "
+        "server is started on a throwaway copy of the schema, so that "
+        "settings can be compared: run it with the "
+        "production profile for realistic figures."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=8,
+                            help="Number of concurrent users.")
+        parser.add_argument('--rounds', type=int, default=3,
+                            help="Number of workouts per user (the worksheet is deleted between rounds).")
+        parser.add_argument('--updates', type=int, default=40,
+                            help="Number of result updates per user and round.")
+        parser.add_argument('--think', type=float, default=0.05,
+                            help="Average pause between two actions of a user, in seconds.")
+        parser.add_argument('--reload-every', type=int, default=10,
+                            help="Reload the worksheet page every N updates (0 to never reload).")
+        parser.add_argument('--exercises', type=int, default=8,
+                            help="Number of exercises of the workout of the throwaway database.")
+        parser.add_argument('--pool', choices=['thread', 'process'], default='thread',
+                            help="Run users in threads, or in processes.")
+        parser.add_argument('--url',
+                            help="Load test a running server instead (e.g. http://127.0.0.1:8000), "
+                                 "acting on today's worksheet. Only one round is possible.")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['users'] < 1:
+            raise CommandError("At least one user is needed")
+        if options['url'] and options['rounds'] != 1:
+            raise CommandError("Only one round can be run against a running server (--rounds 1)")
+
+        self.exceptions = defaultdict(int)
+        if options['url']:
+            self._run(options['url'].rstrip('/'), options)
+            return
+
+        # The production profile only allows its own host names
+        allowed_hosts = override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, '127.0.0.1'])
+        with throwaway_database(), allowed_hosts:
+            got_request_exception.connect(self._count_exception)
+            try:
+                self._setup_workout(options['exercises'])
+
+                server = ThreadedWSGIServer(('127.0.0.1', 0), QuietRequestHandler)
+                server.set_app(get_wsgi_application())
+                threading.Thread(target=server.serve_forever, daemon=True).start()
+                try:
+                    self._run(f"http://127.0.0.1:{server.server_port}", options)
+                finally:
+                    server.shutdown()
+                    server.server_close()
+            finally:
+                got_request_exception.disconnect(self._count_exception)
+                # Write the buffered set events before the database goes away
+                events.flush()
+
+    def _count_exception(self, sender, request=None, **kwargs):
+        exc = sys.exc_info()[1]
+        self.exceptions[f"{type(exc).__name__}: {exc}"] += 1
+
+    def _setup_workout(self, count):
+        workout = Workout.objects.create(name="Load test")
+        for n in range(count):
+            exercise = Exercise.objects.create(name=f"Exercise {n + 1}", weight=n % 2 == 0)
+            Program.objects.create(workout=workout, exercise=exercise)
+        Schedule.objects.create(day=timezone.localdate().isoweekday(), workout=workout)
+
+    def _run(self, base_url, options):
+        users = options['users']
+        if options['pool'] == 'thread':
+            pool = ThreadPoolExecutor(users)
+        else:
+            # Forking a process running the server threads isn't safe
+            pool = ProcessPoolExecutor(users, mp_context=multiprocessing.get_context('spawn'))
+            # Don't time the start of the processes
+            list(pool.map(abs, range(users)))
+
+        today = timezone.localdate()
+        worksheet_path = f"/worksheet/{today.year}/{today.month}/{today.day}/"
+
+        samples = []
+        start = time.perf_counter()
+        with pool:
+            for n in range(options['rounds']):
+                futures = [
+                    pool.submit(simulate_user, base_url, worksheet_path, options['updates'],
+                                options['think'], options['reload_every'],
+                                options['seed'] * 10000 + n * users + user)
+                    for user in range(users)
+                ]
+                for future in futures:
+                    samples.extend(future.result())
+
+                if not options['url']:
+                    # A new worksheet for the next round
+                    Worksheet.objects.filter(date=timezone.localdate()).delete()
+        duration = time.perf_counter() - start
+
+        self._report(samples, duration, options)
+
+    def _report(self, samples, duration, options):
+        self.stdout.write(
+            f"{options['users']} {options['pool']}(s), {options['rounds']} round(s), "
+            f"{len(samples)} requests in {duration:.2f}s: {len(samples) / duration:.1f} req/s"
+        )
+        self.stdout.write(
+            f"{'Action':<10}{'Requests':>10}{'Errors':>8}{'Locked':>8}"
+            f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+        )
+        for action in ACTIONS + ['total']:
+            rows = samples if action == 'total' else [sample for sample in samples if sample[0] == action]
+            if not rows:
+                continue
+
+            latencies = sorted(seconds * 1000 for _, seconds, _ in rows)
+            errors = [error for _, _, error in rows if error is not None]
+            locked = sum(1 for error in errors if error == LOCKED)
+            self.stdout.write(
+                f"{action:<10}{len(rows):>10}{len(errors):>8}{locked:>8}"
+                + ''.join(f"{value:>10.1f}" for value in [
+                    percentile(latencies, 50), percentile(latencies, 95),
+                    percentile(latencies, 99), latencies[-1],
+                ])
+            )
+
+        errors = defaultdict(int)
+        for _, _, error in samples:
+            if error is not None:
+                errors[str(error)] += 1
+        self.stdout.write(f"Error rate: {sum(errors.values()) / len(samples):.2%}")
+
+        # Client side (HTTP statuses, connection errors), then server side
+        # exceptions when the server runs in this process
+        for message, count in [
+            *sorted(errors.items(), key=lambda item: -item[1]),
+            *sorted(self.exceptions.items(), key=lambda item: -item[1]),
+        ]:
+            self.stdout.write(f"  {count} x {message}")
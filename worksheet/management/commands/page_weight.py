@@ -0,0 +1,100 @@
+import gzip
+import posixpath
+import re
+from html.parser import HTMLParser
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from workout_tracker.storage import CSS_IMPORT_RE
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+class AssetParser(HTMLParser):
+    """
+    Collect the static assets referenced by a page.
+    """
+    def __init__(self):
+        super().__init__()
+        self.assets = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'link' and attrs.get('rel') == 'stylesheet':
+            self.assets.append(attrs['href'])
+        elif tag in ('script', 'img') and attrs.get('src'):
+            self.assets.append(attrs['src'])
+
+class Command(BaseCommand):
+    help = (
+        "Report the weight (raw and compressed) and the number of requests "
+        "needed to load the main pages with their static assets."
+    )
+
+    def handle(self, *args, **options):
+        host = settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS else 'localhost'
+        # Not an INTERNAL_IPS address, so that the debug toolbar isn't counted
+        client = Client(HTTP_HOST=host.lstrip('.') or 'localhost', REMOTE_ADDR='192.0.2.1')
+        today = timezone.localdate()
+
+        pages = {
+            'index': reverse('worksheet:index'),
+            'worksheet': reverse('worksheet:worksheet', args=[today.year, today.month, today.day]),
+        }
+
+        self.stdout.write(f"{'Page':<12}{'Requests':>10}{'Raw':>12}{'gzip':>12}{'brotli':>12}")
+        for name, url in pages.items():
+            response = client.get(url)
+            if response.status_code != 200:
+                raise CommandError(f"{url} returned {response.status_code}")
+
+            parser = AssetParser()
+            parser.feed(response.content.decode())
+
+            contents = [response.content]
+            assets = list(parser.assets)
+            while assets:
+                asset = assets.pop(0)
+                content = self._read(asset)
+                contents.append(content)
+
+                # Stylesheet imports are requests too
+                if asset.split('?')[0].endswith('.css'):
+                    assets.extend(
+                        posixpath.join(posixpath.dirname(asset), imported)
+                        for imported in CSS_IMPORT_RE.findall(content.decode())
+                    )
+
+            raw = sum(len(c) for c in contents)
+            gzipped = sum(len(gzip.compress(c)) for c in contents)
+            brotlied = f"{sum(len(brotli.compress(c)) for c in contents):,}" if brotli else '-'
+
+            self.stdout.write(f"{name:<12}{len(contents):>10}{raw:>12,}{gzipped:>12,}{brotlied:>12}")
+
+    def _read(self, url):
+        static_url = '/' + settings.STATIC_URL.lstrip('/')
+        if not url.startswith(static_url):
+            raise CommandError(f"Not a static file: {url}")
+
+        path = re.sub(r'[?#].*$', '', url[len(static_url):])
+
+        # Source files first, fingerprinted files and bundles only exist once
+        # collected
+        absolute_path = finders.find(path)
+        if absolute_path is not None:
+            with open(absolute_path, 'rb') as f:
+                return f.read()
+
+        if not staticfiles_storage.exists(path):
+            raise CommandError(f"Static file not found: {path}")
+
+        with staticfiles_storage.open(path) as f:
+            return f.read()
@@ -0,0 +1,31 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from worksheet.models import Worksheet
+
+class Command(BaseCommand):
+    help = (
+        "Plan a training block: create the worksheets scheduled over a range "
+        "of days ahead of time, with their results, in a couple of bulk "
+        "INSERTs. Planned worksheets are started from the index, on their day."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=datetime.date.fromisoformat,
+                            help="First day of the block (YYYY-MM-DD), tomorrow by default.")
+        parser.add_argument('--weeks', type=int, default=4,
+                            help="Length of the block, in weeks.")
+        parser.add_argument('--targets', action='store_true',
+                            help="Fill the results with the values of the last session of their workout.")
+
+    def handle(self, *args, **options):
+        if options['weeks'] < 1:
+            raise CommandError("A block lasts at least one week")
+
+        start = options['start'] or timezone.localdate() + datetime.timedelta(days=1)
+        end = start + datetime.timedelta(weeks=options['weeks'], days=-1)
+
+        worksheets = Worksheet.objects.plan(start, end, targets=options['targets'])
+        self.stdout.write(f"Planned {len(worksheets)} worksheet(s) from {start} to {end}")
@@ -0,0 +1,44 @@
+import pstats
+
+from django.core.management.base import BaseCommand, CommandError
+
+from workout_tracker.middleware.profiling import get_profiling_dir
+
+class Command(BaseCommand):
+    help = "Aggregate the profiles written by ProfilingMiddleware into the top-N hot functions."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'views', nargs='*',
+            help="View names to report on (e.g. worksheet:result). Defaults to all of them.",
+        )
+        parser.add_argument('--top', type=int, default=20, help="Number of functions to display.")
+        parser.add_argument(
+            '--sort', default='cumulative', choices=['cumulative', 'tottime', 'ncalls'],
+            help="Sort key for the report.",
+        )
+
+    def handle(self, *args, **options):
+        directory = get_profiling_dir()
+        if not directory.is_dir():
+            raise CommandError(f"No profiles found in {directory}")
+
+        if options['views']:
+            view_dirs = [directory / view.replace(':', '.') for view in options['views']]
+        else:
+            view_dirs = sorted(d for d in directory.iterdir() if d.is_dir())
+
+        for view_dir in view_dirs:
+            profiles = sorted(view_dir.glob('*.prof'))
+            if not profiles:
+                self.stderr.write(f"No profiles for {view_dir.name}")
+                continue
+
+            stats = pstats.Stats(str(profiles[0]), stream=self.stdout)
+            for profile in profiles[1:]:
+                stats.add(str(profile))
+
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"{view_dir.name.replace('.', ':')} ({len(profiles)} requests)"
+            ))
+            stats.strip_dirs().sort_stats(options['sort']).print_stats(options['top'])
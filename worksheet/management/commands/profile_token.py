@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+
+from workout_tracker.middleware.profiling import QUERY_FLAG, make_token
+
+class Command(BaseCommand):
+    help = "Print a signed query flag forcing the profiling of a request."
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"?{QUERY_FLAG}={make_token()}")
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from worksheet.backup import BackupError, pg_restore, sqlite_restore
+
+class Command(BaseCommand):
+    help = (
+        "Restore a backup made by backup_db, after verifying its checksum. "
+        "The current content of the database is replaced."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help="Backup file (SQLite) or directory (PostgreSQL).")
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS,
+                            help="Database alias to restore into.")
+        parser.add_argument('--pages', type=int, default=64,
+                            help="SQLite pages copied per step.")
+        parser.add_argument('--sleep', type=float, default=0.005,
+                            help="Pause between two SQLite steps, in seconds.")
+        parser.add_argument('--noinput', '--no-input', action='store_false', dest='interactive',
+                            help="Do not prompt for confirmation.")
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+
+        if options['interactive']:
+            confirm = input(
+                f"This will replace the content of the '{options['database']}' "
+                f"database with {options['input']}.\nType 'yes' to continue: "
+            )
+            if confirm != 'yes':
+                raise CommandError("Restore cancelled.")
+
+        try:
+            match connection.vendor:
+                case 'sqlite':
+                    stats = sqlite_restore(connection, options['input'], options['pages'], options['sleep'])
+                case 'postgresql':
+                    stats = pg_restore(connection, options['input'])
+                case vendor:
+                    raise CommandError(f"Unsupported database: {vendor}")
+        except (BackupError, OSError) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(f"Restored {options['input']}: {stats}"))
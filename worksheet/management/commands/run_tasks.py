@@ -0,0 +1,66 @@
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from worksheet import taskqueue
+
+class Command(BaseCommand):
+    help = (
+        "Run the deferred tasks of the queue with a pool of threads, until "
+        "interrupted. Any number of workers can run at the same time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=getattr(settings, 'TASK_WORKERS', 0) or 2,
+                            help="Number of tasks run in parallel.")
+        parser.add_argument('--poll-interval', type=float, default=getattr(settings, 'TASK_POLL_INTERVAL', 5),
+                            help="Seconds between polls of the queue.")
+        parser.add_argument('--stale-after', type=int, default=getattr(settings, 'TASK_STALE_AFTER', 60 * 60),
+                            help="Requeue the tasks running for more than this number of seconds first.")
+        parser.add_argument('--purge-days', type=int, default=7,
+                            help="Delete the tasks done more than this number of days ago first.")
+        parser.add_argument('--once', action='store_true',
+                            help="Only run the tasks due now, then exit (e.g. from cron).")
+        parser.add_argument('--stats', action='store_true',
+                            help="Only display the metrics of the queue.")
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self._write_stats()
+            return
+
+        requeued = taskqueue.requeue_stale(options['stale_after'])
+        purged = taskqueue.purge(options['purge_days'])
+        self.stdout.write(f"Requeued {requeued} stale task(s), purged {purged} task(s)")
+
+        worker = taskqueue.Worker(options['threads'], options['poll_interval'], options['stale_after'])
+        if options['once']:
+            # Periodic tasks are enqueued when workers start, or after they
+            # run
+            taskqueue.schedule_periodic()
+            self.stdout.write(f"Ran {worker.run_once()} task(s)")
+            self._write_stats()
+            return
+
+        signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+        self.stdout.write(f"Running tasks with {options['threads']} thread(s), CTRL-C to stop")
+        try:
+            worker.run()
+        except KeyboardInterrupt:
+            worker.stop()
+
+    def _write_stats(self):
+        stats = taskqueue.get_stats()
+
+        self.stdout.write(", ".join(f"{status}: {stats[status]}" for status in [
+            'pending', 'running', 'done', 'failed',
+        ]))
+        self.stdout.write(f"Due: {stats['due']} (oldest for {self._duration(stats['oldest_due_age'])})")
+        self.stdout.write(
+            f"Last hour: latency {self._duration(stats['latency'])}, "
+            f"duration {self._duration(stats['duration'])}"
+        )
+
+    def _duration(self, value):
+        return '-' if value is None else f"{value.total_seconds():.3f}s"
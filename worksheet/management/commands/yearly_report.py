@@ -0,0 +1,51 @@
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from worksheet import report
+from worksheet.models import Worksheet
+
+class Command(BaseCommand):
+    help = (
+        "Write the training report of one or more years (progressions and "
+        "records of each exercise, volume, attendance and durations), each "
+        "as a single HTML file with inline charts. The months of large "
+        "histories are summarized in parallel by a pool of processes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('years', type=int, nargs='*',
+                            help="Years of the reports, the current one by default.")
+        parser.add_argument('--all', action='store_true',
+                            help="Report every year with worksheets.")
+        parser.add_argument('--output-dir', default='.',
+                            help="Directory of the reports, written as training-<year>.html.")
+        parser.add_argument('--workers', type=int,
+                            help="Number of processes summarizing the months (1 to stay in this "
+                                 "process), chosen from the amount of data by default.")
+
+    def handle(self, *args, **options):
+        if options['workers'] is not None and options['workers'] < 1:
+            raise CommandError("At least one worker is needed")
+
+        if options['all']:
+            years = sorted({date.year for date in Worksheet.objects.dates('date', 'year')})
+        else:
+            years = sorted(set(options['years'])) or [timezone.localdate().year]
+        if not years:
+            raise CommandError("No worksheet to report on")
+
+        start = time.perf_counter()
+        reports = report.render_reports(years, workers=options['workers'])
+
+        directory = Path(options['output_dir'])
+        directory.mkdir(parents=True, exist_ok=True)
+        for year, html in reports.items():
+            (directory / f"training-{year}.html").write_text(html, encoding='utf-8')
+
+        self.stdout.write(
+            f"Wrote {len(reports)} report(s) ({', '.join(map(str, years))}) to {directory} "
+            f"in {time.perf_counter() - start:.2f}s"
+        )
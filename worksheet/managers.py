@@ -1,8 +1,56 @@
 import datetime
+from collections import defaultdict, deque
+from itertools import batched
 
-from django.db import models, transaction, DatabaseError
+from django.apps import apps
+from django.conf import settings
+from django.db import models, transaction, IntegrityError
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
 from django.utils import timezone
 
+from . import events
+from .taskqueue import enqueue
+
+def enqueue_closed(worksheet):
+    """
+    Defer the work following the closing of a worksheet to the task queue.
+    """
+    # The task compacts the set events of the worksheet, write the buffered
+    # ones
+    events.flush()
+    enqueue('worksheet.closed', key=f"worksheet.closed:{worksheet.pk}", worksheet_id=worksheet.pk)
+
+def get_display_order(exercise_ids, repeat):
+    """
+    The (display position, round) of each result of a worksheet, from the
+    exercise ids of its results in execution order. Repeat workouts are
+    displayed by exercise, in the order of their first round, the rounds of
+    an exercise next to each other; other workouts in execution order.
+    """
+    first, counts, rounds = {}, defaultdict(int), []
+    for order, exercise_id in enumerate(exercise_ids):
+        first.setdefault(exercise_id, order)
+        counts[exercise_id] += 1
+        rounds.append(counts[exercise_id])
+
+    orders = range(len(rounds))
+    if repeat:
+        orders = sorted(orders, key=lambda order: (first[exercise_ids[order]], order))
+
+    positions = [0] * len(rounds)
+    for position, order in enumerate(orders):
+        positions[order] = position
+
+    return list(zip(positions, rounds))
+
+def get_stale_before():
+    """
+    The time of the last activity of worksheets in progress considered
+    abandoned, see WorksheetManager.get_stale().
+    """
+    return timezone.now() - datetime.timedelta(hours=getattr(settings, 'AUTO_CLOSE_AFTER_HOURS', 24))
+
 class WorksheetManager(models.Manager):
     def get_active(self, before=None):
         """
@@ -12,44 +60,295 @@ class WorksheetManager(models.Manager):
         if before is None or not isinstance(before, (datetime.datetime, datetime.date)):
             before = timezone.localdate()
 
-        return super().get_queryset().filter(done=False, date__lt=before)
+        return super().get_queryset().filter(done=False, planned=False, date__lt=before)
 
     def close(self, pk=None):
         if pk is not None:
-            worksheet = super().get_queryset().get(pk=pk, done=False)
-            worksheet.close().save()
+            with transaction.atomic():
+                worksheet = super().get_queryset().get(pk=pk, done=False)
+                worksheet.close().save()
+                enqueue_closed(worksheet)
+
+    def get_stale(self, before=None):
+        """
+        Get the worksheets in progress without any activity (result change)
+        since a date and time, AUTO_CLOSE_AFTER_HOURS ago by default.
+        """
+        if before is None:
+            before = get_stale_before()
+
+        return super().get_queryset().filter(done=False, planned=False, updated_at__lt=before)
+
+    def close_all(self, queryset):
+        """
+        Close the worksheets in progress of a queryset with a single UPDATE,
+        ending them at their last activity, and defer the work following
+        their closing. Return the pks of the closed worksheets.
+        """
+        with transaction.atomic():
+            pks = list(queryset.filter(done=False, planned=False).select_for_update().values_list('pk', flat=True))
+            if not pks:
+                return []
+
+            # The end is computed from the value of updated_at before the
+            # UPDATE
+            super().get_queryset().filter(pk__in=pks).update(
+                done=True, ended_at=F('updated_at'), updated_at=timezone.now(),
+            )
+            events.flush()
+            enqueue('worksheet.auto_closed', worksheet_ids=pks)
+
+        # Imported here, the signals module depends on the models
+        from .signals import change_calendar_version
+
+        # Bulk updates don't send post_save. Once committed, so that the old
+        # data isn't cached under the new version.
+        transaction.on_commit(change_calendar_version)
+
+        return pks
+
+    def touch(self, pk):
+        """
+        Mark a worksheet as updated, when its results are.
+        """
+        return super().get_queryset().filter(pk=pk).update(updated_at=timezone.now())
 
     def get_or_create(self, defaults=None, **kwargs):
+        """
+        Get a worksheet, or create it along with its results in a single, short
+        transaction. Concurrent creations of the same worksheet don't fail:
+        the requests losing the race get the worksheet of the winner.
+        """
         try:
-            with transaction.atomic():
-                worksheet, created = super().get_or_create(defaults=defaults, **kwargs)
+            return super().get_queryset().get(**kwargs), False
+        except self.model.DoesNotExist:
+            pass
 
-                if created:
-                    worksheet.result_set(manager="results").create_all()
+        try:
+            with transaction.atomic():
+                worksheet = self.create(**kwargs, **(defaults or {}))
+                worksheet.result_set(manager="results").create_all(new=True)
 
-        except DatabaseError:
-            # TODO do something useful here
+            return worksheet, True
+        except IntegrityError:
+            try:
+                return super().get_queryset().get(**kwargs), False
+            except self.model.DoesNotExist:
+                # Another workout already has a worksheet on that date
+                pass
             raise
 
+    def start(self, workout, date):
+        """
+        Get or create the worksheet of a workout on a date, see
+        get_or_create(). A worksheet planned beforehand is started, in a
+        single UPDATE, unless it was planned for another workout (the
+        schedule changed since): it is then replaced.
+        """
+        try:
+            worksheet, created = self.get_or_create(workout=workout, date=date)
+        except IntegrityError:
+            if not super().get_queryset().filter(date=date, planned=True).delete()[0]:
+                raise
+            worksheet, created = self.get_or_create(workout=workout, date=date)
+
+        if worksheet.planned:
+            now = timezone.now()
+            # Only the first of concurrent requests starts it
+            if super().get_queryset().filter(pk=worksheet.pk, planned=True).update(
+                planned=False, started_at=now, updated_at=now,
+            ):
+                worksheet.planned, worksheet.started_at, worksheet.updated_at = False, now, now
+
+                # Imported here, the signals module depends on the models
+                from .signals import change_calendar_version
+
+                # The UPDATE doesn't send post_save
+                transaction.on_commit(change_calendar_version)
+            else:
+                worksheet.refresh_from_db()
+
         return worksheet, created
 
+    def plan(self, start, end, targets=False):
+        """
+        Create the worksheets scheduled between two dates (both included) ahead
+        of time, with their empty results, in two bulk INSERTs whatever the
+        number of days. Days already having a worksheet are skipped. With
+        `targets`, results get the reps and weights of the last closed
+        worksheet of their workout. Return the planned worksheets.
+        """
+        # Imported here, the schedule module depends on the models
+        from .schedule import get_resolver
+
+        Result = apps.get_model('worksheet', 'Result')
+
+        existing = set(super().get_queryset().filter(date__range=(start, end)).values_list('date', flat=True))
+        days = sorted(
+            (date, day.workout) for date, day in get_resolver().expand(start, end).items()
+            if date not in existing
+        )
+        if not days:
+            return []
+
+        programs, displays = {}, {}
+        for _, workout in days:
+            if workout.pk not in programs:
+                programs[workout.pk] = list(workout.get_exercises_in_order())
+                displays[workout.pk] = get_display_order(
+                    [exercise.pk for exercise in programs[workout.pk]], workout.repeat,
+                )
+        values = self._get_targets(programs) if targets else {}
+
+        with transaction.atomic():
+            worksheets = self.bulk_create([
+                self.model(workout=workout, date=date, planned=True) for date, workout in days
+            ])
+            Result.objects.bulk_create([
+                Result(worksheet=worksheet, exercise=exercise, _order=order,
+                       display_order=display_order, round=round,
+                       **values.get(worksheet.workout_id, {}).get(order, {}))
+                for worksheet in worksheets
+                for order, (exercise, (display_order, round)) in enumerate(zip(
+                    programs[worksheet.workout_id], displays[worksheet.workout_id],
+                ))
+            ])
+
+        # Imported here, the signals module depends on the models
+        from .signals import change_calendar_version
+
+        # bulk_create() doesn't send post_save
+        transaction.on_commit(change_calendar_version)
+
+        return worksheets
+
+    def _get_targets(self, programs):
+        """
+        The reps and weight of the last closed worksheet of each workout, by
+        workout and position in its program. Results are matched with the
+        program on their exercise, in order, so that edited programs keep the
+        values of their unchanged exercises.
+        """
+        ArchivedResults = apps.get_model('worksheet', 'ArchivedResults')
+        Result = apps.get_model('worksheet', 'Result')
+
+        targets = {}
+        for workout_id, exercises in programs.items():
+            last = super().get_queryset().filter(
+                workout=workout_id, done=True,
+            ).order_by('-date').values_list('pk', 'archive__results').first()
+            if last is None:
+                continue
+
+            pk, archive = last
+            if archive is not None:
+                entries = ArchivedResults(results=archive).unpack()
+            else:
+                entries = Result.objects.filter(worksheet=pk).order_by('_order').values_list(
+                    'exercise', 'reps', 'weight',
+                )
+
+            previous = defaultdict(deque)
+            for exercise_id, reps, weight in entries:
+                previous[exercise_id].append({'reps': reps, 'weight': weight})
+
+            targets[workout_id] = {
+                order: previous[exercise.pk].popleft()
+                for order, exercise in enumerate(exercises)
+                if previous[exercise.pk]
+            }
+
+        return targets
+
+    def archive(self, before, keep=0, batch_size=500):
+        """
+        Move the results of closed worksheets older than a date into the
+        archive table (one packed row per worksheet), except for the `keep`
+        most recent worksheets of each workout. Each batch is archived in its
+        own transaction, and its worksheets are marked as updated. Return the
+        number of archived worksheets.
+        """
+        ArchivedResults = apps.get_model('worksheet', 'ArchivedResults')
+        Result = apps.get_model('worksheet', 'Result')
+
+        worksheets = super().get_queryset().filter(
+            done=True, date__lt=before, archive__isnull=True,
+        )
+        if keep > 0:
+            recent = super().get_queryset().filter(done=True).annotate(
+                rank=Window(RowNumber(), partition_by=F('workout'), order_by=F('date').desc()),
+            ).filter(rank__lte=keep).values_list('pk', flat=True)
+            worksheets = worksheets.exclude(pk__in=list(recent))
+
+        archived = 0
+        for batch in batched(worksheets.order_by('date').values_list('pk', flat=True), batch_size):
+            with transaction.atomic():
+                entries = defaultdict(list)
+                for worksheet_id, *entry in Result.objects.filter(
+                    worksheet__in=batch,
+                ).order_by('worksheet', '_order').values_list(
+                    'worksheet', 'exercise', 'reps', 'weight',
+                ):
+                    entries[worksheet_id].append(entry)
+
+                ArchivedResults.objects.bulk_create([
+                    ArchivedResults(worksheet_id=pk, results=ArchivedResults.pack(entries[pk]))
+                    for pk in batch
+                ])
+                Result.objects.filter(worksheet__in=batch).delete()
+                # Their results lose their ids, for API clients
+                super().get_queryset().filter(pk__in=batch).update(updated_at=timezone.now())
+
+            archived += len(batch)
+
+        return archived
+
+    def unarchive(self, pks):
+        """
+        Restore the results of archived worksheets into the Result table,
+        marking them as updated.
+        """
+        ArchivedResults = apps.get_model('worksheet', 'ArchivedResults')
+        Result = apps.get_model('worksheet', 'Result')
+
+        with transaction.atomic():
+            archives = ArchivedResults.objects.filter(worksheet__in=pks)
+            results = []
+            for archive in archives.annotate(repeat=F('worksheet__workout__repeat')):
+                entries = archive.unpack()
+                display = get_display_order([exercise_id for exercise_id, _, _ in entries], archive.repeat)
+                results.extend(
+                    Result(worksheet_id=archive.worksheet_id, exercise_id=exercise_id,
+                           reps=reps, weight=weight, _order=order,
+                           display_order=display_order, round=round)
+                    for order, ((exercise_id, reps, weight), (display_order, round)) in enumerate(zip(entries, display))
+                )
+            Result.objects.bulk_create(results)
+            # Their results get new ids, for API clients
+            super().get_queryset().filter(pk__in=archives.values('worksheet')).update(updated_at=timezone.now())
+            archives.delete()
+
 class ResultRelatedManager(models.Manager):
-    def create_all(self):
+    def create_all(self, new=False):
         """
         Create all the result entries for the related worksheet, unless they
-        already exist.
+        already exist. `new` worksheets can't have any yet, so they aren't
+        counted.
         """
         worksheet = self.instance
 
-        if self.filter(worksheet=worksheet).count() == 0:
+        if new or not self.filter(worksheet=worksheet).exists():
             results = []
-            exercises = worksheet.workout.get_exercises_in_order()
+            exercises = list(worksheet.workout.get_exercises_in_order())
+            display = get_display_order([exercise.pk for exercise in exercises], worksheet.workout.repeat)
 
-            for order, exercise in enumerate(exercises):
+            for order, (exercise, (display_order, round)) in enumerate(zip(exercises, display)):
                 results.append(self.model(
                     exercise=exercise,
                     worksheet=worksheet,
-                    _order=order
+                    _order=order,
+                    display_order=display_order,
+                    round=round,
                 ))
 
             self.bulk_create(results)
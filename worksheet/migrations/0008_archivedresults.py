@@ -0,0 +1,23 @@
+# Generated by Django 5.2.9 on 2026-10-19 08:40
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('worksheet', '0007_fix_typo_in_constraint_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedResults',
+            fields=[
+                ('worksheet', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='archive', serialize=False, to='worksheet.worksheet')),
+                ('results', models.BinaryField()),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.9 on 2026-10-19 08:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('worksheet', '0008_archivedresults'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduleRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('workout', 'Workout'), ('rest', 'Rest day'), ('deload', 'Deload (scheduled workout, lighter)')], default='workout', max_length=10)),
+                ('weekday', models.SmallIntegerField(blank=True, choices=[(1, 'Monday'), (2, 'Tuesday'), (3, 'Wednesday'), (4, 'Thursday'), (5, 'Friday'), (6, 'Saturday'), (7, 'Sunday')], help_text='Leave empty to match every day of the week.', null=True)),
+                ('every', models.PositiveSmallIntegerField(default=1, help_text='Cycle length: 2 weeks for A/B weeks, N days for N-day cycles.')),
+                ('unit', models.CharField(choices=[('day', 'Days'), ('week', 'Weeks')], default='week', max_length=4)),
+                ('offset', models.PositiveSmallIntegerField(default=0, help_text='Position in the cycle, from 0 (the week or day of the start date).')),
+                ('start_date', models.DateField(blank=True, null=True)),
+                ('end_date', models.DateField(blank=True, null=True)),
+                ('priority', models.SmallIntegerField(default=0)),
+                ('workout', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='worksheet.workout')),
+            ],
+            options={
+                'ordering': ['-priority', '-id'],
+                'constraints': [models.CheckConstraint(condition=models.Q(('offset__lt', models.F('every'))), name='schedule_rule_offset_in_cycle'), models.CheckConstraint(condition=models.Q(models.Q(('kind', 'workout'), ('workout__isnull', False)), models.Q(models.Q(('kind', 'workout'), _negated=True), ('workout__isnull', True)), _connector='OR'), name='schedule_rule_workout_kind')],
+            },
+        ),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 5.2.9 on 2026-10-19 08:57
+
+from django.db import migrations, models
+
+
+FTS_TABLE = 'worksheet_exercise_fts'
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+            "name, muscle_groups, equipment, tags, "
+            "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+        # Muscle groups, equipment and tags are new, only names are indexed
+        schema_editor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, name) SELECT id, name FROM worksheet_exercise"
+        )
+    elif connection.vendor == 'postgresql':
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        schema_editor.execute(
+            "CREATE INDEX worksheet_exercise_name_trgm ON worksheet_exercise "
+            "USING gin (name gin_trgm_ops)"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+    elif connection.vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS worksheet_exercise_name_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('worksheet', '0010_task'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Equipment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+            ],
+            options={
+                'verbose_name_plural': 'equipment',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='MuscleGroup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Tag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='exercise',
+            name='equipment',
+            field=models.ManyToManyField(blank=True, to='worksheet.equipment'),
+        ),
+        migrations.AddField(
+            model_name='exercise',
+            name='muscle_groups',
+            field=models.ManyToManyField(blank=True, to='worksheet.musclegroup'),
+        ),
+        migrations.AddField(
+            model_name='exercise',
+            name='tags',
+            field=models.ManyToManyField(blank=True, to='worksheet.tag'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
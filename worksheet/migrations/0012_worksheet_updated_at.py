@@ -0,0 +1,25 @@
+# Generated by Django 5.2.9 on 2026-10-19 12:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('worksheet', '0011_exercise_library'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='worksheet',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        # The last known change of existing worksheets
+        migrations.RunSQL(
+            "UPDATE worksheet_worksheet SET updated_at = COALESCE(ended_at, started_at)",
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.9 on 2026-10-19 09:10
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('worksheet', '0012_worksheet_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WorksheetLog',
+            fields=[
+                ('worksheet', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='log', serialize=False, to='worksheet.worksheet')),
+                ('events', models.BinaryField()),
+                ('sets', models.PositiveSmallIntegerField(default=0)),
+                ('edits', models.PositiveSmallIntegerField(default=0)),
+                ('rest_time', models.DurationField(blank=True, null=True)),
+                ('compacted_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SetEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('result_id', models.BigIntegerField()),
+                ('field', models.PositiveSmallIntegerField(choices=[(1, 'Reps'), (2, 'Weight')])),
+                ('value', models.SmallIntegerField(null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('worksheet', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='worksheet.worksheet')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['worksheet', 'created_at'], name='set_event_worksheet')],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.9 on 2026-10-19 09:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('worksheet', '0013_set_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExerciseNote',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text', models.TextField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('exercise', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='worksheet.exercise')),
+                ('worksheet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notes', to='worksheet.worksheet')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('worksheet', 'exercise'), name='unique_note_per_exercise')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.9 on 2026-10-19 09:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('worksheet', '0014_exercisenote'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='worksheet',
+            index=models.Index(condition=models.Q(('done', False)), fields=['date', 'updated_at'], name='worksheet_in_progress'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-19 09:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('worksheet', '0015_worksheet_in_progress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='worksheet',
+            name='planned',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.9 on 2026-10-19 09:31
+
+from collections import defaultdict
+from itertools import batched
+
+from django.db import migrations, models
+
+def backfill_display_order(apps, schema_editor):
+    # Same as managers.get_display_order(), at the time of this migration
+    Result = apps.get_model("worksheet", "Result")
+    Worksheet = apps.get_model("worksheet", "Worksheet")
+
+    worksheets = Worksheet.objects.order_by('pk').values_list('pk', 'workout__repeat')
+    for batch in batched(worksheets.iterator(chunk_size=500), 500):
+        repeat = dict(batch)
+        results = defaultdict(list)
+        for pk, worksheet_id, exercise_id in Result.objects.filter(
+            worksheet__in=repeat,
+        ).order_by('worksheet', '_order').values_list('pk', 'worksheet', 'exercise'):
+            results[worksheet_id].append((pk, exercise_id))
+
+        updated = []
+        for worksheet_id, entries in results.items():
+            first, counts = {}, defaultdict(int)
+            rounds = []
+            for order, (_, exercise_id) in enumerate(entries):
+                first.setdefault(exercise_id, order)
+                counts[exercise_id] += 1
+                rounds.append(counts[exercise_id])
+
+            orders = range(len(entries))
+            if repeat[worksheet_id]:
+                orders = sorted(orders, key=lambda order: (first[entries[order][1]], order))
+
+            for position, order in enumerate(orders):
+                updated.append(Result(pk=entries[order][0], display_order=position, round=rounds[order]))
+
+        Result.objects.bulk_update(updated, ['display_order', 'round'], batch_size=500)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('worksheet', '0016_worksheet_planned'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='result',
+            name='display_order',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='result',
+            name='round',
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+        migrations.RunPython(
+            # Results of the existing worksheets, before indexing them
+            backfill_display_order, migrations.RunPython.noop,
+        ),
+        migrations.AddIndex(
+            model_name='result',
+            index=models.Index(fields=['worksheet', 'display_order'], name='result_display_order'),
+        ),
+    ]
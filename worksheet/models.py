@@ -1,18 +1,55 @@
+import datetime
+import struct
 from itertools import batched
 
 from django.contrib import admin
 from django.core import validators
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
 from django.db import models
 from django.db.models import Q
 from django.urls import reverse
 from django.utils import timezone
 
-from .managers import ResultRelatedManager, WorksheetManager
+from .managers import ResultRelatedManager, WorksheetManager, get_display_order
 
 # Create your models here.
+class MuscleGroup(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        ordering = ['name']
+
+class Equipment(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        ordering = ['name']
+        verbose_name_plural = "equipment"
+
+class Tag(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        ordering = ['name']
+
 class Exercise(models.Model):
+    """
+    An exercise of the library, searched through worksheet.search.
+    """
     name = models.CharField(max_length=50)
     weight = models.BooleanField(verbose_name="Use weights?", default=False)
+    muscle_groups = models.ManyToManyField(MuscleGroup, blank=True)
+    equipment = models.ManyToManyField(Equipment, blank=True)
+    tags = models.ManyToManyField(Tag, blank=True)
 
     @admin.display(description="Exercise")
     def __str__(self):
@@ -89,11 +126,109 @@ class Schedule(models.Model):
     def __str__(self):
         return f"{self.DAY_CHOICES[self.day]}: {self.workout.name}"
 
+class ScheduleRule(models.Model):
+    """
+    A rule refining the weekly Schedule: A/B weeks, N-day cycles, deload weeks
+    or date-bounded overrides. Rules are resolved by worksheet.schedule, the
+    one with the highest priority matching a date wins, and the weekly
+    Schedule is used when none does.
+    """
+    WORKOUT = "workout"
+    REST = "rest"
+    DELOAD = "deload"
+    KIND_CHOICES = {
+        WORKOUT: "Workout",
+        REST: "Rest day",
+        DELOAD: "Deload (scheduled workout, lighter)",
+    }
+    DAYS = "day"
+    WEEKS = "week"
+    UNIT_CHOICES = {
+        DAYS: "Days",
+        WEEKS: "Weeks",
+    }
+    # Anchor of week cycles without a start date (a Monday)
+    EPOCH = datetime.date(2001, 1, 1)
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default=WORKOUT)
+    workout = models.ForeignKey(Workout, on_delete=models.CASCADE, blank=True, null=True)
+    weekday = models.SmallIntegerField(choices=Schedule.DAY_CHOICES, blank=True, null=True,
+                                       help_text="Leave empty to match every day of the week.")
+    every = models.PositiveSmallIntegerField(default=1,
+                                             help_text="Cycle length: 2 weeks for A/B weeks, N days for N-day cycles.")
+    unit = models.CharField(max_length=4, choices=UNIT_CHOICES, default=WEEKS)
+    offset = models.PositiveSmallIntegerField(default=0,
+                                              help_text="Position in the cycle, from 0 (the week or day of the start date).")
+    start_date = models.DateField(blank=True, null=True)
+    end_date = models.DateField(blank=True, null=True)
+    priority = models.SmallIntegerField(default=0)
+
+    def __str__(self):
+        target = self.workout.name if self.kind == self.WORKOUT else self.KIND_CHOICES[self.kind]
+        when = Schedule.DAY_CHOICES.get(self.weekday, "Every day")
+        if self.every > 1:
+            when += f", {self.UNIT_CHOICES[self.unit].lower()} {self.offset + 1} of {self.every}"
+
+        return f"{when}: {target}"
+
+    def clean(self):
+        errors = {}
+        if self.kind == self.WORKOUT and self.workout_id is None:
+            errors['workout'] = "A workout is required for this kind of rule."
+        if self.kind != self.WORKOUT and self.workout_id is not None:
+            errors['workout'] = "Only workout rules have a workout."
+        if self.offset >= self.every:
+            errors['offset'] = "The offset must be lower than the cycle length."
+        if self.unit == self.DAYS and self.every > 1 and self.start_date is None:
+            errors['start_date'] = "Day cycles need a start date."
+        if self.start_date and self.end_date and self.end_date < self.start_date:
+            errors['end_date'] = "The end date is before the start date."
+
+        if errors:
+            raise ValidationError(errors)
+
+    def matches(self, date):
+        if self.weekday is not None and date.isoweekday() != self.weekday:
+            return False
+        if self.start_date is not None and date < self.start_date:
+            return False
+        if self.end_date is not None and date > self.end_date:
+            return False
+        if self.every == 1:
+            return True
+
+        if self.unit == self.DAYS:
+            position = (date - self.start_date).days
+        else:
+            anchor = self.start_date or self.EPOCH
+            # Weeks start on Mondays, whatever the day of the start date
+            anchor -= datetime.timedelta(days=anchor.weekday())
+            position = (date - anchor).days // 7
+
+        return position % self.every == self.offset
+
+    class Meta:
+        ordering = ['-priority', '-id']
+        constraints = [
+            models.CheckConstraint(
+                condition=Q(offset__lt=models.F('every')),
+                name="schedule_rule_offset_in_cycle",
+            ),
+            models.CheckConstraint(
+                condition=Q(kind="workout", workout__isnull=False) | (~Q(kind="workout") & Q(workout__isnull=True)),
+                name="schedule_rule_workout_kind",
+            ),
+        ]
+
 class Worksheet(models.Model):
     workout = models.ForeignKey(Workout, on_delete=models.PROTECT)
     done = models.BooleanField(default=False)
+    # Created ahead of time (see WorksheetManager.plan()), until started
+    planned = models.BooleanField(default=False)
     started_at = models.DateTimeField(default=timezone.now)
     ended_at = models.DateTimeField(blank=True, null=True)
+    # Also changed when results are, see WorksheetManager.touch()
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     date = models.DateField(default=timezone.localdate)
 
     objects = WorksheetManager()
@@ -123,6 +258,15 @@ class Worksheet(models.Model):
     def get_status(self):
         return "done" if self.done else "in-progress"
 
+    def get_archive(self):
+        """
+        Get the archived results of the worksheet, if it has been archived.
+        """
+        try:
+            return self.archive
+        except ObjectDoesNotExist:
+            return None
+
     def get_absolute_url(self):
         return reverse("worksheet:worksheet", args=[self.date.year, self.date.month, self.date.day])
 
@@ -132,12 +276,23 @@ class Worksheet(models.Model):
                 fields=["date"], name="unique_worksheet_per_day",
             )
         ]
+        indexes = [
+            # Only a few worksheets are ever in progress, see
+            # WorksheetManager.get_active() and get_stale()
+            models.Index(
+                fields=["date", "updated_at"], condition=Q(done=False), name="worksheet_in_progress",
+            ),
+        ]
 
 class Result(models.Model):
     reps = models.SmallIntegerField(validators=[validators.MinValueValidator(0, message="Number of reps cannot be negative")], null=True)
     weight = models.SmallIntegerField(validators=[validators.MinValueValidator(0, message="Used weight cannot be negative")], blank=True, null=True)
     exercise = models.ForeignKey(Exercise, on_delete=models.PROTECT)
     worksheet = models.ForeignKey(Worksheet, on_delete=models.CASCADE)
+    # Position of the result on the worksheet page, and number of times its
+    # exercise was executed so far, see managers.get_display_order()
+    display_order = models.PositiveSmallIntegerField(default=0)
+    round = models.PositiveSmallIntegerField(default=1)
 
     objects = models.Manager()
     results = ResultRelatedManager()
@@ -167,3 +322,230 @@ class Result(models.Model):
         constraints = [
             models.CheckConstraint(condition=Q(reps__gte=0) & Q(weight__gte=0), name="reps_and_weight_positive"),
         ]
+        indexes = [
+            # Worksheet pages read their results in display order, see
+            # WorksheetView._get_results()
+            models.Index(fields=["worksheet", "display_order"], name="result_display_order"),
+        ]
+
+class ExerciseNote(models.Model):
+    """
+    Notes about an exercise of a worksheet, kept out of the Result table so
+    that results stay narrow. Loaded on demand by the worksheet page.
+    """
+    worksheet = models.ForeignKey(Worksheet, on_delete=models.CASCADE, related_name='notes')
+    exercise = models.ForeignKey(Exercise, on_delete=models.PROTECT)
+    text = models.TextField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Notes on {self.exercise} ({self.worksheet.date})"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["worksheet", "exercise"], name="unique_note_per_exercise",
+            ),
+        ]
+
+class ArchivedResults(models.Model):
+    """
+    The results of an old, closed worksheet, packed into a single binary value
+    to keep the Result table (and its indexes) small. See
+    WorksheetManager.archive().
+    """
+    # Format version, then one (exercise, reps, weight) entry per result in
+    # execution order. Reps and weight are never negative, so -1 means NULL.
+    VERSION = 1
+    HEADER = struct.Struct('<B')
+    ENTRY = struct.Struct('<Ihh')
+
+    worksheet = models.OneToOneField(Worksheet, on_delete=models.CASCADE,
+                                     primary_key=True, related_name='archive')
+    results = models.BinaryField()
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Archive of {self.worksheet}"
+
+    @classmethod
+    def pack(cls, entries):
+        """
+        Pack (exercise_id, reps, weight) entries, in execution order, into a
+        binary value.
+        """
+        data = bytearray(cls.HEADER.pack(cls.VERSION))
+        for exercise_id, reps, weight in entries:
+            data += cls.ENTRY.pack(
+                exercise_id,
+                -1 if reps is None else reps,
+                -1 if weight is None else weight,
+            )
+
+        return bytes(data)
+
+    def unpack(self):
+        """
+        Get the archived values as a list of (exercise_id, reps, weight).
+        """
+        data = bytes(self.results)
+        version, = self.HEADER.unpack_from(data)
+        if version != self.VERSION:
+            raise ValueError(f"Unknown archive format version {version}")
+
+        return [
+            (exercise_id, None if reps == -1 else reps, None if weight == -1 else weight)
+            for exercise_id, reps, weight in self.ENTRY.iter_unpack(data[self.HEADER.size:])
+        ]
+
+    def get_results(self):
+        """
+        Rebuild the (unsaved) Result instances of the worksheet, in the same
+        order the Result table would give them.
+        """
+        worksheet = self.worksheet
+        entries = self.unpack()
+        exercises = Exercise.objects.in_bulk({exercise_id for exercise_id, _, _ in entries})
+        display = get_display_order([exercise_id for exercise_id, _, _ in entries], worksheet.workout.repeat)
+
+        results = [
+            Result(
+                exercise=exercises.get(exercise_id) or Exercise(id=exercise_id, name=f"Exercise #{exercise_id}"),
+                worksheet=worksheet,
+                reps=reps,
+                weight=weight,
+                _order=order,
+                display_order=display_order,
+                round=round,
+            )
+            for order, ((exercise_id, reps, weight), (display_order, round)) in enumerate(zip(entries, display))
+        ]
+        # Repeat workouts are displayed by exercise, like live worksheets
+        results.sort(key=lambda result: result.display_order)
+
+        return results
+
+class SetEvent(models.Model):
+    """
+    A change of the reps or weight of a result, as entered, appended to the
+    log by worksheet.events. The events of closed worksheets are compacted
+    into their WorksheetLog.
+    """
+    REPS = 1
+    WEIGHT = 2
+    FIELD_CHOICES = {
+        REPS: "Reps",
+        WEIGHT: "Weight",
+    }
+
+    # No foreign key constraint, so that appends stay cheap: the events of
+    # deleted worksheets are dropped by the compaction
+    worksheet = models.ForeignKey(Worksheet, on_delete=models.DO_NOTHING, db_constraint=False,
+                                  db_index=False, related_name='+')
+    result_id = models.BigIntegerField()
+    field = models.PositiveSmallIntegerField(choices=FIELD_CHOICES)
+    value = models.SmallIntegerField(null=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.FIELD_CHOICES[self.field]} of result {self.result_id}: {self.value}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["worksheet", "created_at"], name="set_event_worksheet"),
+        ]
+
+class WorksheetLog(models.Model):
+    """
+    The set events of a closed worksheet, packed into a single binary value,
+    with a summary of the session. See worksheet.events.compact().
+    """
+    # Format version, then one (milliseconds since the start of the
+    # worksheet, position of the result, exercise, field, value) entry per
+    # event, in chronological order. Values are never negative, so -1 means
+    # NULL.
+    VERSION = 1
+    HEADER = struct.Struct('<B')
+    ENTRY = struct.Struct('<iHIBh')
+
+    worksheet = models.OneToOneField(Worksheet, on_delete=models.CASCADE,
+                                     primary_key=True, related_name='log')
+    events = models.BinaryField()
+    # Number of sets entered, and of corrections
+    sets = models.PositiveSmallIntegerField(default=0)
+    edits = models.PositiveSmallIntegerField(default=0)
+    # Median rest time between two sets
+    rest_time = models.DurationField(blank=True, null=True)
+    compacted_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Log of {self.worksheet}"
+
+    @classmethod
+    def pack(cls, entries):
+        """
+        Pack (milliseconds, position, exercise_id, field, value) entries, in
+        chronological order, into a binary value.
+        """
+        data = bytearray(cls.HEADER.pack(cls.VERSION))
+        for milliseconds, position, exercise_id, field, value in entries:
+            data += cls.ENTRY.pack(milliseconds, position, exercise_id, field, -1 if value is None else value)
+
+        return bytes(data)
+
+    def unpack(self):
+        """
+        Get the logged events as a list of (milliseconds, position,
+        exercise_id, field, value).
+        """
+        data = bytes(self.events)
+        version, = self.HEADER.unpack_from(data)
+        if version != self.VERSION:
+            raise ValueError(f"Unknown log format version {version}")
+
+        return [
+            (milliseconds, position, exercise_id, field, None if value == -1 else value)
+            for milliseconds, position, exercise_id, field, value in self.ENTRY.iter_unpack(data[self.HEADER.size:])
+        ]
+
+class Task(models.Model):
+    """
+    A deferred job, run by worksheet.taskqueue workers outside of the request
+    that enqueued it.
+    """
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = {
+        PENDING: "Pending",
+        RUNNING: "Running",
+        DONE: "Done",
+        FAILED: "Failed",
+    }
+
+    name = models.CharField(max_length=100)
+    kwargs = models.JSONField(default=dict, blank=True)
+    # Tasks enqueued with the same key while one is pending run only once
+    key = models.CharField(max_length=200, blank=True, null=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    created_at = models.DateTimeField(default=timezone.now)
+    run_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.STATUS_CHOICES[self.status]})"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "run_at"], name="task_status_run_at"),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["key"], condition=Q(status="pending"), name="unique_pending_task_key",
+            ),
+        ]
@@ -0,0 +1,307 @@
+"""
+Yearly training report: progressions and records of each exercise, volume,
+attendance and session durations, rendered as a single HTML file with inline
+SVG charts (see the `yearly_report` management command).
+
+Months are summarized independently, reading their worksheets and results as
+chunked projections, archived results included. The months of large
+histories (POOL_THRESHOLD worksheets or more) are summarized by a pool of
+processes, shared by all the requested years: starting the processes takes a
+few seconds, more than summarizing a year of a few hundred worksheets. The
+summaries are then merged, which is cheap.
+"""
+import calendar
+import datetime
+import multiprocessing
+import os
+import statistics
+from collections import defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from django.apps import apps
+from django.db import connections
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.html import format_html, format_html_join
+
+# A closed or in progress worksheet
+Session = namedtuple('Session', ['date', 'workout', 'done', 'duration', 'volume', 'sets'])
+# The best values of an exercise during a session. The estimated one rep max
+# (Epley formula) is None for exercises without weight.
+Performance = namedtuple('Performance', ['date', 'weight', 'reps', 'one_rep_max', 'volume'])
+Record = namedtuple('Record', ['value', 'date'])
+
+# Projections read per chunk
+CHUNK_SIZE = 2000
+
+# Number of worksheets from which months are summarized by processes
+POOL_THRESHOLD = 20000
+
+def _month_range(year, month):
+    return datetime.date(year, month, 1), datetime.date(year, month, calendar.monthrange(year, month)[1])
+
+def summarize_month(year, month):
+    """
+    The sessions of a month, and the performance of each exercise during each
+    of them, by exercise. Only plain values are returned, so that months can
+    be summarized by other processes.
+    """
+    ArchivedResults = apps.get_model('worksheet', 'ArchivedResults')
+    Result = apps.get_model('worksheet', 'Result')
+    Worksheet = apps.get_model('worksheet', 'Worksheet')
+
+    start, end = _month_range(year, month)
+
+    worksheets = {}
+    entries = defaultdict(list)
+    for pk, date, workout, done, started_at, ended_at, archive in Worksheet.objects.filter(
+        date__range=(start, end), planned=False,
+    ).values_list(
+        'pk', 'date', 'workout__name', 'done', 'started_at', 'ended_at', 'archive__results',
+    ).iterator(chunk_size=CHUNK_SIZE):
+        duration = (ended_at - started_at).total_seconds() if done and ended_at else None
+        worksheets[pk] = (date, workout, done, duration)
+        if archive is not None:
+            entries[pk] = ArchivedResults(results=archive).unpack()
+
+    for worksheet_id, exercise_id, reps, weight in Result.objects.filter(
+        worksheet__date__range=(start, end), worksheet__planned=False,
+    ).values_list('worksheet', 'exercise', 'reps', 'weight').iterator(chunk_size=CHUNK_SIZE):
+        entries[worksheet_id].append((exercise_id, reps, weight))
+
+    sessions = []
+    exercises = defaultdict(list)
+    for pk, (date, workout, done, duration) in sorted(worksheets.items(), key=lambda item: item[1][0]):
+        best = {}
+        total = sets = 0
+        for exercise_id, reps, weight in entries[pk]:
+            if not reps:
+                continue
+
+            volume = reps * (weight or 1)
+            total += volume
+            sets += 1
+
+            one_rep_max = weight * (1 + reps / 30) if weight else None
+            previous = best.get(exercise_id)
+            if previous is None:
+                best[exercise_id] = [weight, reps, one_rep_max, volume]
+            else:
+                previous[0] = max(previous[0] or 0, weight or 0) or None
+                previous[1] = max(previous[1], reps)
+                previous[2] = max(previous[2] or 0, one_rep_max or 0) or None
+                previous[3] += volume
+
+        sessions.append(Session(date, workout, done, duration, total, sets))
+        for exercise_id, values in best.items():
+            exercises[exercise_id].append(Performance(date, *values))
+
+    return sessions, dict(exercises)
+
+def _init_worker(database):
+    # Spawned processes start from scratch: set Django up, on the database
+    # of the parent process (e.g. the test database)
+    import django
+
+    django.setup()
+    connections['default'].settings_dict['NAME'] = database
+
+def get_workers(years):
+    """
+    The number of processes worth starting to summarize the months of years.
+    """
+    Worksheet = apps.get_model('worksheet', 'Worksheet')
+
+    if Worksheet.objects.filter(date__year__in=years).count() < POOL_THRESHOLD:
+        return 1
+
+    return min(12 * len(years), os.cpu_count() or 1)
+
+def summarize(years, workers=1):
+    """
+    Summarize the 12 months of each year, in `workers` processes when more
+    than one. Return the month summaries by year.
+    """
+    months = [(year, month) for year in years for month in range(1, 13)]
+    if workers <= 1:
+        summaries = [summarize_month(year, month) for year, month in months]
+    else:
+        database = connections['default'].settings_dict['NAME']
+        # Spawned rather than forked: the parent may run other threads
+        with ProcessPoolExecutor(
+            workers, mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker, initargs=(str(database),),
+        ) as pool:
+            summaries = list(pool.map(summarize_month, *zip(*months)))
+
+    return {year: summaries[12 * n:12 * (n + 1)] for n, year in enumerate(years)}
+
+def _records(performances):
+    records = {}
+    for field in Performance._fields[1:]:
+        values = [(getattr(performance, field), performance.date)
+                  for performance in performances if getattr(performance, field) is not None]
+        if values:
+            records[field] = Record(*max(values, key=lambda value: value[0]))
+
+    return records
+
+def build_report(year, months, today=None):
+    """
+    The context of the report of a year, from the summaries of its months.
+    """
+    # Imported here: this module is imported by the worker processes before
+    # Django is set up
+    from .schedule import get_resolver
+
+    Exercise = apps.get_model('worksheet', 'Exercise')
+
+    if today is None:
+        today = timezone.localdate()
+
+    sessions = [session for month_sessions, _ in months for session in month_sessions]
+    performances = defaultdict(list)
+    for _, exercises in months:
+        for exercise_id, values in exercises.items():
+            performances[exercise_id].extend(values)
+
+    # Attendance, against the schedule of the days gone by
+    start, end = datetime.date(year, 1, 1), min(datetime.date(year, 12, 31), today)
+    planned = get_resolver().expand(start, end) if start <= end else {}
+    planned_by_month = defaultdict(int)
+    for date in planned:
+        planned_by_month[date.month] += 1
+    done_by_month = defaultdict(int)
+    volume_by_month = defaultdict(int)
+    durations_by_month = defaultdict(list)
+    for session in sessions:
+        volume_by_month[session.date.month] += session.volume
+        if session.done:
+            done_by_month[session.date.month] += 1
+        if session.duration is not None:
+            durations_by_month[session.date.month].append(session.duration / 60)
+
+    names = dict(Exercise.objects.filter(pk__in=performances).values_list('pk', 'name'))
+    exercises = []
+    for exercise_id, values in sorted(performances.items(), key=lambda item: names.get(item[0], '')):
+        weighted = any(value.one_rep_max for value in values)
+        exercises.append({
+            'name': names.get(exercise_id, f"Exercise #{exercise_id}"),
+            'sessions': len(values),
+            'weighted': weighted,
+            'records': _records(values),
+            'chart': line_chart(
+                [(value.date, value.one_rep_max if weighted else value.reps) for value in values],
+                year,
+            ),
+        })
+
+    labels = [calendar.month_abbr[month] for month in range(1, 13)]
+    durations = [session.duration / 60 for session in sessions if session.duration is not None]
+
+    return {
+        'year': year,
+        'generated_at': timezone.localtime(),
+        'totals': {
+            'sessions': sum(1 for session in sessions if session.done),
+            'planned': len(planned),
+            'attendance': sum(done_by_month.values()) / len(planned) if planned else None,
+            'volume': sum(volume_by_month.values()),
+            'sets': sum(session.sets for session in sessions),
+            'median_duration': statistics.median(durations) if durations else None,
+        },
+        'volume_chart': bar_chart([volume_by_month[month] for month in range(1, 13)], labels),
+        'attendance_chart': bar_chart(
+            [round(100 * done_by_month[month] / planned_by_month[month]) if planned_by_month[month] else 0
+             for month in range(1, 13)],
+            labels, unit='%',
+        ),
+        'duration_chart': bar_chart(
+            [round(statistics.median(durations_by_month[month])) if durations_by_month[month] else 0
+             for month in range(1, 13)],
+            labels, unit=' min',
+        ),
+        'exercises': exercises,
+    }
+
+def render_reports(years, workers=None, today=None):
+    """
+    The reports of years, as HTML by year. The number of processes is
+    chosen from the amount of data by default, see get_workers().
+    """
+    if workers is None:
+        workers = get_workers(years)
+
+    return {
+        year: render_to_string('worksheet/report.html', build_report(year, months, today))
+        for year, months in summarize(years, workers).items()
+    }
+
+# Charts, as inline SVG
+
+WIDTH, HEIGHT, MARGIN = 600, 160, 24
+
+def _coordinate(value):
+    # format_html() escapes its arguments to strings, numbers are formatted
+    # beforehand
+    return f"{value:.1f}"
+
+def bar_chart(values, labels, unit=''):
+    """
+    An SVG bar chart, one labelled bar per value.
+    """
+    top = max(values, default=0) or 1
+    step = (WIDTH - 2 * MARGIN) / len(values)
+    bottom = HEIGHT - MARGIN
+    height = HEIGHT - 2 * MARGIN
+
+    bars = format_html_join('', (
+        '<rect x="{}" y="{}" width="{}" height="{}"><title>{}: {}{}</title></rect>'
+        '<text x="{}" y="{}">{}</text>'
+    ), (
+        (
+            _coordinate(MARGIN + n * step + step * 0.1), _coordinate(bottom - height * value / top),
+            _coordinate(step * 0.8), _coordinate(height * value / top),
+            label, value, unit,
+            _coordinate(MARGIN + n * step + step / 2), _coordinate(HEIGHT - MARGIN / 3), label,
+        )
+        for n, (value, label) in enumerate(zip(values, labels))
+    ))
+
+    return format_html(
+        '<svg class="chart bars" viewBox="0 0 {} {}" role="img"><text x="{}" y="{}">{}{}</text>{}</svg>',
+        WIDTH, HEIGHT, MARGIN, _coordinate(MARGIN / 2), top, unit, bars,
+    )
+
+def line_chart(points, year):
+    """
+    An SVG line chart of (date, value) points over a year.
+    """
+    points = [(date, value) for date, value in points if value is not None]
+    if not points:
+        return ''
+
+    low = min(value for _, value in points)
+    high = max(value for _, value in points)
+    span = (high - low) or 1
+    days = 366 if calendar.isleap(year) else 365
+
+    def x(date):
+        return _coordinate(MARGIN + (WIDTH - 2 * MARGIN) * (date.timetuple().tm_yday - 1) / (days - 1))
+
+    def y(value):
+        return _coordinate(HEIGHT - MARGIN - (HEIGHT - 2 * MARGIN) * (value - low) / span)
+
+    path = ' '.join(f"{x(date)},{y(value)}" for date, value in points)
+    dots = format_html_join('', '<circle cx="{}" cy="{}" r="3"><title>{}: {}</title></circle>', (
+        (x(date), y(value), date, round(value, 1)) for date, value in points
+    ))
+
+    return format_html(
+        '<svg class="chart line" viewBox="0 0 {} {}" role="img">'
+        '<text x="{}" y="{}">{}</text><text x="{}" y="{}">{}</text>'
+        '<polyline points="{}"/>{}</svg>',
+        WIDTH, HEIGHT, MARGIN, _coordinate(MARGIN / 2), round(high, 1),
+        MARGIN, _coordinate(HEIGHT - MARGIN / 3), round(low, 1),
+        path, dots,
+    )
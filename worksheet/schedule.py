@@ -0,0 +1,84 @@
+"""
+Resolution of the training schedule: which workout is planned on a given date.
+
+The weekly Schedule is refined by ScheduleRules (A/B weeks, N-day cycles,
+deload weeks, date-bounded overrides). Both are loaded once into a
+ScheduleResolver, cached until a schedule, a rule or a workout is modified, so
+that expanding a date range doesn't cost any query.
+"""
+import datetime
+import threading
+from collections import namedtuple
+
+from .models import Schedule, ScheduleRule
+from .signals import get_calendar_version
+
+Planned = namedtuple('Planned', ['workout', 'deload'])
+
+class ScheduleResolver:
+    def __init__(self, schedules, rules):
+        self.weekly = {schedule.day: schedule.workout for schedule in schedules}
+
+        # Rules are bucketed by ISO weekday, highest priority first, so that
+        # resolving a date only looks at the rules that may apply to it
+        rules = sorted(rules, key=lambda rule: (-rule.priority, -rule.pk))
+        self.rules = {
+            day: [rule for rule in rules if rule.weekday in (None, day)]
+            for day in Schedule.DAY_CHOICES
+        }
+
+    def resolve(self, date):
+        """
+        The Planned workout of a date, or None on rest days.
+        """
+        deload = False
+        for rule in self.rules[date.isoweekday()]:
+            if not rule.matches(date):
+                continue
+
+            # Deload rules only flag the workout of the following rules
+            if rule.kind == ScheduleRule.DELOAD:
+                deload = True
+            elif rule.kind == ScheduleRule.REST:
+                return None
+            else:
+                return Planned(rule.workout, deload)
+
+        workout = self.weekly.get(date.isoweekday())
+
+        return Planned(workout, deload) if workout is not None else None
+
+    def expand(self, start, end):
+        """
+        The Planned workouts of every date between start and end (both
+        included), rest days omitted.
+        """
+        planned = {}
+        date = start
+        while date <= end:
+            if (day := self.resolve(date)) is not None:
+                planned[date] = day
+            date += datetime.timedelta(days=1)
+
+        return planned
+
+_lock = threading.Lock()
+_resolver = (None, None)
+
+def get_resolver():
+    """
+    The resolver of the current version of the schedule, built on first use.
+    The version only changes once a modification is committed, so a resolver
+    built meanwhile is rebuilt afterwards instead of missing it.
+    """
+    global _resolver
+
+    version = get_calendar_version()
+    with _lock:
+        if _resolver[0] != version:
+            _resolver = (version, ScheduleResolver(
+                Schedule.objects.select_related('workout').all(),
+                ScheduleRule.objects.select_related('workout').all(),
+            ))
+
+        return _resolver[1]
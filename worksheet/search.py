@@ -0,0 +1,157 @@
+"""
+Search of the exercise library.
+
+SQLite databases use an FTS5 table (worksheet_exercise_fts) holding the name,
+muscle groups, equipment and tags of every exercise, kept up to date by
+signals. PostgreSQL databases match names with a trigram index (pg_trgm),
+other databases fall back to a plain, unindexed, substring search.
+"""
+import re
+from itertools import batched
+
+from django.db import connections, router, transaction
+from django.db.models import Case, IntegerField, When
+from django.db.models.expressions import RawSQL
+
+from .models import Exercise
+
+FTS_TABLE = 'worksheet_exercise_fts'
+
+TOKEN_RE = re.compile(r'\w+')
+
+def _connection():
+    return connections[router.db_for_read(Exercise)]
+
+def _fts_query(query, **columns):
+    """
+    Build an FTS5 query matching every word of `query` as a prefix, and the
+    given values in their respective columns.
+    """
+    terms = [f'"{token}"*' for token in TOKEN_RE.findall(query)]
+    for column, value in columns.items():
+        if value:
+            value = value.replace('"', '""')
+            terms.append(f'{column} : "{value}"')
+
+    return ' AND '.join(terms)
+
+def search_exercises(query, muscle_group=None, equipment=None, tag=None, limit=20):
+    """
+    The exercises matching a query and the given muscle group, equipment and
+    tag (instances), best matches first.
+    """
+    exercises = Exercise.objects.all()
+    if muscle_group is not None:
+        exercises = exercises.filter(muscle_groups=muscle_group)
+    if equipment is not None:
+        exercises = exercises.filter(equipment=equipment)
+    if tag is not None:
+        exercises = exercises.filter(tags=tag)
+
+    query = query.strip()
+    if not query:
+        return list(exercises.order_by('name')[:limit])
+
+    connection = _connection()
+    if connection.vendor == 'sqlite':
+        fts_query = _fts_query(query, muscle_groups=getattr(muscle_group, 'name', None),
+                               equipment=getattr(equipment, 'name', None),
+                               tags=getattr(tag, 'name', None))
+        if not fts_query:
+            return []
+
+        # Facets are matched by FTS too, so that the LIMIT applies to the
+        # filtered matches, then checked exactly
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s ORDER BY rank LIMIT %s",
+                [fts_query, limit],
+            )
+            pks = [pk for pk, in cursor.fetchall()]
+
+        return list(exercises.filter(pk__in=pks).order_by(
+            Case(*[When(pk=pk, then=position) for position, pk in enumerate(pks)],
+                 output_field=IntegerField()),
+        )) if pks else []
+
+    tokens = TOKEN_RE.findall(query)
+    for token in tokens:
+        exercises = exercises.filter(name__icontains=token)
+
+    if connection.vendor == 'postgresql':
+        exercises = exercises.annotate(
+            similarity=RawSQL(f"similarity({Exercise._meta.db_table}.name, %s)", [query]),
+        ).order_by('-similarity', 'name')
+    else:
+        exercises = exercises.order_by('name')
+
+    return list(exercises.distinct()[:limit])
+
+def filter_exercises(exercises, query):
+    """
+    Filter a queryset of exercises on a query, without limiting the number of
+    matches nor ordering them (e.g. for the admin changelist).
+    """
+    tokens = TOKEN_RE.findall(query)
+    if _connection().vendor == 'sqlite':
+        if not tokens:
+            return exercises.none()
+
+        return exercises.filter(pk__in=RawSQL(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [_fts_query(query)],
+        ))
+
+    for token in tokens:
+        exercises = exercises.filter(name__icontains=token)
+
+    return exercises
+
+def _document(exercise):
+    return [
+        exercise.pk,
+        exercise.name,
+        ' '.join(m.name for m in exercise.muscle_groups.all()),
+        ' '.join(e.name for e in exercise.equipment.all()),
+        ' '.join(t.name for t in exercise.tags.all()),
+    ]
+
+def index_exercises(pks):
+    """
+    (Re)index exercises in the FTS table.
+    """
+    connection = connections[router.db_for_write(Exercise)]
+    if connection.vendor != 'sqlite':
+        return
+
+    pks = list(pks)
+    exercises = Exercise.objects.filter(pk__in=pks).prefetch_related(
+        'muscle_groups', 'equipment', 'tags',
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [[pk] for pk in pks])
+        cursor.executemany(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, muscle_groups, equipment, tags) "
+            f"VALUES (%s, %s, %s, %s, %s)",
+            [_document(exercise) for exercise in exercises],
+        )
+
+def rebuild_index(batch_size=1000):
+    """
+    Index every exercise, e.g. after a bulk import (bulk_create() doesn't
+    send the signals keeping the index up to date). Return the number of
+    indexed exercises.
+    """
+    pks = list(Exercise.objects.order_by('pk').values_list('pk', flat=True))
+    for batch in batched(pks, batch_size):
+        with transaction.atomic():
+            index_exercises(batch)
+
+    return len(pks)
+
+def unindex_exercises(pks):
+    connection = connections[router.db_for_write(Exercise)]
+    if connection.vendor != 'sqlite':
+        return
+
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [[pk] for pk in pks])
@@ -0,0 +1,84 @@
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import search
+from .models import (
+    Equipment, Exercise, MuscleGroup, Program, Schedule, ScheduleRule, Tag, Workout, Worksheet,
+)
+
+CALENDAR_VERSION_KEY = 'worksheet:calendar:version'
+
+def get_calendar_version():
+    """
+    Opaque version of the data displayed by the calendar views (and the
+    workouts and schedule of the API), changed every time a worksheet, a
+    schedule (or one of its rules) or a workout (or its program) is modified.
+    """
+    return cache.get_or_set(CALENDAR_VERSION_KEY, lambda: uuid.uuid4().hex, timeout=None)
+
+def change_calendar_version():
+    """
+    Change the version of the calendar data, e.g. after bulk updates of
+    worksheets, which don't send any signal.
+    """
+    cache.set(CALENDAR_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+
+@receiver([post_save, post_delete], sender=Worksheet)
+@receiver([post_save, post_delete], sender=Schedule)
+@receiver([post_save, post_delete], sender=ScheduleRule)
+@receiver([post_save, post_delete], sender=Workout)
+@receiver([post_save, post_delete], sender=Program)
+def invalidate_calendar(sender, **kwargs):
+    # Once committed, so that the old data isn't cached under the new version
+    transaction.on_commit(change_calendar_version)
+
+# Exercise search index
+
+@receiver(post_save, sender=Exercise)
+def index_exercise(sender, instance, **kwargs):
+    search.index_exercises([instance.pk])
+
+@receiver(post_delete, sender=Exercise)
+def unindex_exercise(sender, instance, **kwargs):
+    search.unindex_exercises([instance.pk])
+
+@receiver(m2m_changed, sender=Exercise.muscle_groups.through)
+@receiver(m2m_changed, sender=Exercise.equipment.through)
+@receiver(m2m_changed, sender=Exercise.tags.through)
+def index_exercise_facets(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            search.index_exercises([instance.pk])
+        return
+
+    # Changed from a muscle group, equipment or tag: clearing doesn't tell
+    # which exercises were concerned
+    if action == 'pre_clear':
+        instance._indexed_exercises = list(instance.exercise_set.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        search.index_exercises(instance.__dict__.pop('_indexed_exercises', []))
+    elif action in ('post_add', 'post_remove'):
+        search.index_exercises(pk_set)
+
+@receiver(post_save, sender=MuscleGroup)
+@receiver(post_save, sender=Equipment)
+@receiver(post_save, sender=Tag)
+def index_facet_exercises(sender, instance, created, **kwargs):
+    if not created:
+        search.index_exercises(instance.exercise_set.values_list('pk', flat=True))
+
+@receiver(pre_delete, sender=MuscleGroup)
+@receiver(pre_delete, sender=Equipment)
+@receiver(pre_delete, sender=Tag)
+def collect_facet_exercises(sender, instance, **kwargs):
+    instance._indexed_exercises = list(instance.exercise_set.values_list('pk', flat=True))
+
+@receiver(post_delete, sender=MuscleGroup)
+@receiver(post_delete, sender=Equipment)
+@receiver(post_delete, sender=Tag)
+def reindex_facet_exercises(sender, instance, **kwargs):
+    search.index_exercises(instance.__dict__.pop('_indexed_exercises', []))
@@ -0,0 +1,17 @@
+// Pick an exercise among the results of an autocomplete widget
+document.addEventListener('click', function(ev) {
+    const button = ev.target.closest('.exercise-autocomplete-results button');
+    if (button === null) {
+        return;
+    }
+
+    const widget = button.closest('.exercise-autocomplete');
+    widget.querySelector('input[type=hidden]').value = button.dataset.id;
+    widget.querySelector('input[type=search]').value = button.dataset.name;
+    button.closest('ul').replaceChildren();
+});
+
+// Rows added to admin inlines are copies of a template, unknown to htmx
+document.addEventListener('formset:added', function(ev) {
+    htmx.process(ev.target);
+});
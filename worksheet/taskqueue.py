@@ -0,0 +1,333 @@
+"""
+Lightweight task queue backed by the Task table, for work that shouldn't delay
+responses (e.g. what follows the closing of a worksheet).
+
+Tasks are enqueued in the transaction of the change that triggers them, and
+run by a pool of threads: either by `manage.py run_tasks` workers, or, when
+enabled in single-process deployments, inside the web server process
+(TASK_WORKERS threads, started by the WSGI application). Workers claim tasks with a conditional UPDATE,
+so that any number of them can share the queue. Failed tasks are retried with
+an exponential backoff, and tasks must be idempotent: a task interrupted by a
+crash runs again. Periodic tasks are enqueued again after each run, and when
+the workers start.
+"""
+import datetime
+import logging
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Avg, Count, F, Min
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+def task(name=None, max_attempts=5, every=None):
+    """
+    Register a function as a task, run with the keyword arguments given to
+    enqueue(). Periodic tasks run (without arguments) `every` seconds, which
+    can also be a function returning them (e.g. from the settings), 0 or None
+    disabling them.
+    """
+    def decorator(func):
+        func.task_name = name or f"{func.__module__}.{func.__name__}"
+        func.max_attempts = max_attempts
+        func.every = every
+        _registry[func.task_name] = func
+
+        return func
+
+    return decorator
+
+def enqueue(name, *, key=None, delay=0, **kwargs):
+    """
+    Add a task to the queue, unless a pending task has the same key. The task
+    is only visible to workers once the current transaction is committed.
+    """
+    Task = apps.get_model('worksheet', 'Task')
+    func = _registry.get(name)
+    if func is None:
+        raise KeyError(f"Unknown task {name}")
+
+    now = timezone.now()
+    while True:
+        try:
+            with transaction.atomic():
+                task = Task.objects.create(
+                    name=name,
+                    kwargs=kwargs,
+                    key=key,
+                    max_attempts=func.max_attempts,
+                    created_at=now,
+                    run_at=now + datetime.timedelta(seconds=delay),
+                )
+            break
+        except IntegrityError:
+            if key is None:
+                raise
+            # The pending task may have been claimed since, freeing its key
+            if (pending := Task.objects.filter(key=key, status=Task.PENDING).first()) is not None:
+                return pending
+
+    transaction.on_commit(_wakeup.set)
+
+    return task
+
+def get_interval(func):
+    """
+    The number of seconds between two runs of a periodic task, or None.
+    """
+    every = func.every() if callable(func.every) else func.every
+
+    return every or None
+
+def schedule_periodic():
+    """
+    Enqueue the next run of each periodic task, unless it is already pending.
+    Return the number of periodic tasks.
+    """
+    scheduled = 0
+    for name, func in _registry.items():
+        if interval := get_interval(func):
+            enqueue(name, key=name, delay=interval)
+            scheduled += 1
+
+    return scheduled
+
+def get_backoff(attempts):
+    """
+    The delay (in seconds) before retrying a task that failed `attempts`
+    times.
+    """
+    base = getattr(settings, 'TASK_RETRY_BACKOFF', 10)
+    maximum = getattr(settings, 'TASK_RETRY_MAX_DELAY', 60 * 60)
+
+    return min(base * 2 ** (attempts - 1), maximum)
+
+def claim(limit):
+    """
+    Mark at most `limit` due tasks as running, and return them. Tasks claimed
+    by another worker in the meantime are skipped.
+    """
+    Task = apps.get_model('worksheet', 'Task')
+    now = timezone.now()
+
+    claimed = []
+    due = Task.objects.filter(status=Task.PENDING, run_at__lte=now).order_by('run_at')
+    for task in due[:limit]:
+        if Task.objects.filter(pk=task.pk, status=Task.PENDING).update(
+            status=Task.RUNNING, started_at=now, attempts=F('attempts') + 1,
+        ):
+            task.status, task.started_at, task.attempts = Task.RUNNING, now, task.attempts + 1
+            claimed.append(task)
+
+    return claimed
+
+def execute(task):
+    """
+    Run a claimed task, then mark it as done, or schedule its retry.
+    """
+    Task = apps.get_model('worksheet', 'Task')
+
+    try:
+        func = _registry[task.name]
+        func(**task.kwargs)
+    except Exception:
+        logger.exception("Task %s (#%s) failed, attempt %s of %s",
+                         task.name, task.pk, task.attempts, task.max_attempts)
+        task.last_error = traceback.format_exc()
+        if task.attempts >= task.max_attempts:
+            task.status = Task.FAILED
+            task.finished_at = timezone.now()
+        else:
+            task.status = Task.PENDING
+            task.run_at = timezone.now() + datetime.timedelta(seconds=get_backoff(task.attempts))
+    else:
+        task.status = Task.DONE
+        task.finished_at = timezone.now()
+        if interval := get_interval(func):
+            enqueue(task.name, key=task.name, delay=interval)
+
+    try:
+        task.save(update_fields=['status', 'run_at', 'finished_at', 'last_error'])
+    except IntegrityError:
+        # The same task was enqueued again while this one was running, the
+        # pending one will do the work
+        Task.objects.filter(pk=task.pk).update(status=Task.DONE, finished_at=timezone.now())
+
+    return task.status
+
+def requeue_stale(timeout):
+    """
+    Put back in the queue the tasks running for more than `timeout` seconds,
+    whose worker most likely died.
+    """
+    Task = apps.get_model('worksheet', 'Task')
+    before = timezone.now() - datetime.timedelta(seconds=timeout)
+
+    return Task.objects.filter(status=Task.RUNNING, started_at__lt=before).update(
+        status=Task.PENDING, run_at=timezone.now(),
+    )
+
+def purge(days):
+    """
+    Delete the tasks done more than `days` days ago.
+    """
+    Task = apps.get_model('worksheet', 'Task')
+    before = timezone.now() - datetime.timedelta(days=days)
+
+    return Task.objects.filter(status=Task.DONE, finished_at__lt=before).delete()[0]
+
+def get_stats(window=60 * 60):
+    """
+    Queue metrics: the number of tasks by status, the number of due tasks and
+    the age of the oldest one, and the average latency (from due to started)
+    and duration of the tasks done in the last `window` seconds.
+    """
+    Task = apps.get_model('worksheet', 'Task')
+    now = timezone.now()
+
+    stats = {status: 0 for status in Task.STATUS_CHOICES}
+    stats.update(Task.objects.values_list('status').annotate(Count('pk')).order_by())
+
+    due = Task.objects.filter(status=Task.PENDING, run_at__lte=now).aggregate(
+        count=Count('pk'), oldest=Min('run_at'),
+    )
+    done = Task.objects.filter(
+        status=Task.DONE, finished_at__gte=now - datetime.timedelta(seconds=window),
+    ).aggregate(
+        latency=Avg(F('started_at') - F('run_at')),
+        duration=Avg(F('finished_at') - F('started_at')),
+    )
+
+    stats.update({
+        'due': due['count'],
+        'oldest_due_age': now - due['oldest'] if due['oldest'] else None,
+        'latency': done['latency'],
+        'duration': done['duration'],
+    })
+
+    return stats
+
+# Set when tasks are enqueued, to wake up the in-process workers
+_wakeup = threading.Event()
+
+class Worker:
+    """
+    Poll the queue and run the due tasks with a pool of threads. Tasks left
+    running for more than `stale_after` seconds by a dead worker are put back
+    in the queue.
+    """
+    def __init__(self, threads=2, poll_interval=5, stale_after=60 * 60):
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.stopped = threading.Event()
+        self._slots = threading.Semaphore(threads)
+
+    def run_once(self):
+        """
+        Run the tasks due now, and return how many were run.
+        """
+        with ThreadPoolExecutor(self.threads, thread_name_prefix='task') as pool:
+            tasks = claim(self.threads * 10)
+            list(pool.map(self._execute, tasks))
+
+        return len(tasks)
+
+    def run(self):
+        """
+        Run tasks until stopped, waking up on enqueued tasks (in the same
+        process) or every `poll_interval` seconds.
+        """
+        close_old_connections()
+        try:
+            schedule_periodic()
+        except Exception:
+            logger.exception("Could not schedule the periodic tasks")
+
+        requeue_at = 0
+        with ThreadPoolExecutor(self.threads, thread_name_prefix='task') as pool:
+            while not self.stopped.is_set():
+                if time.monotonic() >= requeue_at:
+                    self._requeue_stale()
+                    requeue_at = time.monotonic() + self.stale_after
+
+                _wakeup.clear()
+                tasks = self._claim()
+                for task in tasks:
+                    pool.submit(self._execute_and_release, task)
+
+                if not tasks:
+                    _wakeup.wait(self.poll_interval)
+
+    def stop(self):
+        self.stopped.set()
+        _wakeup.set()
+
+    def _requeue_stale(self):
+        close_old_connections()
+        try:
+            if requeued := requeue_stale(self.stale_after):
+                logger.warning("Requeued %s stale task(s)", requeued)
+        except Exception:
+            logger.exception("Could not requeue the stale tasks")
+
+    def _claim(self):
+        # Only claim tasks for idle threads, leaving the others to other
+        # workers
+        if not self._slots.acquire(timeout=self.poll_interval):
+            return []
+        limit = 1
+        while limit < self.threads and self._slots.acquire(blocking=False):
+            limit += 1
+
+        close_old_connections()
+        try:
+            tasks = claim(limit)
+        except Exception:
+            logger.exception("Could not claim tasks")
+            tasks = []
+
+        for _ in range(limit - len(tasks)):
+            self._slots.release()
+
+        return tasks
+
+    def _execute(self, task):
+        close_old_connections()
+        try:
+            return execute(task)
+        finally:
+            close_old_connections()
+
+    def _execute_and_release(self, task):
+        try:
+            return self._execute(task)
+        finally:
+            self._slots.release()
+
+_worker = None
+
+def start_workers():
+    """
+    Start TASK_WORKERS threads in the current process, in the background. Off
+    by default: each process of the web server would poll the queue.
+    """
+    global _worker
+
+    threads = getattr(settings, 'TASK_WORKERS', 0)
+    if threads <= 0 or _worker is not None:
+        return None
+
+    _worker = Worker(threads, getattr(settings, 'TASK_POLL_INTERVAL', 5),
+                     getattr(settings, 'TASK_STALE_AFTER', 60 * 60))
+    threading.Thread(target=_worker.run, name='task-dispatcher', daemon=True).start()
+
+    return _worker
@@ -0,0 +1,48 @@
+"""
+Deferred tasks, see worksheet.taskqueue.
+"""
+import datetime
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import events
+from .models import Worksheet
+from .taskqueue import task
+
+@task(name='worksheet.closed')
+def worksheet_closed(worksheet_id):
+    """
+    Work following the closing of a worksheet: compact its set events, and
+    archive the results of the worksheets that just got old enough (if
+    ARCHIVE_ON_CLOSE is set).
+    """
+    _closed([worksheet_id])
+
+@task(name='worksheet.auto_closed')
+def worksheets_auto_closed(worksheet_ids):
+    """
+    Work following the closing of abandoned worksheets, see
+    WorksheetManager.close_all().
+    """
+    _closed(worksheet_ids)
+
+@task(name='worksheet.auto_close', every=lambda: getattr(settings, 'AUTO_CLOSE_INTERVAL', 0))
+def auto_close():
+    """
+    Close the abandoned worksheets, every AUTO_CLOSE_INTERVAL seconds (if
+    set).
+    """
+    Worksheet.objects.close_all(Worksheet.objects.get_stale())
+
+def _closed(worksheet_ids):
+    events.compact(worksheet_ids)
+
+    # Archiving is opt-in, see the archive_worksheets command otherwise
+    if not getattr(settings, 'ARCHIVE_ON_CLOSE', False):
+        return
+
+    days = getattr(settings, 'ARCHIVE_AFTER_DAYS', 180)
+    keep = getattr(settings, 'ARCHIVE_KEEP_PER_WORKOUT', 3)
+
+    Worksheet.objects.archive(timezone.localdate() - datetime.timedelta(days=days), keep=keep)
@@ -0,0 +1,70 @@
+import base64
+import functools
+import hashlib
+import os
+
+from django import template
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+
+from workout_tracker.storage import find_static
+
+register = template.Library()
+
+def _hash(content):
+    digest = hashlib.sha512(content).digest()
+
+    return f"sha512-{base64.b64encode(digest).decode()}"
+
+@functools.cache
+def _collected_integrity(path):
+    # Collected files never change for the lifetime of the process
+    with staticfiles_storage.open(path) as f:
+        return _hash(f.read())
+
+@functools.lru_cache(maxsize=256)
+def _source_integrity(absolute_path, mtime_ns):
+    # Computed again when the file is modified
+    with open(absolute_path, 'rb') as f:
+        return _hash(f.read())
+
+def _integrity(path, bundled):
+    """
+    Compute the subresource integrity hash of a static file, read from
+    STATIC_ROOT when bundling is enabled, and from the app directories
+    otherwise (so that edits are picked up during development).
+    """
+    if bundled:
+        return _collected_integrity(path)
+
+    absolute_path = find_static(path)
+
+    return _source_integrity(absolute_path, os.stat(absolute_path).st_mtime_ns)
+
+def _tag(path, bundled):
+    if path.endswith('.js'):
+        return format_html(
+            '<script src="{}" integrity="{}"></script>',
+            static(path), _integrity(path, bundled),
+        )
+
+    return format_html(
+        '<link rel="stylesheet" href="{}" integrity="{}">',
+        static(path), _integrity(path, bundled),
+    )
+
+@register.simple_tag
+def bundle(name):
+    """
+    Include the static files of a bundle defined in STATIC_BUNDLES, either as
+    the single (collected) bundle file when STATIC_BUNDLING is enabled, or as
+    individual files otherwise.
+    """
+    if getattr(settings, 'STATIC_BUNDLING', False):
+        return _tag(name, True)
+
+    return format_html_join(
+        '\n', '{}', ((_tag(path, False),) for path in settings.STATIC_BUNDLES[name])
+    )
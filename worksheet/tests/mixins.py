@@ -1,4 +1,5 @@
 from django.conf import settings
+from django.core.cache import cache
 from django.urls import reverse
 from django.utils import timezone
 
@@ -31,6 +32,12 @@ class ProgramSetupMixin:
 
         timezone.activate(getattr(settings, "USER_TIME_ZONE", settings.TIME_ZONE))
 
+    def setUp(self):
+        super().setUp()
+        # Cached data is invalidated by signals, which aren't sent when the
+        # database of the previous test is rolled back
+        cache.clear()
+
 class WorksheetMixin(ProgramSetupMixin):
     """
     This class contains facilities to create and update a worksheet associated
@@ -0,0 +1,158 @@
+import datetime
+
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from worksheet.models import Schedule, Worksheet
+from worksheet.tests.mixins import WorksheetMixin
+
+class WorksheetApiTests(WorksheetMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        now = timezone.localtime()
+        self.worksheets = [
+            self._create_worksheet(started_at=now - datetime.timedelta(days=days), done=True)
+            for days in [5, 4, 3, 2, 1]
+        ]
+
+    def _get(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+
+        return response.json()
+
+    def test_cursor_pagination(self):
+        url = reverse('worksheet:api:worksheets')
+        seen = []
+        page = self._get(url, limit=2, fields='id,date')
+        while True:
+            seen += [item['id'] for item in page['data']]
+            self.assertEqual(set(page['data'][0]), {'id', 'date'})
+            if page['next'] is None:
+                break
+            page = self.client.get(page['next']).json()
+
+        self.assertEqual(seen, [w.pk for w in self.worksheets])
+
+    def test_embedded_results(self):
+        self.worksheets[0].result_set.update(reps=12)
+
+        with self.assertNumQueries(3):
+            data = self._get(reverse('worksheet:api:worksheets'), embed='results', fields='id')['data']
+
+        self.assertEqual(len(data[0]['results']), 4)
+        self.assertEqual(data[0]['results'][0]['reps'], 12)
+
+    def test_archived_results(self):
+        self.worksheets[0].result_set.update(reps=12)
+        Worksheet.objects.archive(timezone.localdate() - datetime.timedelta(days=3))
+
+        data = self._get(reverse('worksheet:api:worksheet', args=[self.worksheets[0].pk]))['data']
+
+        self.assertEqual([r['reps'] for r in data['results']], [12] * 4)
+        self.assertIsNone(data['results'][0]['id'])
+
+    def test_updated_since(self):
+        url = reverse('worksheet:api:worksheets')
+        worksheet = self._create_worksheet()
+        until = self._get(url)['updated_until']
+
+        self.assertEqual(self._get(url, updated_since=until)['data'], [])
+
+        # Updating results through the view marks the worksheet as updated
+        response = self._update_worksheet_result(worksheet, worksheet.result_set.first().pk, 'reps', 8)
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(Worksheet.objects.get(pk=worksheet.pk).updated_at, worksheet.updated_at)
+
+        data = self._get(url, updated_since=until, fields='id')['data']
+        self.assertEqual(data, [{'id': worksheet.pk}])
+
+    def test_empty_selection(self):
+        url = reverse('worksheet:api:worksheets')
+        until = self._get(url)['updated_until']
+
+        # Nothing updated since: the next sync starts from the same point
+        page = self._get(url, updated_since=until)
+        self.assertEqual(page['data'], [])
+        self.assertEqual(page['updated_until'], until)
+
+        Worksheet.objects.all().delete()
+        self.assertEqual(self._get(url)['updated_until'], '1970-01-01T00:00:00Z')
+
+    def test_archiving(self):
+        """
+        Archived and restored worksheets, whose results change ids, are synced
+        again and get a new ETag.
+        """
+        url = reverse('worksheet:api:worksheets')
+        response = self.client.get(url, {'embed': 'results'})
+        etag, until = response.headers['ETag'], response.json()['updated_until']
+        worksheet = self.worksheets[0]
+
+        Worksheet.objects.archive(timezone.localdate() - datetime.timedelta(days=4))
+
+        response = self.client.get(url, {'embed': 'results'}, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+        data = self._get(url, updated_since=until, embed='results')['data']
+        self.assertEqual([item['id'] for item in data], [worksheet.pk])
+        self.assertIsNone(data[0]['results'][0]['id'])
+
+        until = response.json()['updated_until']
+        Worksheet.objects.unarchive([worksheet.pk])
+
+        response = self.client.get(url, {'embed': 'results'}, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        data = self._get(url, updated_since=until, embed='results')['data']
+        self.assertEqual([item['id'] for item in data], [worksheet.pk])
+        self.assertIsNotNone(data[0]['results'][0]['id'])
+
+    def test_conditional_requests(self):
+        url = reverse('worksheet:api:worksheets')
+        response = self.client.get(url)
+        etag = response.headers['ETag']
+
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        self.worksheets[0].close().save()
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_invalid_parameters(self):
+        url = reverse('worksheet:api:worksheets')
+        for params in [{'fields': 'id,password'}, {'cursor': 'garbage'}, {'limit': 'x'},
+                       {'updated_since': 'yesterday'}]:
+            with self.subTest(params=params):
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+
+        response = self.client.get(reverse('worksheet:api:worksheet', args=[1000]))
+        self.assertEqual(response.status_code, 404)
+
+class WorkoutApiTests(WorksheetMixin, TestCase):
+    def test_workouts(self):
+        data = self.client.get(reverse('worksheet:api:workouts')).json()['data']
+
+        self.assertEqual(data, [{
+            'id': self.workout.pk,
+            'name': "Test workout",
+            'repeat': False,
+            'exercises': list(self.workout.exercises.order_by('program').values_list('pk', flat=True)),
+        }])
+
+    def test_schedule(self):
+        today = timezone.localdate()
+        Schedule.objects.create(day=today.isoweekday(), workout=self.workout)
+        url = reverse('worksheet:api:schedule')
+
+        data = self.client.get(url, {'start': today, 'end': today + datetime.timedelta(days=13)}).json()['data']
+
+        self.assertEqual(data['weekly'], [{'day': today.isoweekday(), 'workout': self.workout.pk}])
+        self.assertEqual(len(data['planned']), 2)
+        self.assertEqual(data['planned'][0], {'date': today.isoformat(), 'workout': self.workout.pk, 'deload': False})
+
+        response = self.client.get(url, {'start': today, 'end': today - datetime.timedelta(days=1)})
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,176 @@
+import os
+import subprocess
+import sys
+import tempfile
+from io import StringIO
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import LiveServerTestCase, SimpleTestCase, TestCase, TransactionTestCase
+from django.utils import timezone
+
+from worksheet import benchmarks, events
+from worksheet.management.commands.check_startup import parse_importtime
+from worksheet.loadtest import percentile
+from worksheet.models import Exercise, Program, Result, Schedule, Workout, Worksheet
+
+class CheckStartupCommandTests(SimpleTestCase):
+    def test_parse_importtime(self):
+        output = "\n".join([
+            "import time: self [us] | cumulative | imported package",
+            "import time:       120 |        120 |   _io",
+            "import time:       300 |        420 | io",
+            "import time:        50 |         50 |     django.utils.version",
+        ])
+
+        self.assertEqual(parse_importtime(output), [
+            ('_io', 1, 120, 120),
+            ('io', 0, 300, 420),
+            ('django.utils.version', 2, 50, 50),
+        ])
+
+    def test_within_budget(self):
+        out = StringIO()
+        call_command('check_startup', '--runs', '1', '--import-budget', '60000',
+                     '--coldstart-budget', '60000', stdout=out)
+
+        self.assertIn("Profile: production", out.getvalue())
+        self.assertIn("Startup within budget", out.getvalue())
+        self.assertNotIn("debug_toolbar", out.getvalue())
+
+    def test_over_budget(self):
+        with self.assertRaisesMessage(CommandError, "Startup budget exceeded"):
+            call_command('check_startup', '--runs', '1', '--top', '0',
+                         '--import-budget', '1', stdout=StringIO())
+
+    def test_no_runs(self):
+        with self.assertRaisesMessage(CommandError, "At least one run is needed"):
+            call_command('check_startup', '--runs', '0', stdout=StringIO())
+
+    def test_production_needs_secret_key(self):
+        env = {key: value for key, value in os.environ.items() if key != 'WORKOUT_TRACKER_SECRET_KEY'}
+        env['WORKOUT_TRACKER_ENV'] = 'production'
+
+        process = subprocess.run(
+            [sys.executable, '-c', 'import workout_tracker.settings'],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+
+        self.assertNotEqual(process.returncode, 0)
+        self.assertIn("WORKOUT_TRACKER_SECRET_KEY must be set in production", process.stderr)
+
+class BackupCommandsTests(TransactionTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.backup = Path(tmp.name) / 'backup.sqlite3'
+
+        # Data can't be created once per class, TransactionTestCase flushes the
+        # database after each test
+        workout = Workout.objects.create(name="Test workout")
+        for name in ["Exercise 1", "Exercise 2"]:
+            Program.objects.create(workout=workout, exercise=Exercise.objects.create(name=name))
+        self.workout = workout
+
+    def test_backup_and_restore(self):
+        worksheet, _ = Worksheet.objects.get_or_create(workout=self.workout)
+
+        out = StringIO()
+        call_command('backup_db', str(self.backup), '--pages', '1', '--sleep', '0', stdout=out)
+        self.assertIn("Backed up to", out.getvalue())
+        self.assertTrue(Path(f"{self.backup}.sha256").is_file())
+
+        worksheet.delete()
+        self.assertEqual(Worksheet.objects.count(), 0)
+
+        out = StringIO()
+        call_command('restore_db', str(self.backup), '--noinput', stdout=out)
+        self.assertIn("Restored", out.getvalue())
+        self.assertEqual(Worksheet.objects.count(), 1)
+        self.assertEqual(Worksheet.objects.get().result_set.count(), 2)
+
+    def test_restore_corrupted_backup(self):
+        call_command('backup_db', str(self.backup), stdout=StringIO())
+        with open(self.backup, 'ab') as f:
+            f.write(b'garbage')
+
+        with self.assertRaisesMessage(CommandError, "Checksum mismatch"):
+            call_command('restore_db', str(self.backup), '--noinput', stdout=StringIO())
+
+class PercentileTests(SimpleTestCase):
+    def test_percentile(self):
+        values = list(range(1, 101))
+
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([3], 95), 3)
+        self.assertIsNone(percentile([], 50))
+
+class BenchmarkTests(TestCase):
+    def test_run(self):
+        benchmarks.setup_workouts(exercises=6)
+
+        results = benchmarks.run([0, 3], number=2, repeat=1)
+
+        self.assertEqual(len(results), 2 * len(benchmarks.get_benchmarks()))
+        self.assertGreater(results['create_all@3']['median'], 0)
+        # Samples are rolled back, only the history is left
+        self.assertEqual(Worksheet.objects.count(), 3)
+        self.assertEqual(Worksheet.objects.filter(done=True).count(), 3)
+        self.assertEqual(Result.objects.count(), 3 * 6)
+
+    def test_compare(self):
+        baseline = {'a@0': {'median': 100}, 'b@0': {'median': 100}, 'c@0': {'median': 100}}
+        results = {'a@0': {'median': 110}, 'b@0': {'median': 150}, 'd@0': {'median': 500}}
+
+        self.assertEqual(benchmarks.compare(results, baseline, 0.2), [('b@0', 100, 150, 1.5)])
+
+class LocalLoadTestCommandTests(SimpleTestCase):
+    def test_local_server(self):
+        """
+        The local server runs on a database of its own, leaving the one of the
+        tests alone, and serves its requests whatever the allowed hosts.
+        """
+        test_database = Path(settings.DATABASES['default']['NAME'])
+        env = {**os.environ, 'WORKOUT_TRACKER_ALLOWED_HOSTS': 'workout.example.com'}
+
+        process = subprocess.run(
+            [sys.executable, 'manage.py', 'loadtest', '--users', '2', '--rounds', '1',
+             '--updates', '3', '--think', '0'],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+
+        self.assertEqual(process.returncode, 0, process.stderr)
+        self.assertIn("Error rate: 0.00%", process.stdout)
+        self.assertTrue(test_database.is_file())
+
+class LoadTestCommandTests(LiveServerTestCase):
+    def setUp(self):
+        workout = Workout.objects.create(name="Test workout")
+        for name in ["Exercise 1", "Exercise 2"]:
+            Program.objects.create(workout=workout, exercise=Exercise.objects.create(name=name, weight=True))
+        Schedule.objects.create(day=timezone.localdate().isoweekday(), workout=workout)
+
+    def tearDown(self):
+        # Set events buffered by the server, before the database is flushed
+        events.flush()
+        super().tearDown()
+
+    def test_loadtest_running_server(self):
+        out = StringIO()
+        call_command('loadtest', '--url', self.live_server_url, '--users', '3', '--rounds', '1',
+                     '--updates', '5', '--reload-every', '2', '--think', '0', stdout=out)
+
+        output = out.getvalue()
+        self.assertIn("3 thread(s), 1 round(s), 30 requests", output)
+        self.assertIn("Error rate: 0.00%", output)
+        self.assertRegex(output, r"update\s+15\s+0\s+0")
+
+        worksheet = Worksheet.objects.get()
+        self.assertTrue(worksheet.done)
+
+    def test_rounds_against_running_server(self):
+        with self.assertRaisesMessage(CommandError, "Only one round"):
+            call_command('loadtest', '--url', self.live_server_url, '--rounds', '2')
@@ -0,0 +1,141 @@
+import datetime
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from worksheet import events
+from worksheet.models import SetEvent, Worksheet, WorksheetLog
+from worksheet.tests.mixins import WorksheetMixin
+
+# No timer during the tests, events are flushed explicitly
+@override_settings(EVENT_LOG_FLUSH_DELAY=3600)
+class SetEventTests(WorksheetMixin, TestCase):
+    def tearDown(self):
+        events.flush()
+        super().tearDown()
+
+    def _log(self, worksheet, *entries):
+        """
+        Log (seconds since the start, result, field, value) events.
+        """
+        SetEvent.objects.bulk_create([
+            SetEvent(worksheet=worksheet, result_id=result.pk, field=field, value=value,
+                     created_at=worksheet.started_at + datetime.timedelta(seconds=seconds))
+            for seconds, result, field, value in entries
+        ])
+
+    def test_result_updates_are_logged_in_batches(self):
+        worksheet = self._create_worksheet()
+        results = list(worksheet.result_set.all())
+
+        with override_settings(EVENT_LOG_BATCH_SIZE=3):
+            with self.captureOnCommitCallbacks(execute=True):
+                self._update_worksheet_result(worksheet, results[0].pk, 'reps', 8)
+                self._update_worksheet_result(worksheet, results[0].pk, 'weight', 20)
+            self.assertEqual(SetEvent.objects.count(), 0)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                self._update_worksheet(worksheet, reps=[8, 10, 0, 0], weights=[20, '', '', ''])
+
+        # The form only changed the reps of the second result
+        self.assertEqual(list(SetEvent.objects.order_by('pk').values_list('result_id', 'field', 'value')), [
+            (results[0].pk, SetEvent.REPS, 8),
+            (results[0].pk, SetEvent.WEIGHT, 20),
+            (results[1].pk, SetEvent.REPS, 10),
+        ])
+
+    def test_failed_updates_are_not_logged(self):
+        worksheet = self._create_worksheet()
+        result = worksheet.result_set.first()
+
+        with override_settings(EVENT_LOG_BATCH_SIZE=1), self.captureOnCommitCallbacks(execute=True):
+            self._update_worksheet_result(worksheet, result.pk, 'reps', -1)
+
+        self.assertEqual(SetEvent.objects.count(), 0)
+
+    def test_analytics(self):
+        worksheet = self._create_worksheet()
+        results = list(worksheet.result_set.all())
+        self._log(
+            worksheet,
+            (60, results[0], SetEvent.REPS, 8),
+            (70, results[0], SetEvent.WEIGHT, 20),
+            (180, results[1], SetEvent.REPS, 10),
+            # A correction
+            (200, results[0], SetEvent.REPS, 9),
+            (330, results[2], SetEvent.REPS, 5),
+        )
+
+        analytics = events.analyze(events.get_events(worksheet), worksheet.started_at)
+
+        self.assertEqual([position for _, position, _ in analytics['sets']], [0, 1, 2])
+        self.assertEqual(analytics['rest_times'], [datetime.timedelta(seconds=120), datetime.timedelta(seconds=150)])
+        self.assertEqual(analytics['exercise_times'], {
+            results[0].exercise_id: datetime.timedelta(seconds=60),
+            results[1].exercise_id: datetime.timedelta(seconds=120),
+            results[2].exercise_id: datetime.timedelta(seconds=150),
+        })
+        self.assertEqual([(edit.position, edit.old, edit.new) for edit in analytics['edits']], [(0, 8, 9)])
+
+    def test_compaction(self):
+        worksheet = self._create_worksheet(done=True)
+        results = list(worksheet.result_set.all())
+        self._log(
+            worksheet,
+            (60, results[0], SetEvent.REPS, 8),
+            (180, results[1], SetEvent.REPS, 10),
+        )
+        before = events.get_events(worksheet)
+
+        self.assertEqual(events.compact(), 1)
+
+        self.assertEqual(SetEvent.objects.count(), 0)
+        log = WorksheetLog.objects.get(worksheet=worksheet)
+        self.assertEqual((log.sets, log.edits, log.rest_time), (2, 0, datetime.timedelta(seconds=120)))
+        self.assertEqual(events.get_events(worksheet), before)
+
+        # Later events are merged into the log
+        self._log(worksheet, (240, results[1], SetEvent.REPS, 11))
+        events.compact([worksheet.pk])
+
+        log.refresh_from_db()
+        self.assertEqual((log.sets, log.edits), (2, 1))
+        self.assertEqual(len(events.get_events(worksheet)), 3)
+
+    def test_compaction_of_open_and_deleted_worksheets(self):
+        open_worksheet = self._create_worksheet()
+        result = open_worksheet.result_set.first()
+        self._log(open_worksheet, (60, result, SetEvent.REPS, 8))
+        SetEvent.objects.create(worksheet_id=open_worksheet.pk + 100, result_id=0, field=SetEvent.REPS, value=1)
+
+        out = StringIO()
+        call_command('compact_events', stdout=out)
+
+        self.assertIn("0 worksheet(s)", out.getvalue())
+        self.assertEqual(list(SetEvent.objects.values_list('worksheet', flat=True)), [open_worksheet.pk])
+
+    def test_close_compacts_events(self):
+        worksheet = self._create_worksheet()
+        result = worksheet.result_set.first()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self._update_worksheet_result(worksheet, result.pk, 'reps', 8)
+            Worksheet.objects.close(pk=worksheet.pk)
+        # Run by the task queue
+        events.compact([worksheet.pk])
+
+        self.assertEqual(WorksheetLog.objects.get(worksheet=worksheet).sets, 1)
+
+    def test_admin_set_log(self):
+        worksheet = self._create_worksheet()
+        result = worksheet.result_set.first()
+        self._log(worksheet, (60, result, SetEvent.REPS, 8))
+        self.client.force_login(User.objects.create_superuser('admin'))
+
+        response = self.client.get(reverse('admin:worksheet_worksheet_change', args=[worksheet.pk]))
+
+        self.assertContains(response, "1 set(s)")
+        self.assertContains(response, "Exercise 1: 0:01:00")
@@ -0,0 +1,114 @@
+import datetime
+
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from worksheet import heatmap
+from worksheet.models import Schedule, Worksheet
+from worksheet.tests.mixins import WorksheetMixin
+
+class HeatmapTests(WorksheetMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.today = timezone.localdate()
+        self.year = self.today.year - 1
+        # Every Monday
+        Schedule.objects.create(day=1, workout=self.workout)
+
+    def _worksheet(self, date, done=True, reps=10, weight=20):
+        worksheet = Worksheet.objects.create(workout=self.workout, date=date, done=done)
+        worksheet.result_set(manager="results").create_all()
+        worksheet.result_set.update(reps=reps)
+        worksheet.result_set.filter(exercise__weight=True).update(weight=weight)
+
+        return worksheet
+
+    def _first_monday(self):
+        date = datetime.date(self.year, 1, 1)
+        return date + datetime.timedelta(days=-date.weekday() % 7)
+
+    def test_statuses(self):
+        monday = self._first_monday()
+        self._worksheet(monday)
+        self._worksheet(monday + datetime.timedelta(days=2), done=False)
+
+        days, counts = heatmap.build_year(self.year, self.today)
+        by_date = {day.date: day for day in days}
+
+        self.assertEqual(len(days), (datetime.date(self.year + 1, 1, 1) - datetime.date(self.year, 1, 1)).days)
+        self.assertEqual(by_date[monday].status, heatmap.DONE)
+        self.assertEqual(by_date[monday + datetime.timedelta(days=1)].status, heatmap.REST)
+        self.assertEqual(by_date[monday + datetime.timedelta(days=2)].status, heatmap.IN_PROGRESS)
+        self.assertEqual(by_date[monday + datetime.timedelta(days=7)].status, heatmap.MISSED)
+        self.assertEqual(counts[heatmap.DONE], 1)
+        self.assertEqual(counts[heatmap.PLANNED], 0)
+
+        # Days to come are planned rather than missed
+        days, counts = heatmap.build_year(self.year, datetime.date(self.year, 1, 1))
+        self.assertEqual(counts[heatmap.MISSED], 0)
+
+    def test_volume_levels(self):
+        monday = self._first_monday()
+        for week, reps in enumerate([1, 2, 3, 4, 5, 6, 7, 8]):
+            self._worksheet(monday + datetime.timedelta(weeks=week), reps=reps)
+        # Archived worksheets count as well
+        archived = self._worksheet(monday + datetime.timedelta(weeks=8), reps=9)
+        Worksheet.objects.archive(self.today)
+
+        with self.assertNumQueries(1):
+            volumes = heatmap.get_volumes(datetime.date(self.year, 1, 1), datetime.date(self.year, 12, 31))
+
+        # 2 exercises with weights (20kg), 2 without
+        self.assertEqual(volumes[monday], (True, "Test workout", 1 * 20 * 2 + 1 * 2))
+        self.assertEqual(volumes[archived.date][2], 9 * 20 * 2 + 9 * 2)
+
+        days, _ = heatmap.build_year(self.year, self.today)
+        levels = [day.level for day in days if day.status == heatmap.DONE]
+        self.assertEqual(levels, [1, 1, 2, 2, 2, 3, 3, 4, 4])
+        self.assertTrue(all(day.level == 0 for day in days if day.status != heatmap.DONE))
+
+    def test_cached_year(self):
+        worksheet = self._worksheet(self._first_monday())
+        heatmap.get_year(self.year)
+
+        with self.assertNumQueries(1):
+            days, counts = heatmap.get_year(self.year)
+        self.assertEqual(counts[heatmap.DONE], 1)
+
+        # Result updates change the volume
+        worksheet.result_set.update(reps=100)
+        Worksheet.objects.touch(worksheet.pk)
+        days, _ = heatmap.get_year(self.year)
+        self.assertIn("volume 4200", days[worksheet.date.timetuple().tm_yday - 1].title)
+
+        worksheet.delete()
+        _, counts = heatmap.get_year(self.year)
+        self.assertEqual(counts[heatmap.DONE], 0)
+
+    def test_view(self):
+        worksheet = self._worksheet(self._first_monday())
+
+        response = self.client.get(reverse('worksheet:heatmap_year', args=[self.year]), {'years': 2})
+
+        self.assertContains(response, f"Training from {self.year - 1} to {self.year}")
+        self.assertContains(response, worksheet.get_absolute_url())
+        self.assertContains(response, '<section class="heatmap">', 2)
+        self.assertContains(response, "1 workout(s) done")
+
+        response = self.client.get(reverse('worksheet:heatmap'), {'years': 'all'})
+        self.assertContains(response, f"Training from {self.today.year}")
+
+    def test_years_out_of_range(self):
+        for year, years in [(0, 1), (1, 1), (9999, 1), (10000, 1), (3, 3)]:
+            with self.subTest(year=year, years=years):
+                response = self.client.get(reverse('worksheet:heatmap_year', args=[year]), {'years': years})
+                self.assertEqual(response.status_code, 404)
+
+        response = self.client.get(reverse('worksheet:heatmap_year', args=[2]))
+        self.assertNotContains(response, "Previous year")
+        self.assertContains(response, "Next year")
+
+        response = self.client.get(reverse('worksheet:heatmap_year', args=[9998]))
+        self.assertContains(response, "Previous year")
+        self.assertNotContains(response, "Next year")
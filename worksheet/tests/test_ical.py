@@ -0,0 +1,18 @@
+from django.test import SimpleTestCase
+
+from worksheet.ical import escape, fold
+
+class ICalTests(SimpleTestCase):
+    def test_escape(self):
+        self.assertEqual(escape("Chest, Back; Arms\\Legs\n"), "Chest\\, Back\\; Arms\\\\Legs\\n")
+
+    def test_fold(self):
+        self.assertEqual(fold("SUMMARY:short"), "SUMMARY:short\r\n")
+
+        line = "DESCRIPTION:" + "é" * 100
+        folded = fold(line)
+        parts = folded.removesuffix("\r\n").split("\r\n")
+
+        self.assertTrue(all(len(p.encode()) <= 75 for p in parts))
+        self.assertTrue(all(p.startswith(" ") for p in parts[1:]))
+        self.assertEqual("".join(p.removeprefix(" ") if i else p for i, p in enumerate(parts)), line)
@@ -0,0 +1,230 @@
+import datetime
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from worksheet import integrity
+from worksheet.models import Exercise, Program, Result, Workout, Worksheet
+from worksheet.tests.mixins import WorksheetMixin
+
+class IntegrityTests(WorksheetMixin, TestCase):
+    def _check(self, **kwargs):
+        return [discrepancy for _, discrepancies in integrity.check(**kwargs) for discrepancy in discrepancies]
+
+    def _exercises(self, worksheet):
+        return list(worksheet.result_set.values_list('exercise', flat=True))
+
+    def test_compare(self):
+        expected = [1, 2, 3, 1]
+
+        self.assertIsNone(integrity.compare(1, None, False, False, expected, [
+            (10, 1, None, None), (11, 2, None, None), (12, 3, None, None), (13, 1, None, None),
+        ]))
+
+        discrepancy = integrity.compare(1, None, False, False, expected, [
+            (11, 2, None, None), (10, 1, 5, None), (12, 4, None, None), (13, 1, None, None),
+        ])
+        self.assertEqual(discrepancy.missing, [3])
+        self.assertEqual(discrepancy.extra, [4])
+        self.assertTrue(discrepancy.misordered)
+        self.assertEqual(discrepancy.aligned, [
+            (10, 1, 5, None), (11, 2, None, None), None, (13, 1, None, None),
+        ])
+
+        # Archived results have no id, identical entries are told apart
+        discrepancy = integrity.compare(1, None, True, True, [1], [(None, 1, 5, 10), (None, 1, 5, 10)])
+        self.assertEqual((discrepancy.missing, discrepancy.extra, discrepancy.misordered), ([], [1], False))
+
+    def test_check_and_repair(self):
+        sound = self._create_worksheet(started_at=timezone.now() - datetime.timedelta(days=2), done=True)
+        worksheet = self._create_worksheet()
+        results = list(worksheet.result_set.all())
+        results[0].reps = 8
+        results[0].save()
+        # Interrupted creation, and an exercise added to the program afterwards
+        results[1].delete()
+        extra = Program.objects.create(workout=self.workout, exercise=Exercise.objects.create(name="Exercise 5"))
+        Result.objects.filter(pk=results[3].pk).update(_order=0)
+
+        # The workouts and their program, then the worksheets and their results
+        with self.assertNumQueries(4):
+            discrepancies = self._check()
+
+        self.assertEqual([discrepancy.worksheet_id for discrepancy in discrepancies], [sound.pk, worksheet.pk])
+        self.assertEqual(discrepancies[1].missing, [results[1].exercise_id, extra.exercise_id])
+        self.assertTrue(discrepancies[1].misordered)
+
+        self.assertEqual(integrity.repair(discrepancies[1:]), 1)
+
+        exercises = [exercise.pk for exercise in self.workout.get_exercises_in_order()]
+        self.assertEqual(self._exercises(worksheet), exercises)
+        self.assertEqual(worksheet.result_set.get(pk=results[0].pk).reps, 8)
+        self.assertEqual([discrepancy.worksheet_id for discrepancy in self._check()], [sound.pk])
+
+    def test_repair_extra_results(self):
+        worksheet = self._create_worksheet()
+        first = worksheet.result_set.first()
+        Result.objects.bulk_create([
+            Result(worksheet=worksheet, exercise=first.exercise, reps=5, _order=10),
+            Result(worksheet=worksheet, exercise=first.exercise, _order=11),
+        ])
+
+        integrity.repair(self._check())
+
+        # The empty extra result is deleted, the other one is kept at the end
+        exercises = [exercise.pk for exercise in self.workout.get_exercises_in_order()]
+        self.assertEqual(self._exercises(worksheet), exercises + [first.exercise_id])
+        self.assertEqual(list(worksheet.result_set.values_list('_order', flat=True)), list(range(5)))
+
+    def test_archived_worksheets_are_only_reported(self):
+        worksheet = self._create_worksheet(started_at=timezone.now() - datetime.timedelta(days=10), done=True)
+        worksheet.result_set.first().delete()
+        Worksheet.objects.archive(timezone.localdate())
+
+        discrepancies = self._check()
+
+        self.assertTrue(discrepancies[0].archived)
+        self.assertEqual(len(discrepancies[0].missing), 1)
+        self.assertEqual(integrity.repair(discrepancies), 0)
+
+    def test_command(self):
+        done = self._create_worksheet(started_at=timezone.now() - datetime.timedelta(days=2), done=True)
+        done.result_set.first().delete()
+        worksheet = self._create_worksheet()
+        worksheet.result_set.last().delete()
+
+        out = StringIO()
+        call_command('check_worksheets', '--repair', '--chunk-size', '1', stdout=out)
+
+        self.assertIn(f"Worksheet {done.pk} ({done.date}, done): missing exercise(s)", out.getvalue())
+        self.assertIn("Checked 2 worksheet(s)", out.getvalue())
+        self.assertIn("2 with discrepancies, 1 repaired", out.getvalue())
+        self.assertEqual(worksheet.result_set.count(), 4)
+        self.assertEqual(done.result_set.count(), 3)
+
+        out = StringIO()
+        call_command('check_worksheets', '--repair', '--include-done', stdout=out)
+        self.assertIn("1 with discrepancies, 1 repaired", out.getvalue())
+        self.assertEqual(done.result_set.count(), 4)
+
+class ProgramPropagationTests(WorksheetMixin, TestCase):
+    def _program(self):
+        return [exercise.pk for exercise in self.workout.get_exercises_in_order()]
+
+    def test_propagate(self):
+        worksheet = self._create_worksheet()
+        done = self._create_worksheet(started_at=timezone.now() - datetime.timedelta(days=2), done=True)
+        results = list(worksheet.result_set.all())
+        results[0].reps, results[0].weight = 8, 20
+        results[0].save()
+        results[1].reps = 5
+        results[1].save()
+
+        # Swap the first two exercises, remove the last two and add a new one
+        programs = list(self.workout.program_set.all())
+        self.workout.set_program_order([programs[1].pk, programs[0].pk, programs[2].pk, programs[3].pk])
+        Program.objects.filter(pk__in=[programs[2].pk, programs[3].pk]).delete()
+        new = Program.objects.create(workout=self.workout, exercise=Exercise.objects.create(name="Exercise 5"))
+
+        # Reading the program and the open worksheets, then for the open
+        # worksheet: its results, the deletion, insertion and reordering, and
+        # its update time (and 2 savepoints, in tests)
+        with self.assertNumQueries(11):
+            self.assertEqual(integrity.propagate(self.workout), 1)
+
+        expected = [programs[1].exercise_id, programs[0].exercise_id, new.exercise_id]
+        self.assertEqual(self._program(), expected)
+        self.assertEqual(list(worksheet.result_set.values_list('exercise', 'reps', 'weight')), [
+            (programs[1].exercise_id, 5, None),
+            (programs[0].exercise_id, 8, 20),
+            (new.exercise_id, None, None),
+        ])
+        self.assertEqual(list(worksheet.result_set.values_list('_order', flat=True)), [0, 1, 2])
+        # Closed worksheets are left as they were
+        self.assertEqual(done.result_set.count(), 4)
+
+        self.assertEqual(integrity.propagate(self.workout), 0)
+
+    def test_removed_exercises_with_values_are_kept(self):
+        worksheet = self._create_worksheet()
+        last = worksheet.result_set.last()
+        last.reps = 10
+        last.save()
+
+        Program.objects.filter(workout=self.workout, exercise=last.exercise).delete()
+        integrity.propagate(self.workout)
+
+        self.assertEqual(list(worksheet.result_set.values_list('exercise', flat=True)), self._program() + [last.exercise_id])
+
+class AdminProgramPropagationTests(TransactionTestCase):
+    def setUp(self):
+        # Data can't be created once per class, TransactionTestCase flushes the
+        # database after each test
+        self.workout = Workout.objects.create(name="Test workout")
+        for name in ["Exercise 1", "Exercise 2", "Exercise 3", "Exercise 4"]:
+            Program.objects.create(workout=self.workout, exercise=Exercise.objects.create(name=name))
+        self.client.force_login(User.objects.create_superuser('admin'))
+
+    def _program(self):
+        return [exercise.pk for exercise in self.workout.get_exercises_in_order()]
+
+    def _create_worksheet(self, days):
+        worksheet = Worksheet.objects.create(workout=self.workout, date=timezone.localdate() - datetime.timedelta(days=days))
+        worksheet.result_set(manager="results").create_all()
+
+        return worksheet
+
+    def _remove_last_exercise(self, **kwargs):
+        programs = list(self.workout.program_set.all())
+        data = {
+            'name': self.workout.name,
+            'program_set-TOTAL_FORMS': len(programs),
+            'program_set-INITIAL_FORMS': len(programs),
+            'program_set-MIN_NUM_FORMS': 0,
+            'program_set-MAX_NUM_FORMS': 1000,
+        }
+        for index, program in enumerate(programs):
+            data.update({
+                f'program_set-{index}-id': program.pk,
+                f'program_set-{index}-workout': self.workout.pk,
+                f'program_set-{index}-exercise': program.exercise_id,
+            })
+        data[f'program_set-{len(programs) - 1}-DELETE'] = 'on'
+
+        return self.client.post(reverse('admin:worksheet_workout_change', args=[self.workout.pk]), data, **kwargs)
+
+    def test_admin_program_edit(self):
+        worksheet = self._create_worksheet(0)
+
+        response = self._remove_last_exercise(follow=True)
+
+        self.assertContains(response, "The program was applied to 1 worksheet(s) in progress.")
+        self.assertEqual(list(worksheet.result_set.values_list('exercise', flat=True)), self._program())
+        self.assertEqual(len(self._program()), 3)
+
+    def test_worksheets_committed_separately(self):
+        """
+        The program is applied once the admin change is committed, each
+        worksheet in its own transaction: a failure doesn't roll back the
+        worksheets already updated.
+        """
+        first, second = self._create_worksheet(1), self._create_worksheet(0)
+        repair = integrity.repair
+
+        def fail_second(discrepancies):
+            if discrepancies[0].worksheet_id == second.pk:
+                raise DatabaseError("Interrupted")
+            return repair(discrepancies)
+
+        with mock.patch('worksheet.integrity.repair', side_effect=fail_second), self.assertRaises(DatabaseError):
+            self._remove_last_exercise()
+
+        self.assertEqual(len(self._program()), 3)
+        self.assertEqual(list(first.result_set.values_list('exercise', flat=True)), self._program())
+        self.assertEqual(second.result_set.count(), 4)
@@ -1,10 +1,18 @@
 import datetime
+from io import StringIO
 
 from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
 from django.test import TestCase
+from django.urls import reverse
 from django.utils import timezone
 
-from worksheet.models import Exercise, Program, Workout, Worksheet
+from worksheet.models import ArchivedResults, Exercise, Program, Result, Schedule, Task, Workout, Worksheet
+from worksheet.managers import get_display_order
+from worksheet.schedule import get_resolver
+from worksheet.views import WorksheetView
+from worksheet.tests.mixins import WorksheetMixin
 
 class WorksheetManagerTests(TestCase):
     @classmethod
@@ -62,3 +70,255 @@ class WorksheetManagerTests(TestCase):
         worksheet = Worksheet.objects.create(**fields)
 
         return worksheet
+
+class WorksheetArchiveTests(WorksheetMixin, TestCase):
+    def _create_worksheets(self, days):
+        now = timezone.localtime()
+        worksheets = []
+        for day in days:
+            worksheet = self._create_worksheet(started_at=now - datetime.timedelta(days=day), done=True)
+            worksheet.result_set.update(reps=day, weight=None)
+            worksheets.append(worksheet)
+
+        return worksheets
+
+    def test_archive(self):
+        old, older, recent = self._create_worksheets([200, 300, 10])
+
+        archived = Worksheet.objects.archive(timezone.localdate() - datetime.timedelta(days=100))
+
+        self.assertEqual(archived, 2)
+        self.assertEqual(ArchivedResults.objects.count(), 2)
+        self.assertEqual(Result.objects.filter(worksheet__in=[old, older]).count(), 0)
+        self.assertEqual(recent.result_set.count(), 4)
+
+        archive = Worksheet.objects.get(pk=old.pk).get_archive()
+        self.assertEqual(
+            archive.unpack(),
+            [(exercise.id, 200, None) for exercise in self.workout.get_exercises_in_order()],
+        )
+
+        # Nothing left to archive before the same date, and archived
+        # worksheets are skipped afterwards: only the recent one is left
+        self.assertEqual(Worksheet.objects.archive(timezone.localdate() - datetime.timedelta(days=100)), 0)
+        self.assertEqual(Worksheet.objects.archive(timezone.localdate()), 1)
+
+    def test_archive_keeps_recent_worksheets(self):
+        old, older, oldest = self._create_worksheets([200, 300, 400])
+        in_progress = self._create_worksheet(
+            started_at=timezone.localtime() - datetime.timedelta(days=500),
+        )
+
+        archived = Worksheet.objects.archive(timezone.localdate(), keep=2)
+
+        self.assertEqual(archived, 1)
+        self.assertIsNotNone(Worksheet.objects.get(pk=oldest.pk).get_archive())
+        self.assertIsNone(Worksheet.objects.get(pk=in_progress.pk).get_archive())
+
+    def test_unarchive(self):
+        worksheet, = self._create_worksheets([200])
+        expected = list(worksheet.result_set.values_list('exercise', 'reps', 'weight', '_order'))
+        Worksheet.objects.archive(timezone.localdate())
+
+        Worksheet.objects.unarchive([worksheet.pk])
+
+        self.assertEqual(ArchivedResults.objects.count(), 0)
+        self.assertEqual(
+            list(worksheet.result_set.values_list('exercise', 'reps', 'weight', '_order')),
+            expected,
+        )
+
+class WorksheetAutoCloseTests(WorksheetMixin, TestCase):
+    def _create_stale_worksheet(self, days, hours):
+        worksheet = self._create_worksheet(started_at=timezone.now() - datetime.timedelta(days=days))
+        Worksheet.objects.filter(pk=worksheet.pk).update(
+            updated_at=timezone.now() - datetime.timedelta(hours=hours),
+        )
+        worksheet.refresh_from_db()
+
+        return worksheet
+
+    def test_close_stale_worksheets(self):
+        stale = self._create_stale_worksheet(2, 40)
+        recent = self._create_stale_worksheet(1, 2)
+        done = self._create_worksheet(started_at=timezone.now() - datetime.timedelta(days=3), done=True)
+        Worksheet.objects.filter(pk=done.pk).update(updated_at=timezone.now() - datetime.timedelta(days=3))
+
+        self.assertQuerySetEqual(Worksheet.objects.get_stale(), [stale])
+
+        # Reading the stale worksheets, closing them, and the deferred task
+        # (and 4 savepoint queries, in tests)
+        with self.assertNumQueries(7):
+            closed = Worksheet.objects.close_all(Worksheet.objects.get_stale())
+
+        self.assertEqual(closed, [stale.pk])
+        worksheet = Worksheet.objects.get(pk=stale.pk)
+        self.assertTrue(worksheet.done)
+        self.assertEqual(worksheet.ended_at, stale.updated_at)
+        self.assertGreater(worksheet.updated_at, stale.updated_at)
+        self.assertFalse(Worksheet.objects.get(pk=recent.pk).done)
+
+        task = Task.objects.get()
+        self.assertEqual((task.name, task.kwargs), ('worksheet.auto_closed', {'worksheet_ids': [stale.pk]}))
+
+        self.assertEqual(Worksheet.objects.close_all(Worksheet.objects.get_stale()), [])
+
+    def test_command(self):
+        stale = self._create_stale_worksheet(2, 40)
+
+        out = StringIO()
+        call_command('close_stale_worksheets', '--hours', '48', stdout=out)
+        self.assertIn("Closed 0 worksheet(s)", out.getvalue())
+
+        out = StringIO()
+        call_command('close_stale_worksheets', '--dry-run', stdout=out)
+        self.assertIn(str(stale), out.getvalue())
+        self.assertFalse(Worksheet.objects.get(pk=stale.pk).done)
+
+        out = StringIO()
+        call_command('close_stale_worksheets', stdout=out)
+        self.assertIn("Closed 1 worksheet(s)", out.getvalue())
+        self.assertTrue(Worksheet.objects.get(pk=stale.pk).done)
+
+    def test_admin_action(self):
+        worksheet = self._create_worksheet()
+        self.client.force_login(User.objects.create_superuser('admin'))
+
+        response = self.client.post(reverse('admin:worksheet_worksheet_changelist'), {
+            'action': 'close_worksheets',
+            '_selected_action': [worksheet.pk],
+        }, follow=True)
+
+        self.assertContains(response, "Closed 1 worksheet(s).")
+        self.assertTrue(Worksheet.objects.get(pk=worksheet.pk).done)
+
+class WorksheetPlanTests(WorksheetMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.today = timezone.localdate()
+        # Every day
+        for day in Schedule.DAY_CHOICES:
+            Schedule.objects.create(day=day, workout=self.workout)
+
+    def test_plan(self):
+        start = self.today + datetime.timedelta(days=1)
+        end = start + datetime.timedelta(weeks=2, days=-1)
+        get_resolver()
+
+        # Existing dates, exercises of the workout, worksheets and results
+        # (and 2 savepoint queries, in tests)
+        with self.assertNumQueries(6):
+            worksheets = Worksheet.objects.plan(start, end)
+
+        self.assertEqual([worksheet.date for worksheet in worksheets],
+                         [start + datetime.timedelta(days=n) for n in range(14)])
+        self.assertTrue(all(worksheet.planned and not worksheet.done for worksheet in worksheets))
+        self.assertEqual(Result.objects.filter(worksheet__planned=True).count(), 14 * 4)
+        self.assertEqual(
+            list(worksheets[0].result_set.values_list('exercise__name', 'reps', 'weight')),
+            [(f"Exercise {n}", None, None) for n in range(1, 5)],
+        )
+
+        # Planned worksheets are neither in progress nor abandoned
+        self.assertQuerySetEqual(Worksheet.objects.get_active(before=end + datetime.timedelta(days=1)), [])
+        self.assertQuerySetEqual(Worksheet.objects.get_stale(before=timezone.now()), [])
+
+        # Days already planned are skipped
+        self.assertEqual(Worksheet.objects.plan(start, end + datetime.timedelta(days=1))[0].date,
+                         end + datetime.timedelta(days=1))
+
+    def test_plan_targets(self):
+        previous = self._create_worksheet(started_at=timezone.now() - datetime.timedelta(days=2), done=True)
+        for n, result in enumerate(previous.result_set.order_by('_order')):
+            result.reps, result.weight = 10 + n, 20 if result.exercise.weight else None
+            result.save()
+
+        worksheet, = Worksheet.objects.plan(self.today, self.today, targets=True)
+
+        self.assertEqual(
+            list(worksheet.result_set.values_list('reps', 'weight')),
+            [(10, 20), (11, None), (12, 20), (13, None)],
+        )
+
+    def test_start_planned_worksheet(self):
+        planned, = Worksheet.objects.plan(self.today, self.today)
+
+        # The worksheet and its start
+        with self.assertNumQueries(2):
+            worksheet, created = Worksheet.objects.start(self.workout, self.today)
+
+        self.assertFalse(created)
+        self.assertEqual(worksheet.pk, planned.pk)
+        self.assertFalse(Worksheet.objects.get(pk=planned.pk).planned)
+        self.assertGreater(worksheet.started_at, planned.started_at)
+        self.assertEqual(worksheet.result_set.count(), 4)
+
+    def test_start_replaces_other_workout(self):
+        planned, = Worksheet.objects.plan(self.today, self.today)
+        workout = Workout.objects.create(name="Other workout")
+        Program.objects.create(workout=workout, exercise=Exercise.objects.create(name="Exercise 5"))
+
+        worksheet, created = Worksheet.objects.start(workout, self.today)
+
+        self.assertTrue(created)
+        self.assertFalse(Worksheet.objects.filter(pk=planned.pk).exists())
+        self.assertEqual(list(worksheet.result_set.values_list('exercise__name', flat=True)), ["Exercise 5"])
+
+    def test_command(self):
+        out = StringIO()
+        call_command('plan_worksheets', '--weeks', '2', '--start', self.today.isoformat(), stdout=out)
+
+        self.assertIn("Planned 14 worksheet(s)", out.getvalue())
+        self.assertEqual(Worksheet.objects.filter(planned=True).count(), 14)
+
+class ResultDisplayOrderTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Exercises of the workout #1 are repeated in a second round, see
+        # Workout.get_exercises_in_order()
+        cls.workout = Workout.objects.create(pk=1, name="Repeat workout", repeat=True)
+        for n in range(1, 5):
+            Program.objects.create(workout=cls.workout, exercise=Exercise.objects.create(name=f"Exercise {n}"))
+
+    def test_get_display_order(self):
+        self.assertEqual(get_display_order([1, 2, 3, 4, 2, 1, 4, 3], repeat=True), [
+            (0, 1), (2, 1), (4, 1), (6, 1), (3, 2), (1, 2), (7, 2), (5, 2),
+        ])
+        self.assertEqual(get_display_order([1, 2, 1], repeat=False), [(0, 1), (1, 1), (2, 2)])
+
+    def test_repeat_worksheet(self):
+        worksheet = Worksheet.objects.create(workout=self.workout)
+        worksheet.result_set(manager="results").create_all(new=True)
+        expected = [(f"Exercise {n}", round) for n in range(1, 5) for round in (1, 2)]
+
+        results = WorksheetView()._get_results(worksheet)
+
+        # Read in display order, without joining the programs
+        self.assertNotIn('worksheet_program', str(results.query))
+        self.assertEqual([(result.exercise.name, result.round) for result in results], expected)
+
+        # Restored from the archive
+        Worksheet.objects.filter(pk=worksheet.pk).update(done=True)
+        Worksheet.objects.archive(timezone.localdate() + datetime.timedelta(days=1))
+        Worksheet.objects.unarchive([worksheet.pk])
+        self.assertEqual(
+            list(worksheet.result_set.order_by('display_order').values_list('exercise__name', 'round')),
+            expected,
+        )
+
+    def test_archived_repeat_worksheet(self):
+        worksheet = Worksheet.objects.create(workout=self.workout, started_at=timezone.now())
+        worksheet.result_set(manager="results").create_all(new=True)
+        Worksheet.objects.filter(pk=worksheet.pk).update(done=True, ended_at=timezone.now())
+        Worksheet.objects.archive(timezone.localdate() + datetime.timedelta(days=1))
+        expected = [(f"Exercise {n}", round) for n in range(1, 5) for round in (1, 2)]
+
+        archive = ArchivedResults.objects.select_related('worksheet__workout').get(worksheet=worksheet)
+        # Only the exercises are read, the display order is computed
+        with self.assertNumQueries(1):
+            results = archive.get_results()
+        self.assertEqual([(result.exercise.name, result.round) for result in results], expected)
+        self.assertEqual([result.display_order for result in results], list(range(8)))
+
+        response = self.client.get(reverse('worksheet:worksheet', args=[worksheet.date.year, worksheet.date.month, worksheet.date.day]))
+        self.assertContains(response, 'title="Round 2"', count=4)
@@ -2,7 +2,7 @@ import datetime
 
 from django.test import TestCase
 
-from worksheet.models import Exercise, Result, Workout, Worksheet
+from worksheet.models import ArchivedResults, Exercise, Result, Workout, Worksheet
 
 class WorkoutModelTests(TestCase):
     def test_close_worksheet(self):
@@ -96,3 +96,17 @@ class ResultModelTests(TestCase):
         result.reps = None
         self.assertEqual(result.weight_status(), '')
         self.assertEqual(result.reps_status(), '')
+
+class ArchivedResultsModelTests(TestCase):
+    def test_pack_and_unpack(self):
+        entries = [(1, 10, None), (2, None, None), (70000, 0, 32767)]
+        archive = ArchivedResults(results=ArchivedResults.pack(entries))
+
+        self.assertEqual(len(archive.results), 1 + 8 * len(entries))
+        self.assertEqual(archive.unpack(), entries)
+
+    def test_unknown_version(self):
+        archive = ArchivedResults(results=b'\x02')
+
+        with self.assertRaises(ValueError):
+            archive.unpack()
@@ -0,0 +1,118 @@
+import json
+import tempfile
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from workout_tracker.middleware import slow_queries
+from workout_tracker.middleware.profiling import QUERY_FLAG, make_token
+
+class ProfilingMiddlewareTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.directory = Path(tmp.name)
+
+    def test_sampled_request_is_profiled(self):
+        with self.settings(PROFILING_SAMPLE_RATE=1, PROFILING_DIR=self.directory):
+            response = self.client.get(reverse('worksheet:index'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(list(self.directory.glob('worksheet.index/*.prof'))), 1)
+        self.assertEqual(len(list(self.directory.glob('worksheet.index/*.collapsed'))), 1)
+
+    def test_view_filter(self):
+        profile = 'workout_tracker.middleware.profiling.cProfile.Profile'
+        with self.settings(PROFILING_SAMPLE_RATE=1, PROFILING_DIR=self.directory,
+                           PROFILING_VIEWS=['worksheet:index']):
+            with mock.patch(profile) as profiler:
+                response = self.client.get(reverse('worksheet:heatmap'))
+                self.client.get('/missing/')
+
+            self.assertEqual(response.status_code, 200)
+            # Filtered out views are not profiled at all
+            profiler.assert_not_called()
+
+            self.client.get(reverse('worksheet:index'))
+
+        self.assertEqual([path.name for path in self.directory.iterdir()], ['worksheet.index'])
+
+    def test_signed_flag(self):
+        with self.settings(PROFILING_SIGNED_FLAG=True, PROFILING_DIR=self.directory):
+            self.client.get(reverse('worksheet:index'), {QUERY_FLAG: 'forged'})
+            self.assertFalse(self.directory.exists() and any(self.directory.iterdir()))
+
+            self.client.get(reverse('worksheet:index'), {QUERY_FLAG: make_token()})
+            self.assertEqual(len(list(self.directory.glob('worksheet.index/*.prof'))), 1)
+
+    def test_profiles_are_rotated(self):
+        with self.settings(PROFILING_SAMPLE_RATE=1, PROFILING_MAX_FILES=2,
+                           PROFILING_DIR=self.directory):
+            for _ in range(4):
+                self.client.get(reverse('worksheet:index'))
+
+        self.assertEqual(len(list(self.directory.glob('worksheet.index/*.prof'))), 2)
+        self.assertEqual(len(list(self.directory.glob('worksheet.index/*.collapsed'))), 2)
+
+    def test_report(self):
+        with self.settings(PROFILING_SAMPLE_RATE=1, PROFILING_DIR=self.directory):
+            self.client.get(reverse('worksheet:index'))
+
+            out = StringIO()
+            call_command('profile_report', '--top', '5', stdout=out)
+
+        self.assertIn('worksheet:index (1 requests)', out.getvalue())
+        self.assertIn('function calls', out.getvalue())
+
+class SlowQueryMiddlewareTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.log = Path(tmp.name) / 'slow_queries.log'
+        self.addCleanup(self._close_log)
+        slow_queries._explained.clear()
+
+    def _close_log(self):
+        if handler := slow_queries._handlers.pop(self.log, None):
+            handler.close()
+
+    def test_fingerprint(self):
+        sql, key = slow_queries.fingerprint(
+            'SELECT "t"."id" FROM "t"  WHERE "t"."id" IN (%s, %s) AND "t"."name" = \'x\' LIMIT 21'
+        )
+
+        self.assertEqual(sql, 'SELECT "t"."id" FROM "t" WHERE "t"."id" IN (...) AND "t"."name" = ? LIMIT ?')
+        self.assertEqual(key, slow_queries.fingerprint(
+            'SELECT "t"."id" FROM "t" WHERE "t"."id" IN (%s) AND "t"."name" = \'y\' LIMIT 1'
+        )[1])
+
+    def test_slow_queries_are_logged(self):
+        with self.settings(SLOW_QUERY_THRESHOLD=0.000001, SLOW_QUERY_LOG=self.log):
+            self.client.get(reverse('worksheet:index'))
+            self.client.get(reverse('worksheet:index'))
+            queries = slow_queries.read_log()
+
+            self.client.force_login(User.objects.create_superuser('admin'))
+            response = self.client.get(reverse('slow_queries'))
+            self.assertContains(response, "<td>worksheet:index</td>", len(queries))
+
+        self.assertTrue(queries)
+        self.assertTrue(all(query['views'] == ['worksheet:index'] for query in queries))
+        self.assertTrue(all(query['count'] == 2 for query in queries))
+        # Plans are only captured once per fingerprint
+        captures = [json.loads(line) for line in self.log.read_text().splitlines()]
+        plans = [capture['fingerprint'] for capture in captures if capture['plan']]
+        self.assertTrue(plans)
+        self.assertEqual(len(plans), len(set(plans)))
+        self.assertTrue(all(query['plan'] for query in queries if query['sql'].startswith('SELECT')))
+
+    def test_fast_queries_are_not_logged(self):
+        with self.settings(SLOW_QUERY_THRESHOLD=10_000, SLOW_QUERY_LOG=self.log):
+            self.client.get(reverse('worksheet:index'))
+
+            self.assertEqual(slow_queries.read_log(), [])
@@ -0,0 +1,110 @@
+import datetime
+import tempfile
+from io import StringIO
+from pathlib import Path
+
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from worksheet import report
+from worksheet.models import Exercise, Program, Schedule, Workout, Worksheet
+from worksheet.schedule import get_resolver
+
+def create_history(workout, year):
+    """
+    A closed worksheet of an hour on the first Monday of each month, reps
+    and weights growing every month.
+    """
+    for month in range(1, 13):
+        date = datetime.date(year, month, 1)
+        date += datetime.timedelta(days=-date.weekday() % 7)
+        started_at = timezone.make_aware(datetime.datetime.combine(date, datetime.time(18)))
+        worksheet = Worksheet.objects.create(
+            workout=workout, date=date, done=True,
+            started_at=started_at, ended_at=started_at + datetime.timedelta(hours=1),
+        )
+        worksheet.result_set(manager="results").create_all()
+        worksheet.result_set.update(reps=month)
+        worksheet.result_set.filter(exercise__weight=True).update(weight=10 * month)
+
+class ReportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.workout = Workout.objects.create(name="Test workout")
+        Program.objects.create(workout=cls.workout, exercise=Exercise.objects.create(name="Squat", weight=True))
+        Program.objects.create(workout=cls.workout, exercise=Exercise.objects.create(name="Push-up"))
+        # Every Monday
+        Schedule.objects.create(day=1, workout=cls.workout)
+        cls.year = timezone.localdate().year - 1
+        create_history(cls.workout, cls.year)
+
+    def test_build_report(self):
+        # Archived results are read too
+        Worksheet.objects.archive(datetime.date(self.year, 7, 1))
+
+        context = report.build_report(self.year, report.summarize([self.year])[self.year])
+
+        self.assertEqual(context['totals']['sessions'], 12)
+        self.assertEqual(context['totals']['sets'], 24)
+        self.assertEqual(context['totals']['volume'], sum(m * 10 * m + m for m in range(1, 13)))
+        self.assertEqual(context['totals']['median_duration'], 60)
+        self.assertAlmostEqual(context['totals']['attendance'], 12 / context['totals']['planned'])
+
+        push_up, squat = context['exercises']
+        self.assertEqual((push_up['name'], push_up['weighted']), ("Push-up", False))
+        self.assertEqual(squat['records']['weight'], (120, Worksheet.objects.get(date__month=12).date))
+        self.assertAlmostEqual(squat['records']['one_rep_max'].value, 120 * (1 + 12 / 30))
+        self.assertNotIn('weight', push_up['records'])
+        self.assertEqual(push_up['records']['reps'].value, 12)
+        self.assertEqual(push_up['chart'].count('<circle'), 12)
+
+    def test_render_report(self):
+        # Built beforehand, the resolver is cached between requests
+        get_resolver()
+        # Counting the worksheets, 2 projections per month and the names of
+        # the exercises
+        with self.assertNumQueries(1 + 2 * 12 + 1):
+            html = report.render_reports([self.year])[self.year]
+
+        self.assertIn(f"<h1>Training report {self.year}</h1>", html)
+        self.assertEqual(html.count('<svg'), 3 + 2)
+        # Self-contained
+        self.assertNotIn('<link', html)
+        self.assertNotIn('<script', html)
+
+    def test_empty_year(self):
+        context = report.build_report(self.year - 10, report.summarize([self.year - 10])[self.year - 10])
+
+        self.assertEqual(context['exercises'], [])
+        self.assertIsNone(context['totals']['median_duration'])
+
+class YearlyReportCommandTests(TransactionTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.directory = Path(tmp.name)
+
+        # Data can't be created once per class, TransactionTestCase flushes the
+        # database after each test
+        workout = Workout.objects.create(name="Test workout")
+        Program.objects.create(workout=workout, exercise=Exercise.objects.create(name="Squat", weight=True))
+        self.year = timezone.localdate().year - 1
+        create_history(workout, self.year)
+
+    def test_reports_in_processes(self):
+        """
+        Months summarized by other processes give the same reports.
+        """
+        for workers in [1, 2]:
+            out = StringIO()
+            call_command('yearly_report', '--all', '--workers', str(workers),
+                         '--output-dir', self.directory / str(workers), stdout=out)
+            self.assertIn(f"Wrote 1 report(s) ({self.year})", out.getvalue())
+
+        single, parallel = [
+            (self.directory / str(workers) / f'training-{self.year}.html').read_text().split('</p>', 1)[1]
+            for workers in [1, 2]
+        ]
+        self.assertEqual(single, parallel)
+        self.assertIn("Squat", parallel)
@@ -0,0 +1,149 @@
+import datetime
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.test import TestCase
+
+from worksheet.models import Schedule, ScheduleRule, Workout
+from worksheet.schedule import ScheduleResolver, get_resolver
+
+# A Monday
+MONDAY = datetime.date(2025, 1, 6)
+
+class ScheduleResolverTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.workout_a = Workout.objects.create(name="Workout A")
+        cls.workout_b = Workout.objects.create(name="Workout B")
+
+    def setUp(self):
+        cache.clear()
+
+    def _resolver(self, schedules=(), rules=()):
+        rules = [ScheduleRule(pk=pk, **fields) for pk, fields in enumerate(rules, start=1)]
+        for rule in rules:
+            rule.full_clean()
+
+        return ScheduleResolver(
+            [Schedule(day=day, workout=workout) for day, workout in schedules],
+            rules,
+        )
+
+    def test_weekly_schedule(self):
+        resolver = self._resolver(schedules=[(1, self.workout_a), (3, self.workout_b)])
+
+        planned = resolver.expand(MONDAY, MONDAY + datetime.timedelta(days=13))
+
+        self.assertEqual(sorted(planned), [
+            MONDAY, MONDAY + datetime.timedelta(days=2),
+            MONDAY + datetime.timedelta(days=7), MONDAY + datetime.timedelta(days=9),
+        ])
+        self.assertEqual(planned[MONDAY].workout, self.workout_a)
+        self.assertFalse(planned[MONDAY].deload)
+
+    def test_ab_weeks(self):
+        resolver = self._resolver(
+            schedules=[(1, self.workout_a)],
+            rules=[
+                {'workout': self.workout_b, 'weekday': 1, 'every': 2, 'offset': 1, 'start_date': MONDAY},
+            ],
+        )
+
+        workouts = [
+            resolver.resolve(MONDAY + datetime.timedelta(weeks=week)).workout
+            for week in range(4)
+        ]
+
+        self.assertEqual(workouts, [self.workout_a, self.workout_b, self.workout_a, self.workout_b])
+
+    def test_day_cycle(self):
+        # A, B, rest
+        start = MONDAY + datetime.timedelta(days=3)
+        resolver = self._resolver(rules=[
+            {'workout': self.workout_a, 'every': 3, 'unit': 'day', 'start_date': start},
+            {'workout': self.workout_b, 'every': 3, 'unit': 'day', 'offset': 1, 'start_date': start},
+        ])
+
+        planned = resolver.expand(MONDAY, MONDAY + datetime.timedelta(days=8))
+
+        self.assertEqual({date: day.workout for date, day in planned.items()}, {
+            start: self.workout_a,
+            start + datetime.timedelta(days=1): self.workout_b,
+            start + datetime.timedelta(days=3): self.workout_a,
+            start + datetime.timedelta(days=4): self.workout_b,
+        })
+
+    def test_deload_weeks(self):
+        # Every fourth week is a deload week
+        resolver = self._resolver(
+            schedules=[(1, self.workout_a)],
+            rules=[
+                {'kind': 'deload', 'every': 4, 'offset': 3, 'start_date': MONDAY},
+            ],
+        )
+
+        deloads = [
+            resolver.resolve(MONDAY + datetime.timedelta(weeks=week)).deload
+            for week in range(8)
+        ]
+
+        self.assertEqual(deloads, [False, False, False, True] * 2)
+
+    def test_overrides(self):
+        end = MONDAY + datetime.timedelta(days=13)
+        resolver = self._resolver(
+            schedules=[(1, self.workout_a)],
+            rules=[
+                {'workout': self.workout_b, 'start_date': MONDAY, 'end_date': end, 'priority': 1},
+                {'kind': 'rest', 'start_date': MONDAY + datetime.timedelta(weeks=1), 'end_date': end, 'priority': 10},
+            ],
+        )
+
+        self.assertEqual(resolver.resolve(MONDAY).workout, self.workout_b)
+        self.assertEqual(resolver.resolve(MONDAY + datetime.timedelta(days=1)).workout, self.workout_b)
+        self.assertIsNone(resolver.resolve(MONDAY + datetime.timedelta(weeks=1)))
+        self.assertEqual(resolver.resolve(MONDAY + datetime.timedelta(weeks=2)).workout, self.workout_a)
+
+    def test_rule_validation(self):
+        invalid = [
+            {'kind': 'workout'},
+            {'kind': 'rest', 'workout': self.workout_a},
+            {'workout': self.workout_a, 'every': 2, 'offset': 2},
+            {'workout': self.workout_a, 'every': 3, 'unit': 'day'},
+            {'workout': self.workout_a, 'start_date': MONDAY, 'end_date': MONDAY - datetime.timedelta(days=1)},
+        ]
+        for fields in invalid:
+            with self.subTest(fields=fields), self.assertRaises(ValidationError):
+                ScheduleRule(**fields).full_clean()
+
+    def test_cached_resolver(self):
+        Schedule.objects.create(day=MONDAY.isoweekday(), workout=self.workout_a)
+        resolver = get_resolver()
+
+        with self.assertNumQueries(0):
+            self.assertIs(get_resolver(), resolver)
+            resolver.expand(MONDAY, MONDAY + datetime.timedelta(days=365))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ScheduleRule.objects.create(workout=self.workout_b, start_date=MONDAY, end_date=MONDAY)
+
+        self.assertEqual(get_resolver().resolve(MONDAY).workout, self.workout_b)
+
+    def test_uncommitted_rule(self):
+        """
+        The resolver is only rebuilt once a change of the schedule is committed,
+        so that it can't be pinned to data other connections don't see yet.
+        """
+        Schedule.objects.create(day=MONDAY.isoweekday(), workout=self.workout_a)
+        resolver = get_resolver()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                ScheduleRule.objects.create(workout=self.workout_b, start_date=MONDAY, end_date=MONDAY)
+
+                with self.assertNumQueries(0):
+                    self.assertIs(get_resolver(), resolver)
+
+        self.assertIsNot(get_resolver(), resolver)
+        self.assertEqual(get_resolver().resolve(MONDAY).workout, self.workout_b)
@@ -0,0 +1,128 @@
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from worksheet.models import Equipment, Exercise, MuscleGroup, Program, Tag, Workout
+from worksheet import search
+from worksheet.search import search_exercises
+
+class ExerciseSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.chest = MuscleGroup.objects.create(name="Chest")
+        cls.back = MuscleGroup.objects.create(name="Back")
+        cls.dumbbell = Equipment.objects.create(name="Dumbbell")
+        cls.compound = Tag.objects.create(name="Compound")
+
+        cls.bench = Exercise.objects.create(name="Bench press", weight=True)
+        cls.bench.muscle_groups.add(cls.chest)
+        cls.bench.tags.add(cls.compound)
+        cls.fly = Exercise.objects.create(name="Dumbbell fly", weight=True)
+        cls.fly.muscle_groups.add(cls.chest)
+        cls.fly.equipment.add(cls.dumbbell)
+        cls.row = Exercise.objects.create(name="Dumbbell row", weight=True)
+        cls.row.muscle_groups.add(cls.back)
+        cls.row.equipment.add(cls.dumbbell)
+
+    def test_prefix_search(self):
+        self.assertEqual(search_exercises("ben"), [self.bench])
+        self.assertEqual(set(search_exercises("dumb")), {self.fly, self.row})
+        self.assertEqual(search_exercises("dumb ro"), [self.row])
+        self.assertEqual(search_exercises("squat"), [])
+
+    def test_search_facet_names(self):
+        self.assertEqual(set(search_exercises("chest")), {self.bench, self.fly})
+
+    def test_facet_filters(self):
+        self.assertEqual(search_exercises("dumbbell", muscle_group=self.chest), [self.fly])
+        self.assertEqual(search_exercises("", equipment=self.dumbbell, muscle_group=self.back), [self.row])
+        self.assertEqual(search_exercises("press", tag=self.compound), [self.bench])
+
+    def test_query_syntax_is_escaped(self):
+        # Operators are plain words, which don't match anything here
+        self.assertEqual(search_exercises('"bench" OR NEAR(*'), [])
+        self.assertEqual(search_exercises('bench^ (*'), [self.bench])
+
+    def test_index_updates(self):
+        self.back.name = "Upper back"
+        self.back.save()
+        self.assertEqual(search_exercises("upper"), [self.row])
+
+        self.row.muscle_groups.clear()
+        self.assertEqual(search_exercises("upper"), [])
+
+        self.compound.delete()
+        self.assertEqual(search_exercises("compound"), [])
+
+        self.fly.delete()
+        self.assertEqual(search_exercises("fly"), [])
+
+    def test_search_view(self):
+        url = reverse('worksheet:exercise_search')
+        response = self.client.get(url, {'q': 'dumb', 'muscle_group': self.back.pk})
+
+        self.assertContains(response, "Dumbbell row")
+        self.assertNotContains(response, "Dumbbell fly")
+
+        # Unknown facets don't match anything, instead of being ignored
+        for tag in ['invalid', self.compound.pk + 100]:
+            with self.subTest(tag=tag):
+                response = self.client.get(url, {'q': 'dumb', 'tag': tag})
+                self.assertNotContains(response, "Dumbbell")
+
+    def test_admin_search(self):
+        Exercise.objects.bulk_create([Exercise(name=f"Squat {n}") for n in range(600)])
+        search.rebuild_index()
+        self.client.force_login(User.objects.create_superuser('admin'))
+
+        # Every match is listed, not only the best ones
+        response = self.client.get(reverse('admin:worksheet_exercise_changelist'), {'q': 'squat'})
+        self.assertEqual(response.context['cl'].result_count, 600)
+
+        response = self.client.get(reverse('admin:worksheet_exercise_changelist'), {'q': 'dumb row'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.row])
+
+    def test_program_editor_autocomplete(self):
+        workout = Workout.objects.create(name="Test workout")
+        Program.objects.create(workout=workout, exercise=self.bench)
+        self.client.force_login(User.objects.create_superuser('admin'))
+
+        response = self.client.get(reverse('admin:worksheet_workout_change', args=[workout.pk]))
+
+        self.assertContains(response, 'class="exercise-autocomplete"')
+        self.assertContains(response, 'value="Bench press"')
+        # Exercises aren't listed in selects anymore
+        self.assertNotContains(response, "Dumbbell row")
+
+    def test_program_editor_queries(self):
+        """
+        The names of the exercises of the program are fetched once, whatever
+        its number of rows.
+        """
+        workout = Workout.objects.create(name="Test workout")
+        self.client.force_login(User.objects.create_superuser('admin'))
+        url = reverse('admin:worksheet_workout_change', args=[workout.pk])
+
+        counts = []
+        for exercise in [self.bench, self.row, self.fly]:
+            Program.objects.create(workout=workout, exercise=exercise)
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(url)
+            counts.append(len(queries))
+
+        self.assertEqual(len(set(counts)), 1)
+
+    def test_rebuild_index(self):
+        Exercise.objects.bulk_create([Exercise(name=f"Squat {n}") for n in range(3)])
+        self.assertEqual(search_exercises("squat"), [])
+
+        out = StringIO()
+        call_command('index_exercises', '--batch-size', '2', stdout=out)
+
+        self.assertIn("Indexed 6 exercise(s)", out.getvalue())
+        self.assertEqual(len(search_exercises("squat")), 3)
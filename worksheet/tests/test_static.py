@@ -0,0 +1,132 @@
+import gzip
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from workout_tracker.storage import brotli, build_bundle, find_static
+from worksheet.templatetags.bundles import _collected_integrity, _integrity, _source_integrity
+
+class BuildBundleTests(TestCase):
+    def test_css_imports_are_inlined(self):
+        files = {
+            'css/a.css': b"@import 'b.css';\nbody {}\n",
+            'css/b.css': b":root {}\n",
+            'css/c.css': b"p {}\n",
+        }
+
+        self.assertEqual(
+            build_bundle(['css/a.css', 'css/c.css'], read=files.__getitem__),
+            b":root {}\n\nbody {}\np {}\n",
+        )
+
+    def test_js_files_are_separated(self):
+        files = {'a.js': b"let a = 1", 'b.js': b"let b = 2\n"}
+
+        self.assertEqual(
+            build_bundle(['a.js', 'b.js'], read=files.__getitem__),
+            b"let a = 1\n;\nlet b = 2\n",
+        )
+
+class StaticPipelineTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        # Collecting (and compressing) is slow, only do it once
+        tmp = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(tmp.cleanup)
+        cls.addClassCleanup(_collected_integrity.cache_clear)
+
+        settings = override_settings(
+            STATIC_ROOT=tmp.name,
+            STORAGES={
+                'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+                'staticfiles': {'BACKEND': 'workout_tracker.storage.CompressedManifestStaticFilesStorage'},
+            },
+            STATIC_BUNDLING=True,
+            STATIC_SERVE=True,
+        )
+        settings.enable()
+        cls.addClassCleanup(settings.disable)
+
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+    def test_pages_use_bundles(self):
+        response = self.client.get(reverse('worksheet:index'))
+        bundle_url = staticfiles_storage.url('worksheet/css/index.bundle.css')
+
+        self.assertContains(response, '<link rel="stylesheet"', 1)
+        self.assertContains(response, bundle_url)
+        self.assertRegex(bundle_url, r'index\.bundle\.[0-9a-f]{12}\.css$')
+
+    def test_precompressed_variants(self):
+        bundle = staticfiles_storage.stored_name('worksheet/css/index.bundle.css')
+
+        with staticfiles_storage.open(bundle) as f:
+            content = f.read()
+        with staticfiles_storage.open(bundle + '.gz') as f:
+            self.assertEqual(gzip.decompress(f.read()), content)
+
+        self.assertIn(b'--color-success', content)
+        self.assertNotIn(b'@import', content)
+        self.assertEqual(staticfiles_storage.exists(bundle + '.br'), brotli is not None)
+
+    def test_serve_hashed_file(self):
+        url = staticfiles_storage.url('worksheet/css/index.bundle.css')
+
+        response = self.client.get(url, headers={'accept-encoding': 'gzip, deflate'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Type'], 'text/css')
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(response.headers['Cache-Control'], 'public, max-age=31536000, immutable')
+
+        response = self.client.get(url, headers={'accept-encoding': 'gzip;q=0'})
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertIn(b'--color-success', b''.join(response.streaming_content))
+
+    def test_serve_unhashed_file(self):
+        response = self.client.get('/static/worksheet/css/index.css')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Cache-Control'], 'public, max-age=3600')
+        self.assertNotIn('Content-Disposition', response.headers)
+
+        # Validated by conditional requests
+        for headers in [{'If-None-Match': response.headers['ETag']},
+                        {'If-Modified-Since': response.headers['Last-Modified']}]:
+            with self.subTest(headers=headers):
+                response = self.client.get('/static/worksheet/css/index.css', headers=headers)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.headers['Cache-Control'], 'public, max-age=3600')
+
+    def test_page_weight(self):
+        out = StringIO()
+        call_command('page_weight', stdout=out)
+
+        # The page and its stylesheet bundle
+        self.assertRegex(out.getvalue(), r'index\s+2\s')
+
+class IntegrityTests(SimpleTestCase):
+    def test_source_hashes_are_cached(self):
+        """
+        Hashes of the sources of bundles are computed again only when they are
+        modified.
+        """
+        path = find_static('worksheet/css/index.css')
+        stat = os.stat(path)
+        self.addCleanup(os.utime, path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        _source_integrity.cache_clear()
+
+        integrity = _integrity('worksheet/css/index.css', False)
+        self.assertEqual(_integrity('worksheet/css/index.css', False), integrity)
+        self.assertEqual(_source_integrity.cache_info().misses, 1)
+
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+        self.assertEqual(_integrity('worksheet/css/index.css', False), integrity)
+        self.assertEqual(_source_integrity.cache_info().misses, 2)
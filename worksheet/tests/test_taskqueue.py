@@ -0,0 +1,238 @@
+import datetime
+import threading
+import time
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import IntegrityError
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from worksheet import taskqueue
+from worksheet.models import Task, Worksheet
+from worksheet.tests.mixins import WorksheetMixin
+
+calls = []
+
+@taskqueue.task(name='tests.record', max_attempts=2)
+def record(value):
+    calls.append(value)
+
+@taskqueue.task(name='tests.periodic', every=lambda: periodic_interval)
+def periodic():
+    calls.append('periodic')
+
+# Disabled, unless changed by a test
+periodic_interval = 0
+
+@taskqueue.task(name='tests.fail', max_attempts=2)
+def fail():
+    raise ValueError("Failed")
+
+class TaskQueueTests(WorksheetMixin, TestCase):
+    def test_enqueue_with_key(self):
+        """
+        Tasks enqueued with the key of a pending task are only queued once.
+        """
+        first = taskqueue.enqueue('tests.record', key='abc', value=1)
+        second = taskqueue.enqueue('tests.record', key='abc', value=2)
+
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(Task.objects.count(), 1)
+
+        # Once the task is running, changes need another run
+        taskqueue.claim(10)
+        taskqueue.enqueue('tests.record', key='abc', value=3)
+        self.assertEqual(Task.objects.filter(status=Task.PENDING).count(), 1)
+
+    def test_enqueue_with_key_claimed_meanwhile(self):
+        """
+        A pending task claimed between the failed insertion and its lookup
+        doesn't prevent the new one from being queued.
+        """
+        create = Task.objects.create
+        attempts = []
+
+        def conflicting_create(**kwargs):
+            attempts.append(kwargs)
+            if len(attempts) == 1:
+                raise IntegrityError("UNIQUE constraint failed: worksheet_task.key")
+            return create(**kwargs)
+
+        with mock.patch.object(Task.objects, 'create', side_effect=conflicting_create):
+            task = taskqueue.enqueue('tests.record', key='abc', value=1)
+
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual(Task.objects.get().pk, task.pk)
+
+    def test_in_process_workers_are_opt_in(self):
+        self.assertIsNone(taskqueue.start_workers())
+
+    def test_unknown_task(self):
+        with self.assertRaises(KeyError):
+            taskqueue.enqueue('tests.unknown')
+
+    def test_close_enqueues_task(self):
+        worksheet = self._create_worksheet()
+        self.client.post(reverse("worksheet:close", args=[worksheet.pk]))
+
+        task = Task.objects.get()
+        self.assertEqual(task.name, 'worksheet.closed')
+        self.assertEqual(task.kwargs, {'worksheet_id': worksheet.pk})
+
+    def test_closed_task_archives_when_enabled(self):
+        old = self._create_worksheet(started_at=timezone.now() - datetime.timedelta(days=400), done=True)
+        worksheet = self._create_worksheet()
+        Worksheet.objects.close(pk=worksheet.pk)
+
+        task, = taskqueue.claim(10)
+        self.assertEqual(taskqueue.execute(task), Task.DONE)
+        self.assertIsNone(Worksheet.objects.get(pk=old.pk).get_archive())
+
+        Worksheet.objects.filter(pk=worksheet.pk).update(done=False)
+        Worksheet.objects.close(pk=worksheet.pk)
+        task, = taskqueue.claim(10)
+        with self.settings(ARCHIVE_ON_CLOSE=True, ARCHIVE_AFTER_DAYS=180, ARCHIVE_KEEP_PER_WORKOUT=0):
+            self.assertEqual(taskqueue.execute(task), Task.DONE)
+        self.assertIsNotNone(Worksheet.objects.get(pk=old.pk).get_archive())
+
+    @override_settings(TASK_RETRY_BACKOFF=10)
+    def test_retry_with_backoff(self):
+        task = taskqueue.enqueue('tests.fail')
+
+        task, = taskqueue.claim(10)
+        with self.assertLogs('worksheet.taskqueue', 'ERROR'):
+            self.assertEqual(taskqueue.execute(task), Task.PENDING)
+        task.refresh_from_db()
+        self.assertEqual(task.attempts, 1)
+        self.assertIn("ValueError: Failed", task.last_error)
+        self.assertGreater(task.run_at, timezone.now() + datetime.timedelta(seconds=9))
+
+        # Not due yet
+        self.assertEqual(taskqueue.claim(10), [])
+
+        Task.objects.update(run_at=timezone.now())
+        task, = taskqueue.claim(10)
+        with self.assertLogs('worksheet.taskqueue', 'ERROR'):
+            self.assertEqual(taskqueue.execute(task), Task.FAILED)
+
+    def test_backoff(self):
+        self.assertEqual([taskqueue.get_backoff(n) for n in range(1, 5)], [10, 20, 40, 80])
+        self.assertEqual(taskqueue.get_backoff(20), 60 * 60)
+
+    def test_stats(self):
+        taskqueue.enqueue('tests.record', value=1)
+        taskqueue.enqueue('tests.record', value=2, delay=60)
+        task, = taskqueue.claim(10)
+        taskqueue.execute(task)
+
+        stats = taskqueue.get_stats()
+        self.assertEqual(stats['pending'], 1)
+        self.assertEqual(stats['done'], 1)
+        self.assertEqual(stats['due'], 0)
+        self.assertIsInstance(stats['latency'], datetime.timedelta)
+
+    def test_requeue_stale(self):
+        taskqueue.enqueue('tests.record', value=1)
+        taskqueue.claim(10)
+        Task.objects.update(started_at=timezone.now() - datetime.timedelta(hours=2))
+
+        self.assertEqual(taskqueue.requeue_stale(60 * 60), 1)
+        self.assertEqual(Task.objects.get().status, Task.PENDING)
+
+    def test_periodic_task(self):
+        global periodic_interval
+
+        self.assertEqual(taskqueue.schedule_periodic(), 0)
+
+        periodic_interval = 60
+        try:
+            self.assertEqual(taskqueue.schedule_periodic(), 1)
+            # Only one run is pending at a time
+            taskqueue.schedule_periodic()
+            task = Task.objects.get(name='tests.periodic')
+            self.assertAlmostEqual(task.run_at, task.created_at + datetime.timedelta(seconds=60),
+                                   delta=datetime.timedelta(seconds=1))
+
+            # The next run is enqueued after each run
+            Task.objects.update(run_at=timezone.now())
+            task, = taskqueue.claim(10)
+            self.assertEqual(taskqueue.execute(task), Task.DONE)
+            self.assertEqual(Task.objects.filter(name='tests.periodic', status=Task.PENDING).count(), 1)
+        finally:
+            periodic_interval = 0
+
+    @override_settings(AUTO_CLOSE_INTERVAL=3600, AUTO_CLOSE_AFTER_HOURS=1)
+    def test_auto_close(self):
+        worksheet = self._create_worksheet()
+        Worksheet.objects.filter(pk=worksheet.pk).update(updated_at=timezone.now() - datetime.timedelta(hours=2))
+        taskqueue.schedule_periodic()
+        Task.objects.update(run_at=timezone.now())
+
+        task, = taskqueue.claim(10)
+        taskqueue.execute(task)
+
+        self.assertTrue(Worksheet.objects.get(pk=worksheet.pk).done)
+        self.assertEqual(Task.objects.filter(name='worksheet.auto_close', status=Task.PENDING).count(), 1)
+        self.assertEqual(Task.objects.filter(name='worksheet.auto_closed').count(), 1)
+
+class RunTasksCommandTests(TransactionTestCase):
+    def test_run_once(self):
+        """
+        Workers run the due tasks in their own threads and connections.
+        """
+        calls.clear()
+        for value in range(5):
+            taskqueue.enqueue('tests.record', value=value)
+
+        out = StringIO()
+        call_command('run_tasks', '--once', '--threads', '2', stdout=out)
+
+        self.assertIn("Ran 5 task(s)", out.getvalue())
+        self.assertIn("done: 5", out.getvalue())
+        self.assertEqual(sorted(calls), list(range(5)))
+
+    def test_worker_requeues_stale_tasks(self):
+        """
+        Running workers requeue the tasks left running by a dead worker.
+        """
+        calls.clear()
+        taskqueue.enqueue('tests.record', value=1)
+        taskqueue.claim(10)
+        Task.objects.update(started_at=timezone.now() - datetime.timedelta(hours=2))
+
+        worker = taskqueue.Worker(threads=2, poll_interval=0.1, stale_after=60 * 60)
+        thread = threading.Thread(target=worker.run)
+        thread.start()
+        try:
+            deadline = time.monotonic() + 5
+            while not calls and time.monotonic() < deadline:
+                time.sleep(0.01)
+        finally:
+            worker.stop()
+            thread.join()
+
+        self.assertEqual(calls, [1])
+        self.assertEqual(Task.objects.get().status, Task.DONE)
+
+    def test_worker_wakes_up(self):
+        """
+        Running workers are woken up by tasks enqueued in their process.
+        """
+        calls.clear()
+        worker = taskqueue.Worker(threads=2, poll_interval=30)
+        thread = threading.Thread(target=worker.run)
+        thread.start()
+        try:
+            taskqueue.enqueue('tests.record', value=1)
+            deadline = time.monotonic() + 5
+            while not calls and time.monotonic() < deadline:
+                time.sleep(0.01)
+        finally:
+            worker.stop()
+            thread.join()
+
+        self.assertEqual(calls, [1])
+        self.assertEqual(Task.objects.get().status, Task.DONE)
@@ -0,0 +1,106 @@
+import datetime
+import re
+import unittest
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import transaction
+from django.template import engines
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from worksheet.models import Workout
+
+try:
+    import jinja2
+    from django.template.backends.jinja2 import Template as JinjaTemplate
+except ImportError:
+    jinja2 = None
+
+from .mixins import WorksheetMixin
+
+CSRF_RE = re.compile(rb'name="csrfmiddlewaretoken" value="[^"]+"')
+
+@unittest.skipIf(jinja2 is None, "Jinja2 is not installed")
+class JinjaTemplatesTest(WorksheetMixin, TestCase):
+    """
+    The Jinja2 templates must render the same pages as the Django ones.
+    """
+    def _get_both(self, request):
+        contents = []
+        for engine in ['django', 'jinja2']:
+            # Both requests act on the same data
+            with override_settings(WORKSHEET_TEMPLATE_ENGINE=engine), transaction.atomic():
+                response = request()
+                transaction.set_rollback(True)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(isinstance(response.templates[0], JinjaTemplate), engine == 'jinja2')
+            # CSRF tokens are masked differently on every request
+            contents.append(CSRF_RE.sub(b'', response.content))
+
+        return contents
+
+    def _assert_same_page(self, worksheet):
+        url = reverse('worksheet:worksheet', args=[worksheet.date.year, worksheet.date.month, worksheet.date.day])
+        django, jinja = self._get_both(lambda: self.client.get(url))
+
+        self.assertEqual(jinja, django)
+
+        return django
+
+    def test_in_progress_worksheet(self):
+        worksheet = self._create_worksheet()
+        worksheet.result_set.filter(exercise__weight=True).update(reps=8, weight=20)
+
+        content = self._assert_same_page(worksheet)
+        self.assertIn(b'updateClock', content)
+
+    def test_worksheet_with_previous_results(self):
+        previous = self._create_worksheet(started_at=timezone.now() - datetime.timedelta(days=7), done=True)
+        previous.result_set.update(reps=5, weight=10)
+        worksheet = self._create_worksheet()
+
+        content = self._assert_same_page(worksheet)
+        self.assertIn(b'Previous reps', content)
+
+    def test_done_worksheet(self):
+        worksheet = self._create_worksheet(done=True)
+        worksheet.ended_at = worksheet.started_at + datetime.timedelta(minutes=45)
+        worksheet.save()
+
+        content = self._assert_same_page(worksheet)
+        self.assertIn(b'Completed in 0:45:00', content)
+
+    def test_repeat_worksheet(self):
+        Workout.objects.filter(pk=self.workout.pk).update(repeat=True, name="Rock & <Roll>")
+        worksheet = self._create_worksheet()
+        worksheet.result_set(manager="results").create_all()
+
+        content = self._assert_same_page(worksheet)
+        self.assertIn(b'class="exercise repeat"', content)
+        self.assertIn(b'Rock &amp; &lt;Roll&gt;', content)
+
+    def test_missing_worksheet(self):
+        url = reverse('worksheet:worksheet', args=[2001, 1, 1])
+        django, jinja = self._get_both(lambda: self.client.get(url))
+
+        self.assertEqual(jinja, django)
+
+    def test_environment(self):
+        env = engines['jinja2'].env
+
+        self.assertIsInstance(env.bytecode_cache, jinja2.FileSystemBytecodeCache)
+        self.assertEqual(
+            env.from_string("{{ value }} {{ when|date('Y') }}").render(value="'<a>'", when=datetime.date(2025, 1, 1)),
+            '&#x27;&lt;a&gt;&#x27; 2025',
+        )
+
+    def test_benchmark(self):
+        for args in [[], ['--repeat-workout']]:
+            out = StringIO()
+            call_command('bench_templates', '--rows', '3', '9', '--iterations', '1', *args, stdout=out)
+
+            lines = out.getvalue().splitlines()
+            self.assertEqual(len(lines), 3)
+            self.assertTrue(all(line.endswith('yes') for line in lines[1:]))
@@ -1,12 +1,17 @@
 import datetime
 import html
+import re
+import threading
+import time
 
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, TransactionTestCase
 from django.urls import reverse
 from django.utils import timezone
 
 from worksheet.models import (
-    Worksheet, Result, Schedule,
+    Exercise, ExerciseNote, Program, Worksheet, Result, Schedule, Workout,
 )
 from worksheet.tests.mixins import ProgramSetupMixin, WorksheetMixin
 
@@ -118,6 +123,83 @@ class CreateViewTest(ProgramSetupMixin, TestCase):
         )
         self.assertEqual(worksheet.result_set.count(), 4)
 
+    def test_creation_of_planned_worksheet(self):
+        """
+        A worksheet planned ahead of time is started rather than created.
+        """
+        date = timezone.localdate()
+        Schedule.objects.create(day=date.isoweekday(), workout=self.workout)
+        planned, = Worksheet.objects.plan(date, date)
+
+        response = self.client.post(reverse("worksheet:create"))
+
+        self.assertRedirects(response, planned.get_absolute_url())
+        worksheet = Worksheet.objects.get()
+        self.assertEqual(worksheet.pk, planned.pk)
+        self.assertFalse(worksheet.planned)
+        self.assertEqual(worksheet.result_set.count(), 4)
+
+    def test_replayed_creation(self):
+        """
+        Requests replayed with the same idempotency key get the same response,
+        without touching the database.
+        """
+        Schedule.objects.create(day=timezone.localdate().isoweekday(), workout=self.workout)
+
+        response = self.client.post(reverse("worksheet:create"), {'idempotency_key': 'abc'})
+        self.assertEqual(Worksheet.objects.count(), 1)
+
+        with self.assertNumQueries(0):
+            replayed = self.client.post(reverse("worksheet:create"), headers={'Idempotency-Key': 'abc'})
+
+        self.assertEqual(replayed.status_code, 302)
+        self.assertEqual(replayed.url, response.url)
+
+class ConcurrentCreationTest(TransactionTestCase):
+    CREATORS = 8
+    # Generous, only meant to catch requests stuck on database locks
+    MAX_LATENCY = 5
+
+    def setUp(self):
+        cache.clear()
+        self.workout = Workout.objects.create(name="Test workout")
+        for name in ["Exercise 1", "Exercise 2", "Exercise 3"]:
+            Program.objects.create(workout=self.workout, exercise=Exercise.objects.create(name=name))
+        Schedule.objects.create(day=timezone.localdate().isoweekday(), workout=self.workout)
+
+    def test_parallel_creators(self):
+        """
+        Parallel creations of today's worksheet (several devices, double taps)
+        all succeed and create a single worksheet.
+        """
+        barrier = threading.Barrier(self.CREATORS)
+        responses, errors, latencies = [], [], []
+
+        def create(n):
+            try:
+                barrier.wait()
+                start = time.perf_counter()
+                responses.append(Client().post(reverse("worksheet:create"), {'idempotency_key': f'key-{n}'}))
+                latencies.append(time.perf_counter() - start)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=create, args=[n]) for n in range(self.CREATORS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual([r.status_code for r in responses], [302] * self.CREATORS)
+        self.assertEqual(len({r.url for r in responses}), 1)
+        self.assertLess(max(latencies), self.MAX_LATENCY)
+
+        worksheet = Worksheet.objects.get()
+        self.assertEqual(worksheet.result_set.count(), 3)
+
 class WorksheetViewTest(WorksheetMixin, TestCase):
     def test_non_existing_worksheet(self):
         """
@@ -155,6 +237,49 @@ class WorksheetViewTest(WorksheetMixin, TestCase):
         self.assertContains(response, "Test workout")
         self.assertContains(response, "Completed in 0:37:42")
 
+    def test_archived_worksheet(self):
+        """
+        Archived worksheets are displayed like any other one.
+        """
+        worksheet = self._create_worksheet(
+            started_at=timezone.localtime() - datetime.timedelta(days=365),
+            done=True,
+        )
+        worksheet.ended_at = worksheet.started_at + datetime.timedelta(hours=1)
+        worksheet.save()
+        worksheet.result_set.update(reps=17, weight=23)
+        url = worksheet.get_absolute_url()
+        expected = self.client.get(url).content
+
+        Worksheet.objects.archive(timezone.localdate())
+        self.assertEqual(worksheet.result_set.count(), 0)
+
+        response = self.client.get(url)
+        self.assertContains(response, "4. Exercise 4")
+        # Counted in the reps cells only, the dates and times of the page may
+        # contain "17" too
+        self.assertEqual(len(re.findall(r'class="result reps [^"]*">\s*17\s*<', response.content.decode())), 4)
+        self.assertEqual(response.content, expected)
+
+    def test_previous_results_from_archived_worksheet(self):
+        """
+        The previous results of a workout can come from an archived worksheet.
+        """
+        previous = self._create_worksheet(
+            started_at=timezone.localtime() - datetime.timedelta(days=365),
+            done=True,
+        )
+        previous.result_set.update(reps=17)
+        Worksheet.objects.archive(timezone.localdate())
+
+        worksheet = self._create_worksheet()
+        response = self.client.get(worksheet.get_absolute_url())
+
+        self.assertContains(response, "Previous reps")
+        # Not only "17", which the start time of the clock may contain
+        self.assertContains(response, "previous odd\">\n    17\n", 2)
+        self.assertContains(response, "previous even\">\n    17\n", 2)
+
 class CloseViewTest(WorksheetMixin, TestCase):
     def test_can_close_in_progress_workout(self):
         """
@@ -293,6 +418,19 @@ class ResultViewTest(WorksheetMixin, TestCase):
             else:
                 self.assertIn(result.weight, [200, 300])
 
+    def test_unchanged_update(self):
+        """
+        Posting the values a worksheet already has doesn't write anything.
+        """
+        worksheet = self._create_worksheet()
+        self._update_worksheet(worksheet, reps=[10, 0, 0, 0], weights=[10, '', '', ''])
+        updated_at = Worksheet.objects.get(pk=worksheet.pk).updated_at
+
+        response = self._update_worksheet(worksheet, reps=[10, 0, 0, 0], weights=[10, '', '', ''])
+
+        self.assertContains(response, '<html')
+        self.assertEqual(Worksheet.objects.get(pk=worksheet.pk).updated_at, updated_at)
+
     def test_worksheet_show_results_from_previous_same_workout(self):
         pass
 
@@ -408,3 +546,180 @@ class ResultActionTest(WorksheetMixin, TestCase):
         self.assertEqual(response.status_code, 404)
         self.assertIsNone(result.reps)
         self.assertIsNone(result.weight)
+
+class NotesViewTest(WorksheetMixin, TestCase):
+    def test_notes_are_loaded_on_demand(self):
+        worksheet = self._create_worksheet()
+        exercise = Exercise.objects.get(name="Exercise 2")
+        ExerciseNote.objects.create(worksheet=worksheet, exercise=exercise, text="Slow on the way down")
+
+        response = self.client.get(worksheet.get_absolute_url())
+        self.assertContains(response, reverse('worksheet:notes', args=[worksheet.id]))
+        self.assertNotContains(response, "Slow on the way down")
+
+        response = self.client.get(reverse('worksheet:notes', args=[worksheet.id]))
+        self.assertContains(response, "Exercise 4")
+        self.assertContains(response, ">Slow on the way down</textarea>")
+        self.assertContains(response, reverse('worksheet:previous_notes', args=[worksheet.id]))
+
+    def test_save_note(self):
+        worksheet = self._create_worksheet()
+        exercise = Exercise.objects.get(name="Exercise 1")
+        url = reverse('worksheet:note', args=[worksheet.id, exercise.id])
+
+        updated_at = Worksheet.objects.get(pk=worksheet.pk).updated_at
+
+        response = self.client.post(url, {'text': " Elbows in "})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(worksheet.notes.get().text, "Elbows in")
+
+        self.client.post(url, {'text': "Elbows in, wrists straight"})
+        self.assertEqual(worksheet.notes.get().text, "Elbows in, wrists straight")
+
+        # Empty notes are deleted
+        self.client.post(url, {'text': ""})
+        self.assertFalse(worksheet.notes.exists())
+
+        # Notes aren't served by the API, its ETags don't change
+        self.assertEqual(Worksheet.objects.get(pk=worksheet.pk).updated_at, updated_at)
+
+    def test_save_invalid_note(self):
+        worksheet = self._create_worksheet()
+        exercise = Exercise.objects.get(name="Exercise 1")
+
+        response = self.client.post(reverse('worksheet:note', args=[worksheet.id, 0]), {'text': "Note"})
+        self.assertEqual(response.status_code, 404)
+
+        # Exercises of other workouts
+        other = Exercise.objects.create(name="Other exercise")
+        response = self.client.post(reverse('worksheet:note', args=[worksheet.id, other.id]), {'text': "Note"})
+        self.assertEqual(response.status_code, 404)
+
+        # Notes of exercises removed from the workout can still be edited
+        ExerciseNote.objects.create(worksheet=worksheet, exercise=other, text="Note")
+        response = self.client.post(reverse('worksheet:note', args=[worksheet.id, other.id]), {'text': ""})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(ExerciseNote.objects.exists())
+
+        worksheet.close().save()
+        response = self.client.post(reverse('worksheet:note', args=[worksheet.id, exercise.id]), {'text': "Note"})
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(ExerciseNote.objects.exists())
+
+    def test_previous_notes(self):
+        previous = self._create_worksheet(
+            started_at=timezone.localtime() - datetime.timedelta(days=7), done=True,
+        )
+        exercise = Exercise.objects.get(name="Exercise 3")
+        ExerciseNote.objects.create(worksheet=previous, exercise=exercise, text="Add 2.5kg next time")
+        worksheet = self._create_worksheet()
+        url = reverse('worksheet:previous_notes', args=[worksheet.id])
+
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+
+        self.assertContains(response, "Exercise 3")
+        self.assertContains(response, "Add 2.5kg next time")
+
+        response = self.client.get(reverse('worksheet:previous_notes', args=[previous.id]))
+        self.assertContains(response, "No notes from the previous session.")
+
+class CalendarFeedTest(WorksheetMixin, TestCase):
+    def _get_feed(self, **headers):
+        response = self.client.get(reverse('worksheet:calendar_feed'), headers=headers)
+        if response.streaming:
+            content = b''.join(response.streaming_content)
+        else:
+            content = response.content
+
+        return response, content.decode()
+
+    def test_feed(self):
+        """
+        The feed contains completed worksheets and the coming scheduled days.
+        """
+        started_at = timezone.localtime() - datetime.timedelta(days=3, minutes=45)
+        worksheet = self._create_worksheet(started_at=started_at, done=True)
+        worksheet.ended_at = started_at + datetime.timedelta(minutes=45)
+        worksheet.save()
+        Schedule.objects.create(day=timezone.localdate().isoweekday(), workout=self.workout)
+
+        response, content = self._get_feed()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Type'], 'text/calendar; charset=utf-8')
+
+        self.assertTrue(content.startswith('BEGIN:VCALENDAR\r\n'))
+        self.assertTrue(content.endswith('END:VCALENDAR\r\n'))
+        self.assertIn(f'UID:worksheet-{worksheet.id}@', content)
+        self.assertIn('DESCRIPTION:Completed in 0:45:00\r\n', content)
+        self.assertIn(f'DTSTART;VALUE=DATE:{timezone.localdate():%Y%m%d}\r\n', content)
+        # One event per week for the scheduled day
+        self.assertEqual(content.count('UID:schedule-'), 4)
+
+    def test_planned_worksheets(self):
+        """
+        Worksheets planned ahead of time keep their scheduled events until they
+        are started, and planning or starting them changes the feed.
+        """
+        today = timezone.localdate()
+        Schedule.objects.create(day=today.isoweekday(), workout=self.workout)
+        response, content = self._get_feed()
+        etag = response.headers['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(len(Worksheet.objects.plan(today, today + datetime.timedelta(weeks=4))), 5)
+
+        response, content = self._get_feed(if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(content.count('UID:schedule-'), 4)
+        self.assertIn(f'UID:schedule-{today:%Y%m%d}@', content)
+        etag = response.headers['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Worksheet.objects.start(self.workout, today)
+
+        response, content = self._get_feed(if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(content.count('UID:schedule-'), 3)
+        self.assertNotIn(f'UID:schedule-{today:%Y%m%d}@', content)
+
+    def test_conditional_requests(self):
+        """
+        The feed's ETag only changes when the calendar data does.
+        """
+        response, content = self._get_feed()
+        etag = response.headers['ETag']
+
+        response, _ = self._get_feed(if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # Served from the cache
+        response, cached_content = self._get_feed()
+        self.assertFalse(response.streaming)
+        self.assertEqual(response.headers['ETag'], etag)
+        self.assertEqual(cached_content, content)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Schedule.objects.create(day=timezone.localdate().isoweekday(), workout=self.workout)
+        response, content = self._get_feed(if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        self.assertIn('UID:schedule-', content)
+
+    def test_auto_closed_worksheets(self):
+        """
+        Worksheets closed in bulk, without any post_save signal, change the
+        feed too.
+        """
+        started_at = timezone.localtime() - datetime.timedelta(days=2)
+        worksheet = self._create_worksheet(started_at=started_at)
+        Worksheet.objects.filter(pk=worksheet.pk).update(updated_at=started_at)
+        response, _ = self._get_feed()
+        etag = response.headers['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Worksheet.objects.close_all(Worksheet.objects.get_stale())
+
+        response, content = self._get_feed(if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(f'UID:worksheet-{worksheet.id}@', content)
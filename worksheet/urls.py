@@ -1,4 +1,4 @@
-from django.urls import path
+from django.urls import include, path
 
 from . import views
 
@@ -6,8 +6,16 @@ app_name = 'worksheet'
 
 urlpatterns = [
     path('', views.Index.as_view(), name='index'),
+    path('api/v1/', include('worksheet.api')),
+    path('calendar.ics', views.CalendarFeed.as_view(), name='calendar_feed'),
+    path('heatmap', views.Heatmap.as_view(), name='heatmap'),
+    path('heatmap/<int:year>', views.Heatmap.as_view(), name='heatmap_year'),
+    path('exercises/search', views.ExerciseSearch.as_view(), name='exercise_search'),
     path('worksheet/', views.CreateView.as_view(), name='create'),
     path('worksheet/<int:year>/<int:month>/<int:day>/', views.WorksheetView.as_view(), name='worksheet'),
     path('worksheet/<int:worksheet_id>/close', views.CloseAction.as_view(), name='close'),
+    path('worksheet/<int:worksheet_id>/notes', views.NotesView.as_view(), name='notes'),
+    path('worksheet/<int:worksheet_id>/notes/previous', views.PreviousNotesView.as_view(), name='previous_notes'),
+    path('worksheet/<int:worksheet_id>/notes/<int:exercise_id>', views.NotesView.as_view(), name='note'),
     path('worksheet/<int:worksheet_id>/result/<int:result_id>/<str:field>', views.ResultAction.as_view(), name='result'),
 ]
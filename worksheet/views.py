@@ -1,14 +1,27 @@
+import calendar
 import datetime
+import hashlib
+import http
+import uuid
 
+from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.db import IntegrityError, transaction
-from django.http import HttpResponse, HttpResponseNotFound, HttpResponseRedirect
+from django.db.models import Subquery
+from django.http import Http404, HttpResponse, HttpResponseNotFound, HttpResponseRedirect, StreamingHttpResponse
 from django.shortcuts import render
 from django.urls import reverse
 from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from django.views.generic import TemplateView, View
 
-from .models import Result, Schedule, Workout, Worksheet
+from . import events, heatmap, ical
+from .models import Equipment, Exercise, ExerciseNote, MuscleGroup, Program, Result, Tag, Worksheet
+from .schedule import get_resolver
+from .search import search_exercises
+from .signals import get_calendar_version
 
 # Create your views here.
 class Index(TemplateView):
@@ -20,8 +33,6 @@ class Index(TemplateView):
     template_name = 'worksheet/index.html'
 
     def render_to_response(self, context, **response_kwargs):
-        import calendar
-
         cal = calendar.Calendar()
         today = timezone.localdate()
         weeks = list(cal.monthdatescalendar(today.year, today.month))
@@ -29,14 +40,13 @@ class Index(TemplateView):
         worksheets = {
             worksheet.date: worksheet
             for worksheet in Worksheet.objects.filter(
-                date__range=(weeks[0][0], weeks[-1][-1])
+                date__range=(weeks[0][0], weeks[-1][-1]),
+                # Planned worksheets are started from the schedule
+                planned=False,
             ).select_related('workout').all()
         }
 
-        schedules = {
-            schedule.day: schedule
-            for schedule in Schedule.objects.select_related('workout').all()
-        }
+        planned = get_resolver().expand(weeks[0][0], weeks[-1][-1])
 
         workout_calendar = []
         for week in weeks:
@@ -44,8 +54,11 @@ class Index(TemplateView):
             for date in week:
                 if date in worksheets:
                     calendar_week[date] = {'worksheet': worksheets[date]}
-                elif date.isoweekday() in schedules:
-                    calendar_week[date] = {'workout': schedules[date.isoweekday()].workout}
+                elif date in planned:
+                    calendar_week[date] = {
+                        'workout': planned[date].workout,
+                        'deload': planned[date].deload,
+                    }
                 else:
                     calendar_week[date] = None
 
@@ -55,46 +68,120 @@ class Index(TemplateView):
         context['today'] = today
         context['days'] = list(calendar.day_name)
         context['active_worksheets'] = Worksheet.objects.get_active().all()
+        context['idempotency_key'] = uuid.uuid4().hex
 
         return super().render_to_response(context, **response_kwargs)
 
+class Heatmap(TemplateView):
+    """
+    Year-at-a-glance view of the training: the status of every day and the
+    volume of the worksheets, over one year or the `years` (up to
+    MAX_HEATMAP_YEARS) ending with it.
+    """
+    template_name = 'worksheet/heatmap.html'
+    # Building a year steps past its first and last days (e.g. expanding the
+    # schedule), which must still be valid dates
+    min_year = datetime.MINYEAR + 1
+    max_year = datetime.MAXYEAR - 1
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        year = kwargs.get('year')
+        if year is None:
+            year = timezone.localdate().year
+
+        try:
+            count = int(self.request.GET.get('years', 1))
+        except ValueError:
+            count = 1
+        count = max(1, min(count, getattr(settings, 'MAX_HEATMAP_YEARS', 10)))
+
+        if year > self.max_year or year - count + 1 < self.min_year:
+            raise Http404("No heatmap for these years")
+
+        years = []
+        for y in range(year, year - count, -1):
+            days, counts = heatmap.get_year(y)
+            years.append({
+                'year': y,
+                'days': days,
+                'counts': counts,
+                # Weeks are columns starting on Mondays
+                'first_row': days[0].date.weekday() + 1,
+            })
+
+        context.update({
+            'years': years,
+            'year': year,
+            'first_year': year - count + 1,
+            'count': count,
+            'has_previous': year - count >= self.min_year,
+            'has_next': year < self.max_year,
+            'levels': range(1, heatmap.LEVELS + 1),
+        })
+
+        return context
+
 class CreateView(View):
     """
     Simple view to create a worksheet for the current day, if a workout is
     scheduled.
+
+    Requests may carry an idempotency key (form field or Idempotency-Key
+    header): replayed requests, from double taps or retries, then get the
+    response of the first one without touching the database.
     """
     def post(self, request, *args, **kwargs):
+        cache_key = self._get_idempotency_cache_key(request)
+        if cache_key is not None and (url := cache.get(cache_key)) is not None:
+            return HttpResponseRedirect(url)
+
         # If there's an older, active worksheet, bail and redirect to the index
         # where it will be listed
         if Worksheet.objects.get_active().exists():
             return HttpResponseRedirect(reverse('worksheet:index'))
 
         # Likewise if no workout is scheduled for today
-        weekday = timezone.localdate().isoweekday()
-        try:
-            workout = Workout.objects.get(schedule__day=weekday)
-        except Workout.DoesNotExist:
+        planned = get_resolver().resolve(timezone.localdate())
+        if planned is None:
             return HttpResponseRedirect(reverse('worksheet:index'))
 
-        worksheet, _ = Worksheet.objects.get_or_create(
-            workout=workout,
-            date=timezone.localdate(),
-        )
+        # Reuses the worksheet planned beforehand, if any
+        worksheet, _ = Worksheet.objects.start(planned.workout, timezone.localdate())
 
-        return HttpResponseRedirect(reverse(
+        url = reverse(
             'worksheet:worksheet',
             args=[ worksheet.date.year, worksheet.date.month, worksheet.date.day, ]
-        ))
+        )
+        if cache_key is not None:
+            cache.set(cache_key, url, getattr(settings, 'IDEMPOTENCY_KEY_TIMEOUT', 24 * 60 * 60))
+
+        return HttpResponseRedirect(url)
 
     def get(self, request):
         return HttpResponseRedirect(reverse('worksheet:index'))
 
+    def _get_idempotency_cache_key(self, request):
+        key = request.POST.get('idempotency_key') or request.headers.get('Idempotency-Key')
+        if not key:
+            return None
+
+        # Keys come from clients, hash them to get valid cache keys
+        return f"worksheet:create:{hashlib.sha256(key.encode()).hexdigest()}"
+
 class WorksheetView(TemplateView):
     """
     Show or update a worksheet for a specific date.
+
+    These pages are the most rendered ones, and can be rendered by the Jinja2
+    copies of their templates (see WORKSHEET_TEMPLATE_ENGINE).
     """
     template_name = 'worksheet/worksheet.html'
 
+    @property
+    def template_engine(self):
+        return getattr(settings, 'WORKSHEET_TEMPLATE_ENGINE', None)
+
     def render_to_response(self, context, **response_kwargs):
         worksheet, results, date = self._get_worksheet_and_results(context)
 
@@ -138,8 +225,13 @@ class WorksheetView(TemplateView):
         results_dict = {str(r.id): r for r in results}
 
         result_errors = 0
+        # Only the modified results are written
+        updated_results = {}
+        # (result, field) changed
+        changes = []
         for idx, result_id in enumerate(context['result_ids']):
             result = results_dict[result_id]
+            previous_values = (result.reps, result.weight)
 
             result.reps = context['reps'][idx]
             result.weight = context['weight'][idx] or None
@@ -153,12 +245,19 @@ class WorksheetView(TemplateView):
                     result.errors = {}
 
                 result.errors.update(ve.message_dict)
-
-        if result_errors == 0:
-            Result.objects.bulk_update(results, ["reps", "weight"])
-
-        if worksheet.workout.repeat:
-            self.template_name = 'worksheet/worksheet_repeat.html'
+            else:
+                if (result.reps, result.weight) != previous_values:
+                    updated_results[result.id] = result
+                    for field, value, previous in zip(['reps', 'weight'], (result.reps, result.weight), previous_values):
+                        if value != previous:
+                            changes.append((result, field))
+
+        if result_errors == 0 and updated_results:
+            with transaction.atomic():
+                Result.objects.bulk_update(updated_results.values(), ["reps", "weight"])
+                Worksheet.objects.touch(worksheet.pk)
+                for result, field in changes:
+                    events.record(worksheet.pk, result.pk, field, getattr(result, field))
 
         context.update({
             'worksheet': worksheet,
@@ -166,6 +265,9 @@ class WorksheetView(TemplateView):
             'result_errors': result_errors,
         })
 
+        if worksheet.workout.repeat:
+            self.template_name = 'worksheet/worksheet_repeat.html'
+
         return super().render_to_response(context, **response_kwargs)
 
     def _get_worksheet_and_results(self, context):
@@ -174,7 +276,7 @@ class WorksheetView(TemplateView):
         date = datetime.date(context['year'], context['month'], context['day'])
 
         try:
-            worksheet = Worksheet.objects.select_related('workout').get(date=date)
+            worksheet = Worksheet.objects.select_related('workout', 'archive').get(date=date)
         except Worksheet.DoesNotExist:
             # TODO logging
             pass
@@ -186,17 +288,13 @@ class WorksheetView(TemplateView):
         return worksheet, results, date
 
     def _get_results(self, worksheet):
-        qs = worksheet.result_set.select_related('exercise')
-
-        if worksheet.workout.repeat:
-            qs = qs.order_by(
-                "exercise__program",
-                "_order"
-            ).filter(
-                exercise__workout=worksheet.workout
-            )
+        archive = worksheet.get_archive()
+        if archive is not None:
+            return archive.get_results()
 
-        return qs.all()
+        # Display order is execution order, except for repeat workouts which
+        # are displayed by exercise
+        return worksheet.result_set.select_related('exercise').order_by('display_order')
 
     def _get_previous_results(self, worksheet, results):
         """
@@ -209,7 +307,7 @@ class WorksheetView(TemplateView):
                 workout=worksheet.workout,
                 date__lt=worksheet.date,
                 done=True,
-            ).order_by("-date").first()
+            ).select_related('workout', 'archive').order_by("-date").first()
 
             if previous_worksheet is not None:
                 for res, prev in zip(results,
@@ -231,8 +329,6 @@ class ResultAction(View):
         # be configured for this to work. Need to read
         # https://docs.djangoproject.com/en/5.2/howto/csrf/ and
         # https://docs.djangoproject.com/en/5.2/ref/csrf/
-        import http
-
         filters = {
             'pk': result_id,
             'worksheet': worksheet_id,
@@ -258,6 +354,9 @@ class ResultAction(View):
             # Atomicity is required for the tests more than anything else, apparently
             with transaction.atomic():
                 updated = Result.objects.filter(**filters).update(**{field: value})
+                if updated:
+                    Worksheet.objects.touch(worksheet_id)
+                    events.record(worksheet_id, result_id, field, value)
         except ValueError as ve:
             # Keep the same format as the one used by ValidationError even
             # though there's no real reason to
@@ -282,3 +381,130 @@ class ResultAction(View):
         http_response.headers["HX-Trigger-After-Settle"] = event
 
         return http_response
+
+class NotesView(View):
+    """
+    The notes of a worksheet, one per exercise of its workout, loaded when its
+    notes panel is opened rather than with the worksheet page. Notes are saved
+    one exercise at a time.
+    """
+    def get(self, request, worksheet_id):
+        worksheet = Worksheet.objects.select_related('workout').filter(pk=worksheet_id).first()
+        if worksheet is None:
+            raise Http404("No such worksheet")
+
+        notes = dict(worksheet.notes.values_list('exercise', 'text'))
+        exercises = {
+            exercise.pk: exercise
+            for exercise in worksheet.workout.exercises.order_by('program')
+        }
+        # Exercises removed from the workout since the notes were written
+        if missing := notes.keys() - exercises.keys():
+            exercises.update(Exercise.objects.in_bulk(missing))
+
+        return render(request, 'worksheet/partials/notes.html', {
+            'worksheet': worksheet,
+            'notes': [(exercise, notes.get(pk, '')) for pk, exercise in exercises.items()],
+        })
+
+    def post(self, request, worksheet_id, exercise_id):
+        worksheet = Worksheet.objects.filter(pk=worksheet_id, done=False).values('workout').first()
+        if worksheet is None:
+            raise Http404("No such worksheet in progress")
+        # Exercises of the workout, or removed from it since they were noted
+        if not (Program.objects.filter(workout=worksheet['workout'], exercise=exercise_id).exists()
+                or ExerciseNote.objects.filter(worksheet=worksheet_id, exercise=exercise_id).exists()):
+            raise Http404("No such exercise in the workout")
+
+        # Notes aren't part of the API, the worksheet isn't marked as updated
+        text = request.POST.get('text', '').strip()
+        if text:
+            ExerciseNote.objects.update_or_create(
+                worksheet_id=worksheet_id, exercise_id=exercise_id, defaults={'text': text},
+            )
+        else:
+            ExerciseNote.objects.filter(worksheet=worksheet_id, exercise=exercise_id).delete()
+
+        return HttpResponse('✅')
+
+class PreviousNotesView(View):
+    """
+    The notes of the previous session of the same workout, loaded on demand
+    in a single query.
+    """
+    def get(self, request, worksheet_id):
+        worksheet = Worksheet.objects.filter(pk=worksheet_id).values('workout', 'date').first()
+        if worksheet is None:
+            raise Http404("No such worksheet")
+
+        previous = Worksheet.objects.filter(
+            workout=worksheet['workout'], date__lt=worksheet['date'], done=True,
+        ).order_by('-date').values('pk')[:1]
+        notes = ExerciseNote.objects.filter(
+            worksheet=Subquery(previous),
+        ).select_related('worksheet', 'exercise').order_by('pk')
+
+        return render(request, 'worksheet/partials/previous_notes.html', {'notes': notes})
+
+def _calendar_feed_etag(request, *args, **kwargs):
+    # Scheduled events depend on the current day as well
+    return f"{get_calendar_version()}-{timezone.localdate():%Y%m%d}"
+
+@method_decorator(condition(etag_func=_calendar_feed_etag), name='get')
+class CalendarFeed(View):
+    """
+    iCalendar feed of the scheduled and completed workouts, to subscribe to
+    from a calendar app.
+
+    Calendar apps poll it often, so the feed is cached until a worksheet, a
+    schedule or a workout changes, and conditional requests are supported.
+    """
+    content_type = 'text/calendar; charset=utf-8'
+
+    def get(self, request):
+        cache_key = f"worksheet:calendar:feed:{_calendar_feed_etag(request)}"
+
+        feed = cache.get(cache_key)
+        if feed is not None:
+            return HttpResponse(feed, content_type=self.content_type)
+
+        def stream():
+            chunks = []
+            for chunk in ical.generate(
+                request.build_absolute_uri,
+                days=getattr(settings, 'CALENDAR_FEED_DAYS', 28),
+            ):
+                chunks.append(chunk)
+                yield chunk
+
+            # Only cache complete feeds
+            cache.set(cache_key, ''.join(chunks), timeout=24 * 60 * 60)
+
+        return StreamingHttpResponse(stream(), content_type=self.content_type)
+
+class ExerciseSearch(View):
+    """
+    Exercises matching a search, as a list of options for the autocomplete
+    widgets. Muscle group, equipment and tag ids narrow the search.
+    """
+    facets = {
+        'muscle_group': MuscleGroup,
+        'equipment': Equipment,
+        'tag': Tag,
+    }
+
+    def get(self, request):
+        filters = {}
+        for param, model in self.facets.items():
+            if pk := request.GET.get(param, ''):
+                filters[param] = model.objects.filter(pk=pk).first() if pk.isdigit() else None
+
+        # Unknown facets match nothing rather than being ignored
+        if None in filters.values():
+            exercises = []
+        else:
+            exercises = search_exercises(request.GET.get('q', ''), **filters)
+
+        return render(request, 'worksheet/partials/exercise_options.html', {
+            'exercises': exercises,
+        })
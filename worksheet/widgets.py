@@ -0,0 +1,45 @@
+from django import forms
+from django.urls import reverse
+
+from .models import Exercise
+
+class ExerciseAutocompleteWidget(forms.Widget):
+    """
+    Pick an exercise by searching the library with HTMX, instead of a select
+    listing every exercise.
+    """
+    template_name = 'worksheet/widgets/exercise_autocomplete.html'
+
+    class Media:
+        js = ['worksheet/js/htmx.min.js', 'worksheet/js/exercise_autocomplete.js']
+        css = {'all': ['worksheet/css/exercise_autocomplete.css']}
+
+    def __init__(self, attrs=None):
+        super().__init__(attrs)
+        # Names of the exercises by id, shared by the copies of the widget
+        # (one per form of a formset), see prefetch()
+        self.labels = {}
+
+    def prefetch(self, exercise_ids):
+        """
+        Fetch the names of the exercises of several widgets in a single query.
+        """
+        self.labels.update(
+            (str(pk), name) for pk, name in Exercise.objects.filter(pk__in=exercise_ids).values_list('pk', 'name')
+        )
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+
+        label = ''
+        if value not in (None, ''):
+            if str(value) not in self.labels:
+                self.prefetch([value])
+            label = self.labels.get(str(value), '')
+
+        context['widget'].update({
+            'label': label,
+            'search_url': reverse('worksheet:exercise_search'),
+        })
+
+        return context